@@ -0,0 +1,88 @@
+"""Joint against factored (per-course) action values of the tabular agent.
+
+For every course count this reports the memory of both Q-tables, the time of one greedy
+action selection plus TD update (the inner loop of ``QLearningAgent.train``) and the mean
+return of the greedy policy after training both tables on the same number of episodes.
+
+Usage:
+    python -m benchmarks.bench_action_values --courses 1 2 3 4 --episodes 200
+"""
+import argparse
+import time
+import numpy as np
+from campus_gym.envs.campus_gym_env import CampusGymEnv
+from q_learning.q_table import FactoredQTable, greedy_actions, max_values
+
+
+def make_table(action_values, env):
+    if action_values == 'factored':
+        return FactoredQTable(env.state_codec.num_states, env.action_codec.nvec)
+    return np.zeros((env.state_codec.num_states, env.action_codec.num_actions))
+
+
+def train(env, q_table, episodes, learning_rate=0.1, discount_factor=0.9, exploration_rate=0.2, seed=100):
+    """Epsilon-greedy Q-learning with the update of ``QLearningAgent.train``.
+
+    Returns:
+        Seconds per step of action selection and update, without the environment step.
+    """
+    rng = np.random.default_rng(seed)
+    state, _ = env.reset(seed=seed)
+    update_time, steps = 0.0, 0
+    for _ in range(episodes):
+        done = False
+        while not done:
+            start = time.perf_counter()
+            if rng.random() < exploration_rate:
+                action = int(rng.integers(q_table.shape[1]))
+            else:
+                action = greedy_actions(q_table, state)
+            update_time += time.perf_counter() - start
+            next_state, reward, done, _, _ = env.step(action)
+            start = time.perf_counter()
+            old_value = q_table[state, action]
+            q_table[state, action] = (1 - learning_rate) * old_value + learning_rate * (
+                reward + discount_factor * max_values(q_table, next_state))
+            update_time += time.perf_counter() - start
+            steps += 1
+            state = next_state
+        state, _ = env.reset()
+    return update_time / steps
+
+
+def greedy_return(env, q_table, episodes, seed=200):
+    """Mean episode return of the greedy policy."""
+    returns = []
+    state, _ = env.reset(seed=seed)
+    for _ in range(episodes):
+        done, total = False, 0.0
+        while not done:
+            state, reward, done, _, _ = env.step(greedy_actions(q_table, state))
+            total += reward
+        returns.append(total)
+        state, _ = env.reset()
+    return float(np.mean(returns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark joint and factored tabular action values.')
+    parser.add_argument('--courses', type=int, nargs='+', default=[1, 2, 3, 4])
+    parser.add_argument('--students_per_course', type=int, default=100)
+    parser.add_argument('--episodes', type=int, default=200, help='Training episodes per table.')
+    parser.add_argument('--eval_episodes', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'courses':>7} {'values':>9} {'table MB':>10} {'us/update':>10} {'greedy return':>14}")
+    for num_courses in args.courses:
+        for action_values in ('joint', 'factored'):
+            env = CampusGymEnv(num_courses=num_courses, students_per_course=args.students_per_course, alpha=0.5,
+                               info_level='none', observation_mode='index')
+            q_table = make_table(action_values, env)
+            update_time = train(env, q_table, args.episodes)
+            mean_return = greedy_return(env, q_table, args.eval_episodes)
+            print(f"{num_courses:>7} {action_values:>9} {q_table.nbytes / 1e6:>10,.2f} {update_time * 1e6:>10.2f} "
+                  f"{mean_return:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
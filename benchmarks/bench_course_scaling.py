@@ -0,0 +1,89 @@
+"""How the environment and the tabular agent scale with the number of courses.
+
+For every course count this reports environment steps per second, the memory of the
+Q-table (``QLearningAgent`` allocates a second table of the same shape for the
+state-action visit counts) and the time per training episode of the Q-learning update
+loop. Training is skipped when the Q-table does not fit in ``--max_table_mb``. With
+``--q_table sparse`` training uses a ``SparseQTable`` and also reports the memory it
+allocated for the visited states.
+
+Usage:
+    python -m benchmarks.bench_course_scaling --courses 1 2 3 4 5 6 --steps 20000 --episodes 50
+    python -m benchmarks.bench_course_scaling --courses 4 5 6 --q_table sparse
+"""
+import argparse
+import time
+import numpy as np
+from campus_gym.envs.campus_gym_env import CampusGymEnv
+from q_learning.q_table import Q_TABLE_BACKENDS, make_q_table
+
+
+def steps_per_second(env, actions):
+    env.reset(seed=100)
+    start = time.perf_counter()
+    for action in actions:
+        _, _, done, _, _ = env.step(action)
+        if done:
+            env.reset()
+    return len(actions) / (time.perf_counter() - start)
+
+
+def seconds_per_episode(env, episodes, backend='dense', learning_rate=0.1, discount_factor=0.9,
+                        exploration_rate=0.2):
+    """Epsilon-greedy Q-learning with the update of ``QLearningAgent.train``.
+
+    Returns:
+        Seconds per episode and the bytes of the trained Q-table.
+    """
+    q_table = make_q_table(backend, env.state_codec.num_states, env.action_codec.num_actions)
+    rng = np.random.default_rng(100)
+    state, _ = env.reset(seed=100)
+    start = time.perf_counter()
+    for _ in range(episodes):
+        done = False
+        while not done:
+            if rng.random() < exploration_rate:
+                action = int(rng.integers(q_table.shape[1]))
+            else:
+                action = int(np.argmax(q_table[state]))
+            next_state, reward, done, _, _ = env.step(action)
+            q_table[state, action] = (1 - learning_rate) * q_table[state, action] + learning_rate * (
+                reward + discount_factor * np.max(q_table[next_state]))
+            state = next_state
+        state, _ = env.reset()
+    return (time.perf_counter() - start) / episodes, q_table.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scaling with the number of courses.')
+    parser.add_argument('--courses', type=int, nargs='+', default=[1, 2, 3, 4, 5, 6])
+    parser.add_argument('--students_per_course', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--episodes', type=int, default=50, help='Training episodes per course count.')
+    parser.add_argument('--max_table_mb', type=float, default=1024,
+                        help='Largest dense Q-table that is trained, sparse tables are always trained.')
+    parser.add_argument('--q_table', choices=Q_TABLE_BACKENDS, default='dense', help='Q-table backend of training.')
+    args = parser.parse_args()
+
+    print(f"{'courses':>7} {'states':>12} {'actions':>8} {'steps/s':>10} {'Q-table MB':>12} {'agent MB':>10} "
+          f"{'s/episode':>10} {'trained MB':>11}")
+    for num_courses in args.courses:
+        env = CampusGymEnv(num_courses=num_courses, students_per_course=args.students_per_course, alpha=0.5,
+                           info_level='none', observation_mode='index')
+        rng = np.random.default_rng(100)
+        actions = rng.integers(0, env.action_codec.num_actions, size=args.steps).tolist()
+        rate = steps_per_second(env, actions)
+
+        num_states, num_actions = env.state_codec.num_states, env.action_codec.num_actions
+        table_mb = num_states * num_actions * np.dtype(np.float64).itemsize / 1e6
+        if args.q_table == 'sparse' or table_mb <= args.max_table_mb:
+            episode_time, trained_bytes = seconds_per_episode(env, args.episodes, args.q_table)
+            trained = f"{episode_time:10.4f} {trained_bytes / 1e6:>11,.1f}"
+        else:
+            trained = f"{'skipped':>10} {'-':>11}"
+        print(f"{num_courses:>7} {num_states:>12,} {num_actions:>8,} {rate:>10,.0f} {table_mb:>12,.1f} "
+              f"{2 * table_mb:>10,.1f} {trained}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Steps per second of CampusGymEnv with the different info levels.
+
+The first row converts the observation like the original ``step`` did
+(``np.array(convert_actions_to_discrete(get_student_status()))``) as a reference.
+
+Usage:
+    python -m benchmarks.bench_env_step --steps 50000
+"""
+import argparse
+import time
+import numpy as np
+from campus_gym.envs.campus_gym_env import CampusGymEnv, convert_actions_to_discrete
+
+
+class ListObservationEnv(CampusGymEnv):
+    def observe(self):
+        return np.array(convert_actions_to_discrete(self.campus_state.get_student_status()))
+
+
+CONFIGURATIONS = [
+    ('list observation', ListObservationEnv, {}),
+    ('info_level=full', CampusGymEnv, {'info_level': 'full'}),
+    ('info_level=summary', CampusGymEnv, {'info_level': 'summary'}),
+    ('info_level=none', CampusGymEnv, {'info_level': 'none'}),
+]
+
+
+def steps_per_second(env, actions):
+    env.reset()
+    start = time.perf_counter()
+    for action in actions:
+        _, _, done, _, _ = env.step(action)
+        if done:
+            env.reset()
+    return len(actions) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CampusGymEnv.step.')
+    parser.add_argument('--steps', type=int, default=50000)
+    args = parser.parse_args()
+
+    rates = []
+    for label, env_class, kwargs in CONFIGURATIONS:
+        env = env_class(**kwargs)
+        rng = np.random.default_rng(100)
+        levels = rng.integers(0, 3, size=(args.steps, len(env.students_per_course)))
+        actions = [[*(levels_row * env.action_codec.percentage).tolist(), 0.5] for levels_row in levels]
+        rates.append(steps_per_second(env, actions))
+        print(f"{label:<20} {rates[-1]:>12,.0f} steps/s ({rates[-1] / rates[0]:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Throughput of the indoor model surrogate against ``get_infected_students``.
+
+Usage:
+    python -m benchmarks.bench_indoor_surrogate --steps 2000 --surrogate cache/indoor_surrogate.npz
+"""
+import argparse
+import math
+import time
+import numpy as np
+from campus_gym.envs.codec import OCCUPANCY_PERCENTAGE
+from epidemic_models.analyze_models import get_infected_students
+from epidemic_models.indoor_surrogate import IndoorSurrogateDynamics, build_indoor_surrogate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the indoor model surrogate.')
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--students_per_course', type=int, nargs='+', default=[100])
+    parser.add_argument('--surrogate', default=None, help='Saved surrogate, built with default settings if omitted.')
+    args = parser.parse_args()
+
+    students = args.students_per_course
+    total_students = sum(students)
+    dynamics = IndoorSurrogateDynamics(args.surrogate or build_indoor_surrogate(), students)
+
+    rng = np.random.default_rng(100)
+    actions = (rng.integers(0, 3, size=(args.steps, len(students))) * OCCUPANCY_PERCENTAGE).tolist()
+    current = rng.integers(1, 100, size=(args.steps, len(students))).tolist()
+    risk = rng.random(args.steps).tolist()
+
+    start = time.perf_counter()
+    exact = []
+    for action, infected, community_risk in zip(actions, current, risk):
+        allowed = [math.ceil(s * action[i] / total_students) for i, s in enumerate(students)]
+        # Every course uses its own number of students as total_students, like IndoorSurrogateDynamics
+        exact.append([get_infected_students([infected[i]], [allowed[i]], community_risk, s)[0]
+                      for i, s in enumerate(students)])
+    exact_rate = args.steps / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    approx = [dynamics.step(infected, action, community_risk)[1]
+              for action, infected, community_risk in zip(actions, current, risk)]
+    surrogate_rate = args.steps / (time.perf_counter() - start)
+
+    errors = np.abs(np.asarray(approx) - np.asarray(exact))
+    print(f"exact:     {exact_rate:,.0f} steps/s")
+    print(f"surrogate: {surrogate_rate:,.0f} steps/s ({surrogate_rate / exact_rate:.1f}x)")
+    print(f"max error: {errors.max():.0f} students, exact fraction: {(errors == 0).mean():.4f}")
+    print("validation:", dynamics.surrogate.error_report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Throughput and accuracy of the tabulated dynamics against the exact model.
+
+Usage:
+    python -m benchmarks.bench_tabulated_dynamics --steps 20000
+"""
+import argparse
+import time
+import numpy as np
+from campus_digital_twin.campus_model import CampusModel
+from campus_digital_twin.campus_state import Simulation
+from campus_digital_twin.tabulated_dynamics import DynamicsTable, accuracy_report
+
+
+def steps_per_second(simulation, actions, alpha=0.5):
+    simulation.reset()
+    start = time.perf_counter()
+    for action in actions:
+        simulation.update_with_action(action)
+        simulation.get_reward(alpha)
+        if simulation.is_episode_done():
+            simulation.reset()
+    return len(actions) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tabulated dynamics.')
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--students_per_course', type=int, nargs='+', default=[100])
+    parser.add_argument('--samples', type=int, default=20000, help='Samples of the accuracy report.')
+    args = parser.parse_args()
+
+    students = args.students_per_course
+    model = CampusModel(num_courses=len(students), students_per_course=students)
+    start = time.perf_counter()
+    table = DynamicsTable(students)
+    build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(100)
+    actions = (rng.integers(0, 3, size=(args.steps, len(students))) * table.action_codec.percentage).tolist()
+    exact_rate = steps_per_second(Simulation(model), actions)
+    table_rate = steps_per_second(Simulation(model, dynamics=table), actions)
+
+    print(f"table build: {build_seconds:.3f}s, {table.next_infected.nbytes / 1e6:.2f} MB")
+    print(f"exact:     {exact_rate:,.0f} steps/s")
+    print(f"tabulated: {table_rate:,.0f} steps/s ({table_rate / exact_rate:.2f}x)")
+    print("accuracy:", accuracy_report(table, num_samples=args.samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Benchmark suite of the simulation, the agents and the evaluation code.
+
+Every benchmark is timed ``--repeat`` times after a warm-up run and reported per call
+(min, median, mean and standard deviation in seconds). The results and the machine they
+ran on are written as JSON; with ``--baseline`` the medians are compared against a
+previous result and the command exits with status 1 when a benchmark got slower than
+``--threshold``. Benchmarks whose optional dependencies (torch, wandb) are not installed
+are reported as skipped. wandb runs in disabled mode and agent outputs go to a
+temporary directory, so the suite runs offline.
+
+Usage:
+    python -m benchmarks.suite --output benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.2
+    python -m benchmarks.suite --filter env_step --repeat 10
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import yaml
+from campus_gym.envs.campus_gym_env import CampusGymEnv
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COURSE_COUNTS = (1, 2, 3)
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark setup when it cannot run in this environment."""
+
+
+def make_env(num_courses, **kwargs):
+    return CampusGymEnv(num_courses=num_courses, students_per_course=100, **kwargs)
+
+
+def setup_env_step(num_courses, steps=1000):
+    env = make_env(num_courses, alpha=0.5)
+    actions = np.random.default_rng(100).integers(0, env.action_codec.num_actions, size=steps).tolist()
+    env.reset(seed=100)
+
+    def run():
+        # Resets at the end of an episode are part of the loop, as in training
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+    return run, steps
+
+
+def setup_env_reset(num_courses, resets=200):
+    env = make_env(num_courses)
+    env.reset(seed=100)
+
+    def run():
+        for _ in range(resets):
+            env.reset()
+    return run, resets
+
+
+def setup_td_update(num_courses=2, updates=10000, learning_rate=0.1, discount_factor=0.9):
+    """The tabular update of ``QLearningAgent.train`` on recorded transitions."""
+    env = make_env(num_courses, alpha=0.5, info_level='none', observation_mode='index')
+    rng = np.random.default_rng(100)
+    transitions = []
+    state, _ = env.reset(seed=100)
+    for _ in range(updates):
+        action = int(rng.integers(env.action_codec.num_actions))
+        next_state, reward, done, _, _ = env.step(action)
+        transitions.append((state, action, reward, next_state))
+        state = env.reset()[0] if done else next_state
+    q_table = np.zeros((env.state_codec.num_states, env.action_codec.num_actions))
+
+    def run():
+        for state_idx, action, reward, next_state_idx in transitions:
+            old_value = q_table[state_idx, action]
+            next_max = np.max(q_table[next_state_idx])
+            q_table[state_idx, action] = (1 - learning_rate) * old_value + learning_rate * (
+                reward + discount_factor * next_max)
+    return run, updates
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+class AgentFixture:
+    """Agents created once per suite run, writing their outputs to a temporary directory."""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.shared_config_path = os.path.join(workdir, 'config_shared.yaml')
+        with open(os.path.join(REPOSITORY, 'config', 'config_shared.yaml')) as file:
+            shared_config = yaml.safe_load(file)
+        shared_config['directories'] = {name: os.path.join(workdir, os.path.basename(path))
+                                        for name, path in shared_config['directories'].items()}
+        with open(self.shared_config_path, 'w') as file:
+            yaml.safe_dump(shared_config, file)
+        self._agents = {}
+
+    def agent(self, agent_type, num_courses=1):
+        key = (agent_type, num_courses)
+        if key not in self._agents:
+            try:
+                if agent_type == 'q_learning':
+                    from q_learning.agent import QLearningAgent as AgentClass
+                else:
+                    from dqn_custom.agent import DQNCustomAgent as AgentClass
+            except ImportError as error:
+                raise SkipBenchmark(f"{agent_type} agent unavailable: {error}")
+            agent_config_path = os.path.join(REPOSITORY, 'config', f'config_{agent_type}.yaml')
+            with quiet():
+                self._agents[key] = AgentClass(make_env(num_courses), 'benchmark', self.shared_config_path,
+                                               agent_config_path)
+        return self._agents[key]
+
+
+def setup_dqn_optimize(fixture, steps=20):
+    agent = fixture.agent('dqn_custom')
+    env = agent.env
+    rng = np.random.default_rng(100)
+    random.seed(100)
+    state, _ = env.reset(seed=100)
+    while len(agent.replay_memory) < agent.replay_memory.maxlen:
+        levels = rng.integers(0, 3, size=agent.num_courses).tolist()
+        next_state, reward, done, _, _ = env.step((agent.action_codec.scale_levels(levels), 0.5))
+        agent.replay_memory.append((np.array(state, dtype=np.float32), levels, reward,
+                                    np.array(next_state, dtype=np.float32), done))
+        state = env.reset()[0] if done else next_state
+
+    def run():
+        for _ in range(steps):
+            agent.optimize_model()
+    return run, steps
+
+
+def setup_q_learning_test(fixture, episodes=5):
+    agent = fixture.agent('q_learning')
+    agent.q_table[:] = np.random.default_rng(100).random(agent.q_table.shape)
+
+    def run():
+        with quiet():
+            agent.test(episodes, 0.5)
+    return run, episodes
+
+
+def setup_visualize_all_states(fixture):
+    agent = fixture.agent('q_learning')
+    from q_learning.visualizer import visualize_all_states
+    q_table = np.random.default_rng(100).random(agent.q_table.shape)
+
+    def run():
+        with quiet():
+            visualize_all_states(q_table, agent.all_states, agent.states, 'benchmark', agent.max_episodes, 0.5,
+                                 agent.results_subdirectory, agent.env.unwrapped.students_per_course,
+                                 agent.action_codec)
+    return run, 1
+
+
+def setup_tolerance_interval(fixture, num_runs=10, num_episodes=1000, episode_length=16):
+    """The per-episode intervals of ``visualize_tolerance_interval_curve`` without the plot."""
+    agent = fixture.agent('q_learning')
+    returns = np.random.default_rng(100).normal(50, 20, size=(num_runs, num_episodes, episode_length)).tolist()
+
+    def run():
+        for episode in range(num_episodes):
+            returns_at_episode = [item for run_returns in returns for item in run_returns[episode]]
+            agent.compute_tolerance_interval(returns_at_episode, 0.05, 0.9)
+    return run, num_episodes
+
+
+def benchmark_setups(fixture):
+    """Name and setup function of every benchmark, in run order."""
+    setups = []
+    for num_courses in COURSE_COUNTS:
+        setups.append((f'env_step[{num_courses}_courses]', lambda n=num_courses: setup_env_step(n)))
+        setups.append((f'env_reset[{num_courses}_courses]', lambda n=num_courses: setup_env_reset(n)))
+    setups += [
+        ('q_learning_td_update', setup_td_update),
+        ('dqn_sample_gradient_step', lambda: setup_dqn_optimize(fixture)),
+        ('q_learning_test', lambda: setup_q_learning_test(fixture)),
+        ('visualize_all_states', lambda: setup_visualize_all_states(fixture)),
+        ('tolerance_interval', lambda: setup_tolerance_interval(fixture)),
+    ]
+    return setups
+
+
+def time_benchmark(run, calls, repeat):
+    """Seconds per call of ``repeat`` timed runs after one warm-up run."""
+    run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) / calls)
+    return {
+        'calls_per_run': calls,
+        'repeat': repeat,
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def package_version(name):
+    try:
+        return __import__(name).__version__
+    except ImportError:
+        return None
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'packages': {name: package_version(name) for name in ('numpy', 'scipy', 'gymnasium', 'matplotlib', 'torch')},
+    }
+
+
+def run_suite(name_filter=None, repeat=5):
+    """Runs the benchmarks whose name contains ``name_filter``.
+
+    Returns:
+        A dict with ``metadata`` and ``benchmarks``, the timings of every benchmark or
+        ``{'skipped': reason}``.
+    """
+    os.environ.setdefault('WANDB_MODE', 'disabled')
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # QLearningAgent.test writes to ./evaluation
+        os.chdir(workdir)
+        try:
+            fixture = AgentFixture(workdir)
+            for name, setup in benchmark_setups(fixture):
+                if name_filter and name_filter not in name:
+                    continue
+                try:
+                    with quiet():
+                        run, calls = setup()
+                except SkipBenchmark as error:
+                    results[name] = {'skipped': str(error)}
+                else:
+                    results[name] = time_benchmark(run, calls, repeat)
+                print(format_result(name, results[name]), flush=True)
+        finally:
+            os.chdir(cwd)
+    return {'metadata': metadata(), 'benchmarks': results}
+
+
+def format_result(name, result):
+    if 'skipped' in result:
+        return f"{name:<28} skipped ({result['skipped']})"
+    return f"{name:<28} {result['median'] * 1e6:>12,.1f} us/call (min {result['min'] * 1e6:,.1f}, " \
+           f"stdev {result['stdev'] * 1e6:,.1f})"
+
+
+def compare(results, baseline, threshold):
+    """Median time ratio of every benchmark timed in both runs.
+
+    Returns:
+        A list of (name, baseline median, median, ratio, regressed) tuples.
+    """
+    comparison = []
+    for name, result in results['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if 'median' not in result or not reference or 'median' not in reference:
+            continue
+        ratio = result['median'] / reference['median']
+        comparison.append((name, reference['median'], result['median'], ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the SafeCampus benchmark suite.')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to.')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown of the median that counts as a regression.')
+    parser.add_argument('--filter', default=None, help='Only run benchmarks whose name contains this string.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = run_suite(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparison = compare(results, baseline, args.threshold)
+        print(f"\n{'benchmark':<28}{'baseline us':>14}{'current us':>14}{'ratio':>8}")
+        for name, reference, median, ratio, regressed in comparison:
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{name:<28}{reference * 1e6:>14,.1f}{median * 1e6:>14,.1f}{ratio:>8.2f}{flag}")
+        if any(regressed for *_, regressed in comparison):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,27 +18,47 @@ def map_value_to_range(old_value, old_min=0.01, old_max=0.1, new_min=0, new_max=
     return (old_value - old_min) / (old_max - old_min) * (new_max - new_min) + new_min
 
 class Simulation:
-    def __init__(self, model):
+    def __init__(self, model, risk_source=None, dynamics=None):
+        """
+        Args:
+            model: The ``CampusModel`` to simulate.
+            risk_source: Optional source of community risk trajectories (see ``community_risk``).
+                When set, the risk of every week is replayed from the trajectory of the current
+                episode instead of being drawn with ``random.uniform``.
+            dynamics: Optional dynamics backend with a ``step(current_infected, action, community_risk)``
+                method returning the allowed and infected students per course, e.g. a
+                ``DynamicsTable``. Defaults to ``estimate_infected_students``.
+        """
+        # Module-level ``random`` unless ``seed`` gives this simulation its own generator
+        self.rng = random
         self.current_time = 0
         self.model = model
+        self.risk_source = risk_source
+        self.dynamics = dynamics
+        self.episode_index = 0
+        self.risk_trajectory = None
         # Handle multiple courses dynamically
         self.allowed_students_per_course =[]
         self.student_status = model.initial_infection
         self.state_transition = []
-        self.community_risk = random.random()
+        self.community_risk = self.rng.random()
         self.weekly_infected_students = []
         self.allowed = []
         self.infected = []
         print("initial infected students: ", self.student_status) #debug check
 
     def set_community_risk_high(self):
-        self.community_risk = random.uniform(0.5, 1.0)
+        self.community_risk = self.rng.uniform(0.5, 1.0)
         return self.community_risk
 
     def set_community_risk_low(self):
-        self.community_risk = random.uniform(0.0, 0.5)
+        self.community_risk = self.rng.uniform(0.0, 0.5)
         return self.community_risk
 
+    def seed(self, seed):
+        """Gives this simulation its own random generator, e.g. one per vectorized environment."""
+        self.rng = random.Random(seed)
+
     def get_student_status(self):
         obs_state = copy.deepcopy(self.student_status)
         # fixme: this is a hack to get the community risk value
@@ -64,15 +84,19 @@ class Simulation:
         # print("action: ", action) #debug check
         # print("students per course: ", self.model.number_of_students_per_course()) #debug check
 
-        allowed_students_per_course = [
-            math.ceil(students * action[i] / self.model.total_students)
-            for i, students in enumerate(self. model.number_of_students_per_course())
-        ]
-        initial_infection = self.model.get_initial_infection()
-        # updated_infected = get_infected_students(self.student_status, allowed_students_per_course,
-        #                       self.model.number_of_students_per_course(), initial_infection, community_risk)
-        updated_infected = estimate_infected_students(self.student_status, allowed_students_per_course, community_risk,
-                                                      self.model.number_of_students_per_course())
+        if self.dynamics is not None:
+            allowed_students_per_course, updated_infected = self.dynamics.step(self.student_status, action,
+                                                                               community_risk)
+        else:
+            allowed_students_per_course = [
+                math.ceil(students * action[i] / self.model.total_students)
+                for i, students in enumerate(self. model.number_of_students_per_course())
+            ]
+            initial_infection = self.model.get_initial_infection()
+            # updated_infected = get_infected_students(self.student_status, allowed_students_per_course,
+            #                       self.model.number_of_students_per_course(), initial_infection, community_risk)
+            updated_infected = estimate_infected_students(self.student_status, allowed_students_per_course,
+                                                          community_risk, self.model.number_of_students_per_course())
 
         # print("updated infected students: ", updated_infected) #debug check
 
@@ -88,7 +112,9 @@ class Simulation:
 
         # self.community_risk = random.uniform(0.01, 0.1)
 
-        if self.current_time >= int(self.model.max_weeks/2):
+        if self.risk_trajectory is not None:
+            self.community_risk = float(self.risk_trajectory[self.current_time + 1])
+        elif self.current_time >= int(self.model.max_weeks/2):
             self.set_community_risk_low()
             # self.community_risk = self.community_risk * self.set_community_risk_low() * random.uniform(0.0, 0.1) + self.community_risk
         else:
@@ -113,11 +139,27 @@ class Simulation:
         """
         return self.current_time == self.model.get_max_weeks()
 
-    def reset(self):
+    def reset(self, episode_index=None):
+        """Resets the simulation to the start of a semester.
+
+        Args:
+            episode_index: Index of the risk trajectory to replay. Defaults to the episode
+                following the previous one. Ignored without a ``risk_source``.
+        """
         self.current_time = 0
         self.allowed_students_per_course = self.model.number_of_students_per_course()
-        self.student_status = [random.randint(1, 99) for _ in self.allowed_students_per_course]
-        self.community_risk = random.uniform(0.0, 1.0)
+        self.student_status = [self.rng.randint(1, 99) for _ in self.allowed_students_per_course]
+        if self.risk_source is not None:
+            if episode_index is not None:
+                self.episode_index = episode_index
+            self.risk_trajectory = self.risk_source.trajectory(self.episode_index)
+            if len(self.risk_trajectory) < self.model.get_max_weeks() + 1:
+                raise ValueError(f"Risk trajectories cover {len(self.risk_trajectory) - 1} weeks, "
+                                 f"the model needs {self.model.get_max_weeks()}")
+            self.episode_index += 1
+            self.community_risk = float(self.risk_trajectory[0])
+        else:
+            self.community_risk = self.rng.uniform(0.0, 1.0)
         # print("Resetting the state...: ", self.student_status, self.community_risk) #debug check
         return self.get_student_status()
 
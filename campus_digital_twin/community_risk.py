@@ -0,0 +1,232 @@
+"""Community risk processes and pre-generated risk trajectories.
+
+A risk process describes how the community risk evolves over the weeks of a
+semester. Trajectories are generated once, stored in a ``.npy`` file of shape
+``(num_episodes, num_weeks + 1)`` and replayed by episode index, so every policy
+sees the same risk inputs and no random numbers are drawn per step.
+
+Column ``t`` of a trajectory holds the community risk observed at week ``t``;
+column 0 is the risk right after ``Simulation.reset``.
+
+Example:
+    python -m campus_digital_twin.community_risk --process ar1 --episodes 1000000 --output risk_ar1.npy
+"""
+import argparse
+import numpy as np
+
+
+class CommunityRiskProcess:
+    """Base class for community risk processes.
+
+    Subclasses implement ``generate`` which returns a batch of trajectories as a
+    ``(num_episodes, num_weeks + 1)`` array with values in [0, 1].
+    """
+    name = None
+
+    def generate(self, num_episodes, num_weeks, rng):
+        raise NotImplementedError
+
+    def sample_trajectory(self, num_weeks, rng):
+        """Draws a single trajectory of length ``num_weeks + 1``."""
+        return self.generate(1, num_weeks, rng)[0]
+
+
+class HighLowRiskProcess(CommunityRiskProcess):
+    """The regime used by ``Simulation``: high risk in the first half of the semester, low risk after.
+
+    Args:
+        initial_range: Range of the risk drawn at reset.
+        high_range: Range of the risk drawn while ``week < num_weeks / 2``.
+        low_range: Range of the risk drawn for the remaining weeks.
+    """
+    name = 'high_low'
+
+    def __init__(self, initial_range=(0.0, 1.0), high_range=(0.5, 1.0), low_range=(0.0, 0.5)):
+        self.initial_range = initial_range
+        self.high_range = high_range
+        self.low_range = low_range
+
+    def generate(self, num_episodes, num_weeks, rng):
+        trajectories = np.empty((num_episodes, num_weeks + 1))
+        trajectories[:, 0] = rng.uniform(*self.initial_range, size=num_episodes)
+        # The risk for week t + 1 is drawn after the action of week t is applied
+        weeks = np.arange(num_weeks)
+        high = weeks < int(num_weeks / 2)
+        trajectories[:, 1:][:, high] = rng.uniform(*self.high_range, size=(num_episodes, int(high.sum())))
+        trajectories[:, 1:][:, ~high] = rng.uniform(*self.low_range, size=(num_episodes, int((~high).sum())))
+        return trajectories
+
+
+class AR1RiskProcess(CommunityRiskProcess):
+    """First-order autoregressive risk: ``r[t+1] = mean + phi * (r[t] - mean) + sigma * eps``.
+
+    Values are clipped to [0, 1].
+    """
+    name = 'ar1'
+
+    def __init__(self, mean=0.5, phi=0.8, sigma=0.1, initial_range=(0.0, 1.0)):
+        self.mean = mean
+        self.phi = phi
+        self.sigma = sigma
+        self.initial_range = initial_range
+
+    def generate(self, num_episodes, num_weeks, rng):
+        trajectories = np.empty((num_episodes, num_weeks + 1))
+        trajectories[:, 0] = rng.uniform(*self.initial_range, size=num_episodes)
+        noise = rng.normal(0.0, self.sigma, size=(num_episodes, num_weeks))
+        for week in range(num_weeks):
+            trajectories[:, week + 1] = self.mean + self.phi * (trajectories[:, week] - self.mean) + noise[:, week]
+            np.clip(trajectories[:, week + 1], 0.0, 1.0, out=trajectories[:, week + 1])
+        return trajectories
+
+
+class RegimeSwitchingRiskProcess(CommunityRiskProcess):
+    """Markov-switching risk with a low and a high regime.
+
+    Each week the regime switches with probability ``switch_prob`` and the risk is
+    drawn uniformly from the range of the active regime.
+    """
+    name = 'regime_switching'
+
+    def __init__(self, low_range=(0.0, 0.5), high_range=(0.5, 1.0), switch_prob=0.2, initial_high_prob=0.5):
+        self.low_range = low_range
+        self.high_range = high_range
+        self.switch_prob = switch_prob
+        self.initial_high_prob = initial_high_prob
+
+    def generate(self, num_episodes, num_weeks, rng):
+        switches = rng.random((num_episodes, num_weeks + 1)) < self.switch_prob
+        switches[:, 0] = rng.random(num_episodes) < self.initial_high_prob
+        # The regime is the parity of the number of switches so far
+        high = np.cumsum(switches, axis=1) % 2 == 1
+        low_values = rng.uniform(*self.low_range, size=high.shape)
+        high_values = rng.uniform(*self.high_range, size=high.shape)
+        return np.where(high, high_values, low_values)
+
+
+RISK_PROCESSES = {
+    HighLowRiskProcess.name: HighLowRiskProcess,
+    AR1RiskProcess.name: AR1RiskProcess,
+    RegimeSwitchingRiskProcess.name: RegimeSwitchingRiskProcess,
+}
+
+
+def make_risk_process(name, **kwargs):
+    """Creates a built-in risk process by name."""
+    if name not in RISK_PROCESSES:
+        raise ValueError(f"Unknown risk process: {name}. Choose from {list(RISK_PROCESSES)}")
+    return RISK_PROCESSES[name](**kwargs)
+
+
+def generate_trajectory_file(path, process, num_episodes, num_weeks=16, seed=100, chunk_size=100000,
+                             dtype=np.float32):
+    """Pre-generates risk trajectories into a ``.npy`` file.
+
+    Trajectories are written in chunks through a memory-mapped file, so millions of
+    episodes can be generated without holding them in memory.
+
+    Args:
+        path: Output ``.npy`` file.
+        process: A ``CommunityRiskProcess``.
+        num_episodes: Number of trajectories to generate.
+        num_weeks: Number of weeks per semester.
+        seed: Seed of the generator, making the file reproducible.
+        chunk_size: Number of trajectories generated at once.
+        dtype: Storage dtype.
+    Returns:
+        The path of the written file.
+    """
+    rng = np.random.default_rng(seed)
+    output = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(num_episodes, num_weeks + 1))
+    for start in range(0, num_episodes, chunk_size):
+        stop = min(start + chunk_size, num_episodes)
+        output[start:stop] = process.generate(stop - start, num_weeks, rng)
+    output.flush()
+    del output
+    return path
+
+
+def load_trajectories(path, mmap_mode='r'):
+    """Opens a trajectory file, memory-mapped by default."""
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def trajectories_from_series(series, num_weeks=16, stride=1):
+    """Cuts a long risk series (e.g. county-level data scaled to [0, 1]) into overlapping trajectories.
+
+    Returns:
+        An array of shape ``(num_windows, num_weeks + 1)``.
+    """
+    series = np.clip(np.asarray(series, dtype=np.float64), 0.0, 1.0)
+    window = num_weeks + 1
+    if len(series) < window:
+        raise ValueError(f"Series of length {len(series)} is shorter than a semester of {window} values")
+    windows = np.lib.stride_tricks.sliding_window_view(series, window)
+    return np.ascontiguousarray(windows[::stride])
+
+
+class RiskTrajectories:
+    """Replays pre-generated risk trajectories by episode index.
+
+    Args:
+        trajectories: An array of shape ``(num_episodes, num_weeks + 1)`` or the path
+            of a ``.npy`` file, which is memory-mapped.
+    """
+
+    def __init__(self, trajectories):
+        if isinstance(trajectories, str):
+            trajectories = load_trajectories(trajectories)
+        if trajectories.ndim != 2:
+            raise ValueError("Risk trajectories must have shape (num_episodes, num_weeks + 1)")
+        self.trajectories = trajectories
+
+    def __len__(self):
+        return self.trajectories.shape[0]
+
+    @property
+    def num_weeks(self):
+        return self.trajectories.shape[1] - 1
+
+    def trajectory(self, episode_index):
+        """Returns the trajectory of an episode, wrapping around when the index exceeds the file."""
+        return self.trajectories[episode_index % len(self)]
+
+
+class ProcessRiskSource:
+    """Draws trajectories from a process on demand, seeded by episode index.
+
+    Gives the same common inputs as a pre-generated file without writing one.
+    """
+
+    def __init__(self, process, num_weeks=16, seed=100):
+        self.process = process
+        self.num_weeks = num_weeks
+        self.seed = seed
+
+    def trajectory(self, episode_index):
+        rng = np.random.default_rng([self.seed, episode_index])
+        return self.process.sample_trajectory(self.num_weeks, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate community risk trajectories.')
+    parser.add_argument('--process', default=HighLowRiskProcess.name, choices=list(RISK_PROCESSES))
+    parser.add_argument('--episodes', type=int, default=100000, help='Number of trajectories.')
+    parser.add_argument('--weeks', type=int, default=16, help='Number of weeks per semester.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--from_csv', default=None, help='CSV file with a risk series to replay instead.')
+    parser.add_argument('--column', default='community_risk', help='Column of the CSV series.')
+    parser.add_argument('--output', required=True, help='Output .npy file.')
+    args = parser.parse_args()
+
+    if args.from_csv:
+        import pandas as pd
+        series = pd.read_csv(args.from_csv)[args.column].to_numpy()
+        np.save(args.output, trajectories_from_series(series, args.weeks).astype(np.float32))
+    else:
+        generate_trajectory_file(args.output, make_risk_process(args.process), args.episodes, args.weeks, args.seed)
+    print(f"Risk trajectories saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Precomputed dynamics tables for the discretized environment.
+
+With ``estimate_infected_students`` the infected students of a course next week only depend
+on the infected students now, the occupancy level (0%, 50%, 100%) and the community risk.
+``DynamicsTable`` precomputes the next infected count for every course, current infected
+count and occupancy level on a fine community risk grid, so a simulation step becomes a
+single array lookup. Tables are cached on disk keyed by the model parameters.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from epidemic_models.analyze_models import estimate_infected_students, estimate_infected_students_vectorized
+
+NUM_OCCUPANCY_LEVELS = 3
+TABLE_VERSION = 1
+
+
+class DynamicsTable:
+    """Lookup-table dynamics backend for ``Simulation``.
+
+    Args:
+        students_per_course: List with the number of students of each course.
+        risk_grid_size: Number of community risk values tabulated in [0, 1].
+        const_1, const_2: Constants of ``estimate_infected_students``.
+        cache_dir: Directory where tables are cached, ``None`` to disable caching.
+    """
+
+    def __init__(self, students_per_course, risk_grid_size=1001, const_1=0.005, const_2=0.01, cache_dir=None):
+        self.students_per_course = [int(students) for students in students_per_course]
+        self.total_students = sum(self.students_per_course)
+        self.risk_grid_size = risk_grid_size
+        self.const_1 = const_1
+        self.const_2 = const_2
+        # Imported here: campus_gym.envs imports this module
+        from campus_gym.envs.codec import ActionCodec
+        self.action_codec = ActionCodec([NUM_OCCUPANCY_LEVELS] * len(self.students_per_course))
+
+        # allowed[c, level] replicates the rounding of Simulation.apply_action
+        percentages = np.arange(NUM_OCCUPANCY_LEVELS) * self.action_codec.percentage
+        students = np.asarray(self.students_per_course)[:, None]
+        self.allowed = np.ceil(students * percentages / self.total_students).astype(np.int64)
+        # Infected counts start in 1-99 and are capped by the allowed students afterwards
+        self.max_infected = max(99, int(self.allowed.max()))
+
+        path = os.path.join(cache_dir, f'dynamics_{self.cache_key()}.npz') if cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as archive:
+                self.next_infected = archive['next_infected']
+        else:
+            self.next_infected = self.build()
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez_compressed(path, next_infected=self.next_infected)
+        self.course_index = np.arange(len(self.students_per_course))
+        # Nested lists make single-step lookups cheaper than NumPy scalar indexing
+        self._next_infected_rows = self.next_infected.tolist()
+        self._allowed_rows = self.allowed.tolist()
+
+    def cache_key(self):
+        parameters = {
+            'students_per_course': self.students_per_course,
+            'risk_grid_size': self.risk_grid_size,
+            'const_1': self.const_1,
+            'const_2': self.const_2,
+            'version': TABLE_VERSION,
+        }
+        return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+    def build(self):
+        """Tabulates the next infected count, shape (courses, max_infected + 1, levels, risk_grid_size)."""
+        num_courses = len(self.students_per_course)
+        current = np.arange(self.max_infected + 1)
+        risk = np.linspace(0.0, 1.0, self.risk_grid_size)
+        table = np.empty((num_courses, len(current), NUM_OCCUPANCY_LEVELS, self.risk_grid_size), dtype=np.int32)
+        cur_grid, risk_grid = np.meshgrid(current, risk, indexing='ij')
+        for course in range(num_courses):
+            for level in range(NUM_OCCUPANCY_LEVELS):
+                allowed = np.full((cur_grid.size, 1), self.allowed[course, level])
+                infected = estimate_infected_students_vectorized(cur_grid.reshape(-1, 1), allowed, risk_grid.ravel(),
+                                                                 const_1=self.const_1, const_2=self.const_2)
+                table[course, :, level, :] = infected.reshape(cur_grid.shape)
+        return table
+
+    def risk_index(self, community_risk):
+        return np.rint(np.clip(community_risk, 0.0, 1.0) * (self.risk_grid_size - 1)).astype(np.int64)
+
+    def lookup(self, current_infected, levels, community_risk):
+        """Next infected counts for arrays of current infected and occupancy levels of every course."""
+        current_infected = np.clip(current_infected, 0, self.max_infected)
+        return self.next_infected[self.course_index, current_infected, levels, self.risk_index(community_risk)]
+
+    def step(self, current_infected, action, community_risk):
+        """Dynamics backend interface used by ``Simulation.apply_action``.
+
+        Args:
+            current_infected: List of infected students per course.
+            action: List of allowed percentages (0, 50, 100) per course.
+            community_risk: Current community risk.
+        Returns:
+            The allowed students per course and the updated infected students, as lists.
+        """
+        risk_index = round(min(1.0, max(0.0, community_risk)) * (self.risk_grid_size - 1))
+        allowed = []
+        infected = []
+        for course, percentage in enumerate(action):
+            level = int(percentage) // self.action_codec.percentage
+            allowed.append(self._allowed_rows[course][level])
+            infected.append(self._next_infected_rows[course][current_infected[course]][level][risk_index])
+        return allowed, infected
+
+
+def accuracy_report(table, num_samples=100000, seed=100):
+    """Compares table lookups with ``estimate_infected_students`` on random inputs.
+
+    Returns:
+        A dict with the mean and max absolute error in students, the fraction of exact
+        predictions and the number of samples.
+    """
+    rng = np.random.default_rng(seed)
+    num_courses = len(table.students_per_course)
+    current = rng.integers(0, table.max_infected + 1, size=(num_samples, num_courses))
+    levels = rng.integers(0, NUM_OCCUPANCY_LEVELS, size=(num_samples, num_courses))
+    risk = rng.random(num_samples)
+
+    errors = np.empty((num_samples, num_courses))
+    for i in range(num_samples):
+        allowed = table.allowed[table.course_index, levels[i]].tolist()
+        exact = estimate_infected_students(current[i].tolist(), allowed, risk[i], table.students_per_course)
+        errors[i] = np.abs(table.lookup(current[i], levels[i], risk[i]) - np.asarray(exact))
+    return {
+        'mean_abs_error': float(errors.mean()),
+        'max_abs_error': float(errors.max()),
+        'exact_fraction': float((errors == 0).mean()),
+        'num_samples': num_samples,
+    }
@@ -0,0 +1,108 @@
+"""A NumPy simulator that steps many campuses at once.
+
+``VectorizedSimulation`` reproduces the dynamics of ``Simulation`` (allowed students,
+``estimate_infected_students`` and ``get_reward``) for ``num_envs`` independent campuses
+sharing the same course layout. It is used wherever many rollouts are needed at once,
+e.g. by the scenario-cube evaluator.
+"""
+import numpy as np
+from epidemic_models.analyze_models import estimate_infected_students_vectorized
+from campus_digital_twin.community_risk import HighLowRiskProcess
+from campus_gym.envs.codec import ActionCodec
+
+NUM_OCCUPANCY_LEVELS = 3
+
+
+def discretize_observation(observation):
+    """Array version of ``convert_actions_to_discrete``: maps raw values to levels 0-9."""
+    return np.clip(observation, 0, 99) // 10
+
+
+class VectorizedSimulation:
+    """Simulates ``num_envs`` campuses with the same courses in lockstep.
+
+    Args:
+        students_per_course: List with the number of students of each course.
+        num_envs: Number of campuses simulated together.
+        max_weeks: Number of weeks per episode.
+        risk_process: ``CommunityRiskProcess`` used when ``reset`` is not given risk trajectories.
+        seed: Seed of the generator used for initial infections and risk trajectories.
+        infection_model: Function with the signature of ``estimate_infected_students_vectorized``.
+        model_constants: Keyword arguments passed to ``infection_model``, scalars or arrays of
+            shape (num_envs,) to give every campus its own constants.
+    """
+
+    def __init__(self, students_per_course, num_envs, max_weeks=16, risk_process=None, seed=100,
+                 infection_model=estimate_infected_students_vectorized, model_constants=None):
+        self.students_per_course = np.asarray(students_per_course, dtype=np.int64)
+        self.num_courses = len(self.students_per_course)
+        self.total_students = int(self.students_per_course.sum())
+        self.action_codec = ActionCodec([NUM_OCCUPANCY_LEVELS] * self.num_courses)
+        self.num_envs = num_envs
+        self.max_weeks = max_weeks
+        self.risk_process = risk_process or HighLowRiskProcess()
+        self.rng = np.random.default_rng(seed)
+        self.infection_model = infection_model
+        self.model_constants = model_constants or {}
+
+        self.current_time = 0
+        self.student_status = np.zeros((num_envs, self.num_courses), dtype=np.int64)
+        self.allowed_students_per_course = np.zeros((num_envs, self.num_courses), dtype=np.int64)
+        self.risk_trajectories = np.zeros((num_envs, max_weeks + 1))
+        self.community_risk = np.zeros(num_envs)
+
+    def reset(self, risk_trajectories=None, initial_infected=None):
+        """Resets all campuses.
+
+        Args:
+            risk_trajectories: Optional array of shape (num_envs, max_weeks + 1) to replay.
+            initial_infected: Optional array of shape (num_envs, num_courses). Drawn uniformly
+                from 1-99 like ``Simulation.reset`` when omitted.
+        Returns:
+            The raw observation of shape (num_envs, num_courses + 1).
+        """
+        self.current_time = 0
+        self.allowed_students_per_course[:] = self.students_per_course
+        if initial_infected is None:
+            initial_infected = self.rng.integers(1, 100, size=(self.num_envs, self.num_courses))
+        self.student_status = np.array(initial_infected, dtype=np.int64)
+        if risk_trajectories is None:
+            risk_trajectories = self.risk_process.generate(self.num_envs, self.max_weeks, self.rng)
+        self.risk_trajectories = np.asarray(risk_trajectories, dtype=np.float64)
+        self.community_risk = self.risk_trajectories[:, 0]
+        return self.get_student_status()
+
+    def get_student_status(self):
+        """Raw observation: infected students per course followed by ``int(community_risk * 100)``."""
+        risk = np.floor(self.community_risk * 100).astype(np.int64)
+        return np.concatenate([self.student_status, risk[:, None]], axis=1)
+
+    def step(self, action_levels, alpha):
+        """Applies one week of actions to every campus.
+
+        Args:
+            action_levels: Integer array of shape (num_envs, num_courses) with levels 0, 1, 2.
+            alpha: Reward weight, a scalar or an array of shape (num_envs,).
+        Returns:
+            observation, reward, done and an info dict with ``allowed``, ``infected`` and
+            ``community_risk`` arrays.
+        """
+        percentages = np.asarray(action_levels, dtype=np.int64) * self.action_codec.percentage
+        allowed = np.ceil(self.students_per_course * percentages / self.total_students).astype(np.int64)
+        self.student_status = self.infection_model(self.student_status, allowed, self.community_risk,
+                                                   **self.model_constants)
+        self.allowed_students_per_course = allowed
+        self.community_risk = self.risk_trajectories[:, self.current_time + 1]
+        self.current_time += 1
+
+        alpha = np.asarray(alpha, dtype=np.float64)
+        if alpha.ndim:
+            alpha = alpha[:, None]
+        reward = np.trunc(alpha * allowed - (1 - alpha) * self.student_status).sum(axis=1)
+        done = self.current_time == self.max_weeks
+        info = {
+            "allowed": allowed,
+            "infected": self.student_status,
+            "community_risk": self.community_risk,
+        }
+        return self.get_student_status(), reward, done, info
@@ -21,10 +21,17 @@ The campus environment is composed of the following:
 """
 import gymnasium as gym
 from campus_digital_twin import campus_model, campus_state
+from campus_digital_twin.community_risk import RiskTrajectories
+from campus_digital_twin.tabulated_dynamics import DynamicsTable
+from campus_gym.envs.codec import OCCUPANCY_PERCENTAGE, ActionCodec, StateCodec
+from epidemic_models.indoor_surrogate import IndoorSurrogateDynamics
 import numpy as np
 import logging
 logging.basicConfig(filename="run.txt", level=logging.INFO)
 
+INFO_LEVELS = ['full', 'summary', 'none']
+OBSERVATION_MODES = ['multidiscrete', 'index']
+
 def get_discrete_value(number):
     """
     Converts a given number to a discrete value based on its range.
@@ -72,12 +79,13 @@ def convert_actions_to_discrete(action_or_state):
     return discrete_actions_list
 
 
-def disc_conv_action(discrete_actions_list):
+def disc_conv_action(discrete_actions_list, percentage=OCCUPANCY_PERCENTAGE):
     """
     Converts a list of discrete action values to a list of actions in the range [0, 100].
 
     Parameters:
     discrete_actions_list (list of int): A list containing discrete action values.
+    percentage (int): Percentage of a class allowed per level, ``ActionCodec.percentage``.
 
     Returns:
     list of int: A list containing converted action values in the range [0, 100].
@@ -88,7 +96,7 @@ def disc_conv_action(discrete_actions_list):
 
     # Use list comprehension to convert each discrete action value
     # in discrete_actions_list to the range [0, 100]
-    return [(int)(val * 50) for val in discrete_actions_list]
+    return [(int)(val * percentage) for val in discrete_actions_list]
 
 
 class CampusGymEnv(gym.Env):
@@ -115,11 +123,61 @@ class CampusGymEnv(gym.Env):
         """
     metadata = {'render.modes': ['bot']}
 
-    def __init__(self):
+    def __init__(self, community_risk_file=None, tabulated_dynamics=False, dynamics_cache_dir=None,
+                 indoor_surrogate_file=None, alpha=None, info_level='full',
+                 observation_mode='multidiscrete', num_courses=None, students_per_course=None, max_weeks=16,
+                 initial_infection_rate=0.2):
+        """
+        Parameters:
+        community_risk_file (str, optional): A ``.npy`` file of pre-generated community risk
+            trajectories (see ``campus_digital_twin.community_risk``). It is memory-mapped and
+            replayed by episode index instead of drawing the risk at every step.
+        tabulated_dynamics (bool): Replace the epidemic model by precomputed lookup tables
+            (see ``campus_digital_twin.tabulated_dynamics``).
+        dynamics_cache_dir (str, optional): Directory where dynamics tables are cached.
+        indoor_surrogate_file (str, optional): A surrogate of the indoor infection model built with
+            ``python -m epidemic_models.indoor_surrogate``. Used as the epidemic model when given.
+        alpha (float, optional): Reward weight used when actions are arrays of occupancy levels,
+            as produced by ``gymnasium.vector`` environments, or joint action indices.
+        info_level (str): Content of the ``info`` dict returned by ``step``: ``'full'`` (allowed and
+            infected students per course, community risk and reward), ``'summary'`` (totals over
+            courses, community risk and reward) or ``'none'`` (empty dict). ``QLearningAgent`` needs
+            ``'full'``.
+        observation_mode (str): ``'multidiscrete'`` returns the infection and community risk levels,
+            ``'index'`` their flat row-major index in ``Discrete(prod(nvec))``, as used by tabular
+            agents. ``decode_observation`` converts an index back to levels.
+        num_courses (int, optional): Number of courses. Defaults to the length of
+            ``students_per_course`` when it is a list, otherwise 1.
+        students_per_course (int or list, optional): Class size of every course, or one size for
+            all courses. Drawn from [10, 100] per course when not given.
+        max_weeks (int): Weeks per episode.
+        initial_infection_rate (float or list): Fraction of every class infected at the start.
+        """
+        if info_level not in INFO_LEVELS:
+            raise ValueError(f"Invalid info_level {info_level!r}, expected one of {INFO_LEVELS}")
+        if observation_mode not in OBSERVATION_MODES:
+            raise ValueError(f"Invalid observation_mode {observation_mode!r}, expected one of {OBSERVATION_MODES}")
+        risk_source = RiskTrajectories(community_risk_file) if community_risk_file else None
+        if isinstance(students_per_course, (list, tuple)):
+            students_per_course = [int(students) for students in students_per_course]
+            if num_courses is None:
+                num_courses = len(students_per_course)
+        if isinstance(initial_infection_rate, tuple):
+            initial_infection_rate = list(initial_infection_rate)
+        model = campus_model.CampusModel(num_courses=num_courses or 1, students_per_course=students_per_course,
+                                         max_weeks=max_weeks, initial_infection_rate=initial_infection_rate)
+        dynamics = None
+        if tabulated_dynamics:
+            dynamics = DynamicsTable(model.number_of_students_per_course(), cache_dir=dynamics_cache_dir)
+        elif indoor_surrogate_file:
+            dynamics = IndoorSurrogateDynamics(indoor_surrogate_file, model.number_of_students_per_course())
 
         # Initialize a new campus state object
-        self.campus_state = campus_state.Simulation(model=campus_model.CampusModel())
-        self.students_per_course = campus_model.CampusModel().number_of_students_per_course()
+        self.campus_state = campus_state.Simulation(model=model, risk_source=risk_source, dynamics=dynamics)
+        self.students_per_course = model.number_of_students_per_course()
+        self.alpha = alpha
+        self.info_level = info_level
+        self.observation_mode = observation_mode
         total_courses = len(self.students_per_course)
 
         # Define action and observation spaces
@@ -128,48 +186,115 @@ class CampusGymEnv(gym.Env):
 
         self.action_space = gym.spaces.MultiDiscrete([num_occupancy_levels] * total_courses) # [3,3,3]
         self.observation_space = gym.spaces.MultiDiscrete([num_infection_levels] * (total_courses + 1))
+        self.state_codec = StateCodec(self.observation_space.nvec)
+        self.action_codec = ActionCodec(self.action_space.nvec)
+        if observation_mode == 'index':
+            self.observation_space = gym.spaces.Discrete(self.state_codec.num_states)
 
     def step(self, action):
         """
             Execute one time step within the environment.
         """
 
-        # Extract alpha from the list of action and update the campus state with the action
-        #TODO: Update this to be in main instead of here
-
-        # For Deep RL
-        # alpha = action[1]
-        # self.campus_state.update_with_action(action[0])
-        # observation = np.array(self.campus_state.get_student_status())
-
-        # For Q-Learning
-        alpha = action.pop()
-        self.campus_state.update_with_action(action)
-        observation = np.array(convert_actions_to_discrete(self.campus_state.get_student_status()))
-
+        # Extract alpha from the action and update the campus state with the action
+        course_action, alpha = self.split_action(action)
+        self.campus_state.update_with_action(course_action)
+        observation = self.observe()
 
         reward = self.campus_state.get_reward(alpha)
         done = self.campus_state.is_episode_done()
         # done = self.campus_state.current_time == self.campus_state.model.get_max_weeks()
-        info = {
-            "allowed": self.campus_state.allowed_students_per_course,
-            "infected": self.campus_state.student_status,
-            "community_risk": self.campus_state.community_risk,
-            "reward": reward
-        }
+        if self.info_level == 'full':
+            info = {
+                "allowed": self.campus_state.allowed_students_per_course,
+                "infected": self.campus_state.student_status,
+                "community_risk": self.campus_state.community_risk,
+                "reward": reward
+            }
+        elif self.info_level == 'summary':
+            info = {
+                "allowed": sum(self.campus_state.allowed_students_per_course),
+                "infected": sum(self.campus_state.student_status),
+                "community_risk": self.campus_state.community_risk,
+                "reward": reward
+            }
+        else:
+            info = {}
 
         return observation, reward, done, False, info
 
-    def reset(self):
+    def observe(self):
+        """
+        Discretized observation of the campus state, equal to
+        ``np.array(convert_actions_to_discrete(self.campus_state.get_student_status()))``.
+
+        The levels are computed inline without copying the state: for arrays of a few
+        elements this is faster than ``np.clip`` into a buffer, whose dispatch overhead
+        dominates.
+        """
+        levels = [min(99, max(0, infected)) // 10 for infected in self.campus_state.student_status]
+        levels.append(min(99, max(0, int(self.campus_state.community_risk * 100))) // 10)
+        if self.observation_mode == 'index':
+            return self.state_codec.encode(levels)
+        return np.array(levels)
+
+    def decode_observation(self, index):
+        """
+        Converts a flat state index (or an array of them) back to observation levels.
+        """
+        return self.state_codec.decode(index)
+
+    def campus_parameters(self):
+        """
+        Keyword arguments that build an environment with the same campus: class sizes, weeks and
+        initial infection rates. Copies of an environment created without class sizes draw their own.
+        """
+        model = self.campus_state.model
+        return {
+            'num_courses': len(model.students_per_course),
+            'students_per_course': list(model.students_per_course),
+            'max_weeks': model.get_max_weeks(),
+            'initial_infection_rate': list(model.initial_infection_rate),
+        }
+
+    def split_action(self, action):
+        """
+        Splits an action into the allowed percentage of every course and alpha.
+
+        Accepts the Q-learning list ``[pct_1, ..., pct_n, alpha]``, the DQN tuple
+        ``(percentages, alpha)``, arrays of occupancy levels (0, 1, 2) per course, the
+        batched form used by vector environments, and joint action indices of
+        ``self.action_codec``. The last two take alpha from ``self.alpha``.
+        The action is not modified.
+        """
+        if isinstance(action, tuple):
+            percentages, alpha = action
+            return list(percentages), alpha
+        if isinstance(action, (np.ndarray, int, np.integer)):
+            if self.alpha is None:
+                raise ValueError("Occupancy level and action index actions need an environment created with alpha")
+            if isinstance(action, np.ndarray) and action.ndim:
+                return self.action_codec.scale_levels(action).tolist(), self.alpha
+            return list(self.action_codec.to_percentages(int(action))), self.alpha
+        return list(action[:-1]), action[-1]
+
+    def reset(self, seed=None, options=None):
         """
         Reset the state of the environment to an initial state.
+        Parameters: seed (int, optional): seeds the random generator of the simulation.
+                    options (dict, optional): ``episode_index`` selects the community risk
+                    trajectory to replay when the environment uses pre-generated trajectories.
         Returns:    observation (object): the initial observation.
         """
-        state = self.campus_state.reset()
+        super().reset(seed=seed)
+        if seed is not None:
+            # Vector environments seed every copy differently
+            self.campus_state.seed(seed)
+        episode_index = options.get('episode_index') if options else None
+        state = self.campus_state.reset(episode_index=episode_index)
         logging.info(f"reset state: {state}")
-        discrete_state = convert_actions_to_discrete(state)
 
-        return np.array(discrete_state), {}
+        return self.observe(), {}
 
 
     def render(self, mode='bot'):
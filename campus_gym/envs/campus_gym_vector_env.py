@@ -0,0 +1,43 @@
+"""Vectorized CampusGymEnv copies for collecting experience in parallel.
+
+``make_campus_vector_env`` is the entry point of ``CampusGymVectorEnv-v0``. By default every
+copy runs in its own worker process (``AsyncVectorEnv``) and observations are written to
+shared memory instead of being pickled back to the main process. Actions are arrays of
+occupancy levels of shape (num_envs, num_courses); the reward weight is fixed per copy with
+``alpha``.
+
+Example:
+    envs = gym.make('CampusGymVectorEnv-v0', num_envs=8, alpha=0.5)
+    observations, infos = envs.reset(seed=100)
+    observations, rewards, terminated, truncated, infos = envs.step(envs.action_space.sample())
+
+Copies of an environment created without class sizes draw their own; pass
+``env.unwrapped.campus_parameters()`` to build copies of the campus of an existing environment.
+"""
+import gymnasium as gym
+from campus_gym.envs.campus_gym_env import CampusGymEnv
+
+
+def make_campus_vector_env(num_envs=4, asynchronous=True, shared_memory=True, alpha=None, **env_kwargs):
+    """Creates ``num_envs`` copies of ``CampusGymEnv``.
+
+    Args:
+        num_envs: Number of environment copies.
+        asynchronous: Run every copy in a worker process (``AsyncVectorEnv``) instead of
+            stepping them in turn in this process (``SyncVectorEnv``).
+        shared_memory: Keep the observations of ``AsyncVectorEnv`` workers in shared memory.
+        alpha: Reward weight of every copy.
+        env_kwargs: Keyword arguments of ``CampusGymEnv``.
+    """
+    env_fns = [lambda: CampusGymEnv(alpha=alpha, **env_kwargs) for _ in range(num_envs)]
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(env_fns, shared_memory=shared_memory)
+    return gym.vector.SyncVectorEnv(env_fns)
+
+
+def check_same_campus(envs, env):
+    """Raises ``ValueError`` when a copy of the vector environment ``envs`` has another campus than ``env``."""
+    expected = env.unwrapped.campus_parameters()
+    for i, copy in enumerate(envs.call('campus_parameters')):
+        if copy != expected:
+            raise ValueError(f"Environment copy {i} has campus {copy}, the training environment {expected}")
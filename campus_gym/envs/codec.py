@@ -0,0 +1,165 @@
+"""Conversions between discrete observations/actions and flat indices.
+
+Tabular agents index their Q-tables with the row-major index of the observation levels
+and of the per-course occupancy levels, which is the position in
+``itertools.product(*[range(n) for n in nvec])``. Occupancy levels 0, 1, 2 allow 0%, 50% and
+100% of a class (``OCCUPANCY_PERCENTAGE`` per level). ``CourseSymmetry`` maps states and
+actions that differ by a permutation of equal-size courses to one canonical form.
+"""
+import numpy as np
+
+OCCUPANCY_PERCENTAGE = 50  # Percentage of a class allowed per occupancy level
+
+
+class _FlatCodec:
+    """Row-major flat index of ``MultiDiscrete`` levels."""
+
+    def __init__(self, nvec):
+        self.nvec = tuple(int(n) for n in nvec)
+        self.size = int(np.prod(self.nvec))
+        # Row-major strides, e.g. (10, 1) for nvec (10, 10)
+        self.strides = tuple(int(np.prod(self.nvec[i + 1:])) for i in range(len(self.nvec)))
+        self._strides = np.asarray(self.strides, dtype=np.int64)
+
+    def encode(self, levels):
+        """Flat index of one set of levels, or an array of indices for a batch of shape (..., len(nvec))."""
+        if isinstance(levels, np.ndarray) and levels.ndim >= 2:
+            return levels @ self._strides
+        return sum(int(level) * stride for level, stride in zip(levels, self.strides))
+
+    def decode(self, index):
+        """Levels of a flat index, shape (len(nvec),), or (n, len(nvec)) for an array of indices."""
+        levels = np.unravel_index(index, self.nvec)
+        return np.stack(levels, axis=-1)
+
+
+class StateCodec(_FlatCodec):
+    """Encodes ``MultiDiscrete`` observations as flat indices and back.
+
+    Args:
+        nvec: Number of levels of every observation entry.
+    """
+
+    def __init__(self, nvec):
+        super().__init__(nvec)
+        self.num_states = self.size
+
+    def index(self, observation):
+        """Flat index of an observation that may already be one (``observation_mode='index'``)."""
+        if isinstance(observation, (int, np.integer)):
+            return int(observation)
+        return self.encode(observation)
+
+    def indices(self, observations):
+        """Flat indices of a batch of observations, e.g. from a vector environment."""
+        observations = np.asarray(observations)
+        return observations if observations.ndim == 1 else self.encode(observations)
+
+
+class ActionCodec(_FlatCodec):
+    """Converts between joint action indices, per-course occupancy levels and percentages.
+
+    The decode tables ``levels`` and ``percentages`` have shape (num_actions, num_courses),
+    so decoding one action or a batch of actions is a single array index.
+
+    Args:
+        nvec: Number of occupancy levels of every course.
+        percentage: Percentage of a class allowed per occupancy level.
+    """
+
+    def __init__(self, nvec, percentage=OCCUPANCY_PERCENTAGE):
+        super().__init__(nvec)
+        self.num_actions = self.size
+        self.percentage = percentage
+        self.levels = super().decode(np.arange(self.num_actions))
+        self.percentages = self.levels * percentage
+        # Python lists of the percentages, passed to the environment without conversion
+        self._percentage_lists = self.percentages.tolist()
+
+    def decode(self, index):
+        """Occupancy levels of a joint action index, or of an array of indices."""
+        return self.levels[index]
+
+    def to_percentages(self, index):
+        """Allowed percentage of every course: a list for one action index, an array for a batch."""
+        if isinstance(index, (int, np.integer)):
+            return self._percentage_lists[index]
+        return self.percentages[index]
+
+    def scale_levels(self, levels):
+        """Percentages of per-course occupancy levels, a list for a list and an array for an array."""
+        if isinstance(levels, np.ndarray):
+            return levels * self.percentage
+        return [int(level) * self.percentage for level in levels]
+
+    def unscale_percentages(self, percentages):
+        """Occupancy levels of per-course percentages, the inverse of ``scale_levels``."""
+        if isinstance(percentages, np.ndarray):
+            return percentages // self.percentage
+        return [int(percentage) // self.percentage for percentage in percentages]
+
+
+class CourseSymmetry:
+    """Canonical states and actions of courses that are exchangeable because they have the same size.
+
+    Permuting courses of the same size, together with their occupancy levels, gives an
+    equivalent state and action. The canonical form sorts the infected levels within every
+    group of equal-size courses (stable, so ties keep the course order) and applies the same
+    permutation to the action. Canonical states are numbered 0 .. ``num_canonical_states`` - 1.
+    Courses with the same size and the same infected level keep their order, so actions that
+    only swap the levels of such courses stay distinct canonical actions.
+
+    The tables are computed once for all states:
+
+    - ``state_rows`` (num_states,): canonical state number of every state,
+    - ``permutation_ids`` (num_states,): which of ``permutations`` sorts the state,
+    - ``to_canonical`` (num_permutations, num_actions): canonical action of every action,
+    - ``from_canonical`` (num_permutations, num_actions): its inverse.
+
+    Args:
+        students_per_course: Class size of every course.
+        state_nvec: Observation levels of every course and of the community risk (last).
+        action_nvec: Occupancy levels of every course.
+    """
+
+    def __init__(self, students_per_course, state_nvec, action_nvec):
+        self.students_per_course = [int(n) for n in students_per_course]
+        self.state_codec = StateCodec(state_nvec)
+        self.action_codec = ActionCodec(action_nvec)
+        num_courses = len(self.students_per_course)
+        sizes = np.array(self.students_per_course)
+        self.groups = [np.flatnonzero(sizes == size) for size in dict.fromkeys(self.students_per_course)]
+
+        # Course order that sorts every group of every state, shape (num_states, num_courses)
+        levels = self.state_codec.decode(np.arange(self.state_codec.num_states))
+        order = np.tile(np.arange(num_courses), (len(levels), 1))
+        for group in self.groups:
+            if len(group) > 1:
+                order[:, group] = group[np.argsort(levels[:, group], axis=1, kind='stable')]
+        canonical_levels = levels.copy()
+        canonical_levels[:, :num_courses] = np.take_along_axis(levels[:, :num_courses], order, axis=1)
+
+        canonical_states, self.state_rows = np.unique(self.state_codec.encode(canonical_levels), return_inverse=True)
+        self.num_canonical_states = len(canonical_states)
+        # Distinct orders, found through one integer per order (much faster than np.unique(axis=0))
+        order_codes = order @ (num_courses ** np.arange(num_courses))
+        _, first, self.permutation_ids = np.unique(order_codes, return_index=True, return_inverse=True)
+        self.permutations = order[first]
+        self.permutation_ids = self.permutation_ids.reshape(-1)
+        self.state_rows = self.state_rows.reshape(-1)
+
+        # Course j of the canonical action takes the level of course permutation[j]
+        action_levels = self.action_codec.levels
+        self.to_canonical = np.stack([self.action_codec.encode(action_levels[:, permutation])
+                                      for permutation in self.permutations])
+        self.from_canonical = np.argsort(self.to_canonical, axis=1)
+
+    def canonical(self, state, action=None):
+        """Canonical state number and, if given, canonical action of a flat state (and action) index."""
+        if action is None:
+            return self.state_rows[state]
+        return self.state_rows[state], self.to_canonical[self.permutation_ids[state], action]
+
+    def action_of(self, state, canonical_action):
+        """Action in the course order of ``state`` of a canonical action, e.g. the greedy one."""
+        return self.from_canonical[self.permutation_ids[state], canonical_action]
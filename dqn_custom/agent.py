@@ -8,8 +8,14 @@ import logging
 from collections import deque
 import random
 import itertools
+import gymnasium as gym
+from campus_gym.envs.campus_gym_vector_env import check_same_campus
 from tqdm import tqdm
 from .utilities import load_config
+from training.exploration import ExplorationRateDecay
+from profiling.phase_timer import PhaseTimer
+from profiling.memory import MemoryTracker
+from training.early_stopping import EarlyStopping
 from .visualizer import visualize_all_states, visualize_q_table, visualize_variance_in_rewards_heatmap, \
     visualize_explained_variance, visualize_variance_in_rewards, visualize_infected_vs_community_risk_table, \
     states_visited_viz
@@ -36,6 +42,9 @@ def set_seed(seed):
 # Set seed for reproducibility
 set_seed(100)  # Replace 42 with your desired seed value
 
+# Observations whose greedy action the policy stability criterion of early stopping compares
+POLICY_STATES = 10000
+
 
 def log_all_states_visualizations(q_table, all_states, states, run_name, max_episodes, alpha, results_subdirectory):
     file_paths = visualize_all_states(q_table, all_states, states, run_name, max_episodes, alpha, results_subdirectory)
@@ -65,98 +74,6 @@ def log_states_visited(states, visit_counts, alpha, results_subdirectory):
             dim = path.split('infected_dim_')[-1].split('.')[0]
             wandb.log({f"States Visited (Infected Dim {dim})": wandb.Image(path)})
 
-class ExplorationRateDecay:
-    def __init__(self, max_episodes, min_exploration_rate, initial_exploration_rate):
-        self.max_episodes = max_episodes
-        self.min_exploration_rate = min_exploration_rate
-        self.initial_exploration_rate = initial_exploration_rate
-        self.current_decay_function = 1  # Variable to switch between different decay functions
-
-    def set_decay_function(self, decay_function_number):
-        self.current_decay_function = decay_function_number
-
-    def get_exploration_rate(self, episode):
-        if self.current_decay_function == 1:  # Exponential Decay
-            exploration_rate = self.initial_exploration_rate * np.exp(-episode / self.max_episodes)
-
-        elif self.current_decay_function == 2:  # Linear Decay
-            exploration_rate = self.initial_exploration_rate - (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (episode / self.max_episodes)
-
-        elif self.current_decay_function == 3:  # Polynomial Decay
-            exploration_rate = self.initial_exploration_rate * (1 - episode / self.max_episodes) ** 2
-
-        elif self.current_decay_function == 4:  # Inverse Time Decay
-            exploration_rate = self.initial_exploration_rate / (1 + episode)
-
-        elif self.current_decay_function == 5:  # Sine Wave Decay
-            exploration_rate = self.min_exploration_rate + 0.5 * (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (
-                                           1 + np.sin(np.pi * episode / self.max_episodes))
-
-        elif self.current_decay_function == 6:  # Logarithmic Decay
-            exploration_rate = self.initial_exploration_rate - (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.log(episode + 1) / np.log(
-                self.max_episodes + 1)
-
-        elif self.current_decay_function == 7:  # Hyperbolic Tangent Decay
-            exploration_rate = self.min_exploration_rate + 0.5 * (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (
-                                           1 - np.tanh(episode / self.max_episodes))
-        elif self.current_decay_function == 8:  # Square Root Decay
-            exploration_rate = self.initial_exploration_rate * (1 - np.sqrt(episode / self.max_episodes))
-        elif self.current_decay_function == 9:  # Stepwise Decay
-            steps = 10
-            step_size = (self.initial_exploration_rate - self.min_exploration_rate) / steps
-            exploration_rate = self.initial_exploration_rate - (episode // (self.max_episodes // steps)) * step_size
-        elif self.current_decay_function == 10:  # Inverse Square Root Decay
-            exploration_rate = self.initial_exploration_rate / np.sqrt(episode + 1)
-        elif self.current_decay_function == 11:  # Sigmoid Decay
-            # exploration_rate = self.min_exploration_rate + (
-            #             self.initial_exploration_rate - self.min_exploration_rate) / (
-            #                                1 + np.exp(episode - self.max_episodes / 2))
-            midpoint = self.max_episodes / 2
-            smoothness = self.max_episodes / 10  # Adjust this divisor to change smoothness
-            exploration_rate = self.min_exploration_rate + (
-                    self.initial_exploration_rate - self.min_exploration_rate) / (
-                                       1 + np.exp((episode - midpoint) / smoothness))
-
-        elif self.current_decay_function == 12:  # Quadratic Decay
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** 2)
-        elif self.current_decay_function == 13:  # Cubic Decay
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** 3)
-        elif self.current_decay_function == 14:  # Sine Squared Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.sin(
-                np.pi * episode / self.max_episodes) ** 2
-        elif self.current_decay_function == 15:  # Cosine Squared Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.cos(
-                np.pi * episode / self.max_episodes) ** 2
-        elif self.current_decay_function == 16:  # Double Exponential Decay
-            exploration_rate = self.initial_exploration_rate * np.exp(-np.exp(episode / self.max_episodes))
-        elif self.current_decay_function == 17:  # Log-Logistic Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) / (1 + np.log(episode + 1))
-        elif self.current_decay_function == 18:  # Harmonic Series Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) / (
-                                           1 + np.sum(1 / np.arange(1, episode + 2)))
-        elif self.current_decay_function == 19:  # Piecewise Linear Decay
-            if episode < self.max_episodes / 2:
-                exploration_rate = self.initial_exploration_rate - (
-                            self.initial_exploration_rate - self.min_exploration_rate) * (
-                                               2 * episode / self.max_episodes)
-            else:
-                exploration_rate = self.min_exploration_rate
-        elif self.current_decay_function == 20:  # Custom Polynomial Decay
-            p = 3  # Change the power for different polynomial behaviors
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** p)
-        else:
-            raise ValueError("Invalid decay function number")
-
-        return exploration_rate
-
 
 class DeepQNetwork(nn.Module):
     def __init__(self, input_dim, hidden_dim, out_dim):
@@ -215,12 +132,23 @@ class DQNCustomAgent:
 
         # Initialize the neural network
         self.input_dim = len(env.reset()[0])
-        self.output_dim = env.action_space.nvec[0]
         self.hidden_dim = self.agent_config['agent']['hidden_units']
-        self.num_courses = self.env.action_space.nvec[0]
+        self.num_courses = len(self.env.action_space.nvec)
+        self.num_levels = int(env.action_space.nvec[0])
+        # shared: one head of num_levels values used for every course; factored: one branch of
+        # num_levels values per course, summed over courses for the TD target
+        self.action_values = self.agent_config['agent'].get('action_values', 'shared')
+        if self.action_values == 'factored':
+            self.output_dim = self.num_levels * self.num_courses
+        else:
+            self.output_dim = self.num_levels
 
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = DeepQNetwork(self.input_dim, self.hidden_dim, self.output_dim)
+        # model.pt (or its directory) the network starts from instead of a random initialization
+        self.warm_start = self.agent_config['agent'].get('warm_start')
+        if self.warm_start:
+            self.warm_start_model(self.model)
         self.optimizer = optim.Adam(self.model.parameters(), lr=self.agent_config['agent']['learning_rate'])
 
         # Initialize agent-specific configurations and variables
@@ -238,6 +166,8 @@ class DQNCustomAgent:
 
         self.possible_actions = [list(range(0, (k))) for k in self.env.action_space.nvec]
         self.all_actions = [str(i) for i in list(itertools.product(*self.possible_actions))]
+        # Conversion between occupancy levels and the percentages passed to the environment
+        self.action_codec = env.unwrapped.action_codec
 
         # moving average for early stopping criteria
         self.moving_average_window = 100  # Number of episodes to consider for moving average
@@ -263,45 +193,193 @@ class DQNCustomAgent:
         self.decay_handler = ExplorationRateDecay(self.max_episodes, self.min_exploration_rate, self.exploration_rate)
         self.decay_function = self.agent_config['agent']['e_decay_function']
 
+        # Number of environment copies collecting experience in parallel
+        self.num_envs = self.agent_config['agent'].get('num_envs', 1)
+
+        # Time spent per phase of the training loop
+        self.phase_timers = self.agent_config['agent'].get('phase_timers', False)
+        self.phase_timer = PhaseTimer(self.phase_timers)
+
+        # Memory usage sampled every track_memory training episodes, 0 disables it
+        self.track_memory = self.agent_config['agent'].get('track_memory', 0)
+        self.memory_tracker = MemoryTracker(self.track_memory)
+
+        # Convergence-based early stopping, and the Optuna trial of the run (set by main.py optuna)
+        self.early_stopping_config = self.agent_config['agent'].get('early_stopping')
+        self.trial = None
+        self.early_stopping = EarlyStopping.from_config(self.early_stopping_config)
+        self.policy_states = None
+
+    def warm_start_model(self, model):
+        """Loads the parameters of the ``warm_start`` model into a new network.
+
+        The saved network must have the same courses and hidden units. The output layer of a
+        shared head is repeated for every course of a factored one, and a factored head is
+        averaged over the courses for a shared one.
+        """
+        path = self.warm_start
+        if os.path.isdir(path):
+            path = os.path.join(path, 'model.pt')
+        state_dict = torch.load(path, map_location='cpu')
+        own = model.state_dict()
+        for name in ('out.weight', 'out.bias'):
+            source = state_dict.get(name)
+            if source is None or source.shape == own[name].shape:
+                continue
+            if len(source) == self.num_levels and len(own[name]) == self.num_levels * self.num_courses:
+                # Factored outputs are level-major (level * num_courses + course)
+                state_dict[name] = source.repeat_interleave(self.num_courses, dim=0)
+            elif len(source) == self.num_levels * self.num_courses and len(own[name]) == self.num_levels:
+                state_dict[name] = source.view(self.num_levels, self.num_courses, *source.shape[1:]).mean(1)
+        mismatched = [name for name, value in state_dict.items()
+                      if name not in own or value.shape != own[name].shape]
+        if mismatched:
+            raise ValueError(f"{path} does not fit the network of {self.num_courses} courses and "
+                             f"{self.hidden_dim} hidden units: {mismatched}")
+        model.load_state_dict(state_dict)
+        print(f"Model warm-started from {path}")
+
+    def new_early_stopping(self):
+        """A fresh early stopper of the agent config for the next training loop."""
+        self.early_stopping = EarlyStopping.from_config(self.early_stopping_config, self.trial)
+        return self.early_stopping
+
+    def greedy_policy(self):
+        """Greedy joint action of a fixed set of observations, for the policy stability criterion.
+
+        All observations with up to ``POLICY_STATES`` of them, a fixed sample otherwise.
+        """
+        if self.policy_states is None:
+            state_codec = self.env.unwrapped.state_codec
+            states = np.arange(state_codec.num_states)
+            if len(states) > POLICY_STATES:
+                states = np.random.default_rng(0).choice(states, POLICY_STATES, replace=False)
+            self.policy_states = torch.FloatTensor(state_codec.decode(states))
+        with torch.no_grad():
+            levels = self.course_q_values(self.model(self.policy_states)).max(2)[1].numpy()
+        return self.action_codec.encode(levels)
+
+    def report_early_stopping(self, loop_name):
+        """Saves the checks of early stopping next to the training log and logs the stopping episode."""
+        stopper = self.early_stopping
+        stopper.save(self.results_subdirectory, loop_name)
+        if stopper.stop_episode is not None:
+            print(f"Early stopping after episode {stopper.stop_episode} of {self.max_episodes}")
+            wandb.log({'Stopping Episode': stopper.stop_episode})
+
+    def get_final_performance(self):
+        """Moving average of the average weekly rewards at the end of training, the objective of main.py optuna."""
+        return self.early_stopping.moving_average()
+
     def select_action(self, state):
         if random.random() < self.exploration_rate:
-            return [random.randint(0, self.output_dim - 1) * 50 for _ in range(self.num_courses)]
+            return self.action_codec.scale_levels([random.randint(0, self.num_levels - 1) for _ in range(self.num_courses)])
         else:
             with torch.no_grad():
                 state = torch.FloatTensor(state).unsqueeze(0)
-                q_values = self.model(state)
+                q_values = self.course_q_values(self.model(state))[0]
                 # print(f"Q-values shape in select_action: {q_values.shape}")
 
-                # Repeat Q-values for each course
-                q_values = q_values.repeat(1, self.num_courses).view(self.num_courses, -1)
-
                 actions = q_values.max(1)[1].tolist()
-                return [action * 50 for action in actions]
+                return self.action_codec.scale_levels(actions)
+
+    def select_actions(self, states):
+        """Batched ``select_action``: occupancy levels of shape (num_envs, num_courses)."""
+        num_envs, num_courses = len(states), len(self.env.action_space.nvec)
+        with torch.no_grad():
+            greedy = self.course_q_values(self.model(torch.FloatTensor(states))).max(2)[1].numpy()
+        random_actions = np.random.randint(0, self.num_levels, size=(num_envs, num_courses))
+        explore = np.random.random(num_envs) < self.exploration_rate
+        return np.where(explore[:, None], random_actions, greedy)
+
+    def course_q_values(self, q_values):
+        """Network outputs as action values per course, shape (batch, num_courses, num_levels).
+
+        A factored head orders its outputs level-major (level * num_courses + course), the
+        layout read by ``visualize_all_states``; a shared head is used for every course.
+        """
+        if self.action_values == 'factored':
+            return q_values.view(-1, self.num_levels, self.num_courses).transpose(1, 2)
+        return q_values.unsqueeze(1).expand(-1, self.num_courses, -1)
+
+    def optimize_model(self):
+        """One gradient step on a batch sampled from the replay memory.
+
+        Returns:
+            The loss and the Q-values of the sampled actions summed over courses.
+        """
+        batch = random.sample(self.replay_memory, self.batch_size)
+        states, actions, rewards_batch, next_states, dones = map(np.array, zip(*batch))
+
+        states = torch.FloatTensor(states)
+        actions = torch.LongTensor(actions)
+        rewards_batch = torch.FloatTensor(rewards_batch)
+        next_states = torch.FloatTensor(next_states)
+        dones = torch.FloatTensor(dones)
+
+        # Action values per course, shape [batch_size, num_courses, num_levels]
+        current_q_values = self.course_q_values(self.model(states))
+
+        # Gather the Q-values of the taken level of every course, shape [batch_size, num_courses]
+        current_q_values = current_q_values.gather(2, actions.unsqueeze(2)).squeeze(2)
+
+        next_q_values = self.course_q_values(self.model(next_states)).max(2)[0]
+
+        # Sum Q-values across courses
+        current_q_values = current_q_values.sum(1)
+        next_q_values = next_q_values.sum(1)
+
+        target_q_values = rewards_batch + (1 - dones) * self.discount_factor * next_q_values
+
+        loss = nn.MSELoss()(current_q_values, target_q_values)
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        return loss, current_q_values
+
     def train(self, alpha):
+        if self.num_envs > 1:
+            return self.train_parallel(alpha)
+
         pbar = tqdm(total=self.max_episodes, desc="Training Progress", leave=True)
 
         actual_rewards = []
         predicted_rewards = []
         visited_state_counts = {}
         explained_variance_per_episode = []
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
+        memory = self.memory_tracker = MemoryTracker(self.track_memory)
+        memory.track('replay_memory', lambda: self.replay_memory)
+        memory.track('network', lambda: (list(self.model.parameters()), self.optimizer.state_dict()['state']))
+        memory.track('history', lambda: (actual_rewards, predicted_rewards, visited_state_counts,
+                                         explained_variance_per_episode))
+        memory.start()
+        stopper = self.new_early_stopping()
 
         for episode in range(self.max_episodes):
+            timer.mark()
             self.decay_handler.set_decay_function(self.decay_function)
             state, _ = self.env.reset()
             state = np.array(state, dtype=np.float32)
+            timer.lap('reset')
             total_reward = 0
             done = False
             episode_rewards = []
             visited_states = []
             episode_q_values = []
+            episode_losses = []
 
             while not done:
+                timer.mark()
                 actions = self.select_action(state)
+                timer.lap('action_selection')
                 next_state, reward, done, _, info = self.env.step((actions, alpha))
                 next_state = np.array(next_state, dtype=np.float32)
+                timer.lap('env_step')
 
                 # When storing in replay memory, store the original action indices
-                original_actions = [action // 50 for action in actions]
+                original_actions = self.action_codec.unscale_percentages(actions)
                 self.replay_memory.append((state, original_actions, reward, next_state, done))
 
                 state = next_state
@@ -312,55 +390,13 @@ class DQNCustomAgent:
                 visited_states.append(state_tuple)
                 visited_state_counts[state_tuple] = visited_state_counts.get(state_tuple, 0) + 1
                 # print(info)
+                timer.lap('bookkeeping')
 
                 if len(self.replay_memory) > self.batch_size:
-                    batch = random.sample(self.replay_memory, self.batch_size)
-                    states, actions, rewards_batch, next_states, dones = map(np.array, zip(*batch))
-
-                    states = torch.FloatTensor(states)
-                    actions = torch.LongTensor(actions)
-                    rewards_batch = torch.FloatTensor(rewards_batch)
-                    next_states = torch.FloatTensor(next_states)
-                    dones = torch.FloatTensor(dones)
-
-                    current_q_values = self.model(states)
-                    # print(f"Current Q-values shape: {current_q_values.shape}")
-                    # print(f"Actions shape: {actions.shape}")
-                    # print(f"Sample of actions: {actions[:5]}")
-
-                    # Handle multi-course scenario
-                    batch_size, num_actions = current_q_values.shape
-                    num_courses = actions.shape[1]
-
-                    # Reshape current_q_values to [batch_size * num_courses, num_actions]
-                    current_q_values = current_q_values.repeat(1, num_courses).view(-1, num_actions)
-
-                    # Flatten actions to [batch_size * num_courses]
-                    actions = actions.view(-1)
-
-                    # Gather the Q-values for the taken actions
-                    current_q_values = current_q_values.gather(1, actions.unsqueeze(1)).squeeze(1)
-
-                    # Reshape back to [batch_size, num_courses]
-                    current_q_values = current_q_values.view(batch_size, num_courses)
-
-                    next_q_values = self.model(next_states)
-                    next_q_values = next_q_values.repeat(1, num_courses).view(-1, num_actions).max(1)[0].view(
-                        batch_size, num_courses)
-
-                    # Sum Q-values across courses
-                    current_q_values = current_q_values.sum(1)
-                    next_q_values = next_q_values.sum(1)
-
-                    target_q_values = rewards_batch + (1 - dones) * self.discount_factor * next_q_values
-
-                    loss = nn.MSELoss()(current_q_values, target_q_values)
-
-                    self.optimizer.zero_grad()
-                    loss.backward()
-                    self.optimizer.step()
-
+                    loss, current_q_values = self.optimize_model()
                     episode_q_values.extend(current_q_values.detach().numpy().tolist())
+                    episode_losses.append(loss.item())
+                    timer.lap('update')
 
             actual_rewards.append(episode_rewards)
             predicted_rewards.append(episode_q_values)
@@ -372,6 +408,9 @@ class DQNCustomAgent:
             explained_variance_per_episode.append(explained_variance)
 
             self.exploration_rate = self.decay_handler.get_exploration_rate(episode)
+            # The loss plays the part of the TD error
+            stop = stopper.update(episode, np.mean(episode_rewards),
+                                  np.mean(episode_losses) if episode_losses else None, self.greedy_policy)
 
             wandb.log({
                 "total_reward": total_reward,
@@ -379,17 +418,30 @@ class DQNCustomAgent:
                 "learning_rate": self.scheduler.get_last_lr()[0],
                 "loss": loss.item() if 'loss' in locals() else 0,
                 "avg_reward": np.mean(episode_rewards),
+                **stopper.metrics(),
             })
 
             pbar.update(1)
             pbar.set_description(
                 f"Total Reward: {total_reward:.2f}, Epsilon: {self.exploration_rate:.2f}")
+            timer.lap('logging')
+            if timer.enabled:
+                timer.end_episode()
+                wandb.log(timer.episode_metrics())
+            memory_metrics = memory.sample(episode)
+            if memory_metrics:
+                wandb.log(memory_metrics)
+            if stop:
+                break
 
         pbar.close()
+        self.report_early_stopping('train')
 
         # After training, save the model
+        timer.mark()
         model_file_path = os.path.join(self.model_subdirectory, 'model.pt')
         torch.save(self.model.state_dict(), model_file_path)
+        timer.lap('save')
 
         # Visualization and logging
         saved_model = load_saved_model(self.model_directory, self.agent_type, self.run_name, self.timestamp,
@@ -415,7 +467,104 @@ class DQNCustomAgent:
         explained_variance_path = os.path.join(self.results_subdirectory, 'explained_variance.png')
         visualize_explained_variance(explained_variance_per_episode, explained_variance_path)
         wandb.log({"Explained Variance": [wandb.Image(explained_variance_path)]})
+        timer.lap('plotting')
+        self.report_phase_timings('train')
+        # Last sample after saving and plotting, which open the figures
+        memory.sample(self.max_episodes, force=True)
+        memory.stop()
+        self.report_memory('train')
+
+        return self.model
+
+    def make_vector_env(self, alpha):
+        """``num_envs`` copies of the training environment, stepped in worker processes."""
+        env_kwargs = dict(self.env.spec.kwargs) if self.env.spec else {}
+        # The campus of the training environment, not class sizes drawn by every copy
+        env_kwargs.update(self.env.unwrapped.campus_parameters())
+        envs = gym.make('CampusGymVectorEnv-v0', num_envs=self.num_envs, alpha=alpha, **env_kwargs)
+        check_same_campus(envs, self.env)
+        return envs
+
+    def train_parallel(self, alpha):
+        """Train the agent on ``num_envs`` environment copies.
+
+        Every step adds one transition per copy to the replay memory and takes one gradient
+        step. Copies reset automatically at the end of their episode, and every finished
+        episode counts towards ``max_episodes``. The copies finish their episodes together, so
+        a phase timer episode covers one episode of every copy.
+        """
+        envs = self.make_vector_env(alpha)
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
+        episode_rewards = [[] for _ in range(self.num_envs)]
+        episode_losses = [[] for _ in range(self.num_envs)]
+        completed = 0
+        stopper = self.new_early_stopping()
+        stop = False
+        pbar = tqdm(total=self.max_episodes, desc="Training Progress", leave=True)
 
+        self.decay_handler.set_decay_function(self.decay_function)
+        timer.mark()
+        states, _ = envs.reset(seed=100)
+        states = states.astype(np.float32)
+        timer.lap('reset')
+        while completed < self.max_episodes and not stop:
+            timer.mark()
+            actions = self.select_actions(states)
+            timer.lap('action_selection')
+            next_states, rewards, dones, _, infos = envs.step(actions)
+            next_states = next_states.astype(np.float32)
+            timer.lap('env_step')
+
+            # After an automatic reset the transition ends in the last observation of the episode
+            final_states = next_states.copy()
+            for i in np.flatnonzero(dones):
+                final_states[i] = infos['final_observation'][i]
+            for i in range(self.num_envs):
+                self.replay_memory.append((states[i], actions[i].tolist(), rewards[i], final_states[i], dones[i]))
+                episode_rewards[i].append(rewards[i])
+            timer.lap('bookkeeping')
+
+            loss = None
+            if len(self.replay_memory) > self.batch_size:
+                loss, _ = self.optimize_model()
+                for losses in episode_losses:
+                    losses.append(loss.item())
+            timer.lap('update')
+
+            for i in np.flatnonzero(dones):
+                total_reward = sum(episode_rewards[i])
+                self.exploration_rate = self.decay_handler.get_exploration_rate(completed)
+                stop = stopper.update(completed, np.mean(episode_rewards[i]),
+                                      np.mean(episode_losses[i]) if episode_losses[i] else None, self.greedy_policy)
+                wandb.log({
+                    "total_reward": total_reward,
+                    "exploration_rate": self.exploration_rate,
+                    "learning_rate": self.scheduler.get_last_lr()[0],
+                    "loss": loss.item() if loss is not None else 0,
+                    "avg_reward": np.mean(episode_rewards[i]),
+                    **stopper.metrics(),
+                })
+                episode_rewards[i], episode_losses[i] = [], []
+                completed += 1
+                pbar.update(1)
+                if stop:
+                    break
+            states = next_states
+            timer.lap('logging')
+            if timer.enabled and dones.any():
+                timer.end_episode()
+                wandb.log(timer.episode_metrics())
+        pbar.close()
+        envs.close()
+        self.report_early_stopping('train')
+
+        timer.mark()
+        model_file_path = os.path.join(self.model_subdirectory, 'model.pt')
+        torch.save(self.model.state_dict(), model_file_path)
+        timer.lap('save')
+        self.log_all_states_visualizations(self.model, self.run_name, self.max_episodes, alpha, self.results_subdirectory)
+        timer.lap('plotting')
+        self.report_phase_timings('train')
         return self.model
 
     def generate_all_states(self):
@@ -441,7 +590,7 @@ class DQNCustomAgent:
         all_states = self.generate_all_states()
         num_courses = len(self.env.students_per_course)
         file_paths = visualize_all_states(model, all_states, run_name, num_courses, max_episodes, alpha,
-                                          results_subdirectory, self.env.students_per_course)
+                                          results_subdirectory, self.env.students_per_course, self.action_codec)
         print("file_paths: ", file_paths)
 
         # Log all generated visualizations
@@ -458,6 +607,23 @@ class DQNCustomAgent:
         #     elif "vs_course" in path:
         #         courses = path.split('course_')[1].split('.')[0]
         #         wandb.log({f"All States Visualization (Course {courses})": wandb.Image(path)})
+    def report_phase_timings(self, loop_name):
+        """Logs the phase timings of a finished loop and saves them to ``phase_timings_<loop_name>.json``."""
+        if not self.phase_timer.enabled:
+            return
+        self.phase_timer.save_summary(os.path.join(self.results_subdirectory, f'phase_timings_{loop_name}.json'))
+        wandb.log(self.phase_timer.summary_metrics(prefix=f'timing_summary/{loop_name}/'))
+        print(self.phase_timer.format_summary())
+
+    def report_memory(self, loop_name):
+        """Saves the memory samples of a finished loop to the results directory and logs their peaks."""
+        memory = self.memory_tracker
+        if not memory.enabled or not memory.samples:
+            return
+        memory.save(self.results_subdirectory, loop_name)
+        wandb.log(memory.summary_metrics(prefix=f'memory_summary/{loop_name}/'))
+        print(memory.format_summary())
+
     def log_states_visited(self, states, visit_counts, alpha, results_subdirectory):
         file_paths = states_visited_viz(states, visit_counts, alpha, results_subdirectory)
         print("file_paths: ", file_paths)
@@ -499,6 +665,8 @@ class DQNCustomAgent:
         self.replay_memory = deque(maxlen=self.agent_config['agent']['replay_memory_capacity'])
         self.reward_window = deque(maxlen=self.moving_average_window)
         self.model = DeepQNetwork(self.input_dim, self.hidden_dim, self.output_dim)
+        if self.warm_start:
+            self.warm_start_model(self.model)
         self.target_model = DeepQNetwork(self.input_dim, self.hidden_dim, self.output_dim)
         self.target_model.load_state_dict(self.model.state_dict())
         self.optimizer = optim.Adam(self.model.parameters(), lr=self.agent_config['agent']['learning_rate'])
@@ -508,6 +676,7 @@ class DQNCustomAgent:
 
         pbar = tqdm(total=self.max_episodes, desc=f"Training Run {seed}", leave=True)
         visited_state_counts = {}
+        stopper = self.new_early_stopping()
 
         for episode in range(self.max_episodes):
             self.decay_handler.set_decay_function(self.decay_function)
@@ -517,6 +686,7 @@ class DQNCustomAgent:
             done = False
             episode_rewards = []
             visited_states = []
+            episode_losses = []
             loss = torch.tensor(0.0)  # Initialize loss here
             while not done:
                 action = self.select_action(state)
@@ -524,7 +694,7 @@ class DQNCustomAgent:
                 next_state = np.array(next_state, dtype=np.float32)
 
                 # When storing in replay memory, store the original action indices
-                original_actions = [action // 50 for action in actions]
+                original_actions = self.action_codec.unscale_percentages(action)
                 self.replay_memory.append((state, original_actions, reward, next_state, done))
                 state = next_state
                 total_reward += reward
@@ -544,11 +714,10 @@ class DQNCustomAgent:
                     next_states = torch.FloatTensor(next_states)
                     dones = torch.FloatTensor(dones)
 
-                    current_q_values = self.model(states)
-                    current_q_values = current_q_values.view(self.batch_size, self.num_courses, -1)
+                    current_q_values = self.course_q_values(self.model(states))
                     current_q_values = current_q_values.gather(2, actions.unsqueeze(2)).squeeze(2)
 
-                    next_q_values = self.model(next_states).view(self.batch_size, self.num_courses, -1).max(2)[0]
+                    next_q_values = self.course_q_values(self.model(next_states)).max(2)[0]
                     target_q_values = rewards + (1 - dones) * self.discount_factor * next_q_values.sum(dim=1)
 
                     loss = nn.MSELoss()(current_q_values.sum(dim=1), target_q_values)
@@ -556,6 +725,7 @@ class DQNCustomAgent:
                     self.optimizer.zero_grad()
                     loss.backward()
                     self.optimizer.step()
+                    episode_losses.append(loss.item())
 
             self.run_rewards_per_episode.append(episode_rewards)
             self.exploration_rate = self.decay_handler.get_exploration_rate(episode)
@@ -563,6 +733,9 @@ class DQNCustomAgent:
             pbar.update(1)
             pbar.set_description(
                 f"Loss:{loss}, Total Reward: {total_reward:.2f}, Epsilon: {self.exploration_rate:.2f}")
+            if stopper.update(episode, np.mean(episode_rewards), np.mean(episode_losses) if episode_losses else None,
+                              self.greedy_policy):
+                break
 
         pbar.close()
 
@@ -761,13 +934,22 @@ class DQNCustomAgent:
     def multiple_runs(self, num_runs, alpha_t, beta_t):
         returns_per_episode = []
 
+        stop_episodes = []
+
         for run in range(num_runs):
             seed = int(run)
             returns = self.train_single_run(seed, alpha_t)
             returns_per_episode.append(returns)
-
-        # Ensure returns_per_episode is correctly structured
-        returns_per_episode = np.array(returns_per_episode)  # Shape: (num_runs, max_episodes, episode_length)
+            stop_episodes.append(self.early_stopping.stop_episode)
+            self.early_stopping.save(self.results_subdirectory, f'run_{run}')
+
+        # Runs stopped early are compared over the episodes all runs trained
+        episodes = min(len(returns) for returns in returns_per_episode)
+        if any(stop is not None for stop in stop_episodes):
+            print(f"Stopping episodes of the runs: {stop_episodes}, comparing the first {episodes} episodes")
+            wandb.log({'Stopping Episodes': stop_episodes, 'Compared Episodes': episodes})
+        # Shape: (num_runs, episodes, episode_length)
+        returns_per_episode = np.array([returns[:episodes] for returns in returns_per_episode])
 
         output_path_mean = os.path.join(self.results_subdirectory, 'tolerance_interval_mean.png')
         output_path_median = os.path.join(self.results_subdirectory, 'tolerance_interval_median.png')
@@ -25,7 +25,7 @@ import itertools
 
 
 def visualize_all_states(model, all_states, run_name, num_courses, max_episodes, alpha, results_subdirectory,
-                         students_per_course):
+                         students_per_course, action_codec):
     method_name = "viz all states"
     file_paths = []
     colors = ['#FF9999', '#66B2FF', '#99FF99']  # Light Red, Light Blue, Green
@@ -71,7 +71,7 @@ def visualize_all_states(model, all_states, run_name, num_courses, max_episodes,
         ax.set_yticklabels([f'{int(y)}' for y in ax.get_yticks()])
 
     # Create a custom legend
-    legend_elements = [mpatches.Patch(facecolor=colors[i], label=f'Allow {i * 50}%') for i in range(3)]
+    legend_elements = [mpatches.Patch(facecolor=colors[i], label=f'Allow {i * action_codec.percentage}%') for i in range(3)]
     fig.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.05),
                ncol=3, fontsize='large')
 
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from scipy.stats import binom
 
 def estimate_infected_students(current_infected, allowed_per_course, community_risk, total_students):
@@ -127,3 +128,100 @@ def get_infected_students(current_infected_students: list, allowed_students_per_
 
     return infected_students
 
+
+def calculate_indoor_infection_prob_vectorized(room_capacity, initial_infection_prob, room_area=ROOM_AREA,
+                                               room_ach=ROOM_ACH, breath_rate=BREATH_RATE, d0=D0):
+    """Array version of ``calculate_indoor_infection_prob``.
+
+    Args:
+        room_capacity: Integer array of room capacities.
+        initial_infection_prob: Array of the same shape with the infection probability of an occupant.
+        room_area, room_ach, breath_rate, d0: Model constants, scalars or arrays broadcastable
+            to ``room_capacity``.
+
+    Returns:
+        An array with the transmission probability of every room.
+    """
+    room_capacity = np.asarray(room_capacity, dtype=np.int64)
+    initial_infection_prob = np.asarray(initial_infection_prob, dtype=np.float64)
+    shape = np.broadcast(room_capacity, initial_infection_prob, room_area, room_ach, breath_rate, d0).shape
+    capacity = np.broadcast_to(room_capacity, shape).reshape(-1, 1)
+    prob = np.broadcast_to(initial_infection_prob, shape).reshape(-1, 1)
+    room_area, room_ach, breath_rate, d0 = (np.broadcast_to(np.asarray(value, dtype=np.float64), shape).reshape(-1, 1)
+                                            for value in (room_area, room_ach, breath_rate, d0))
+
+    occupancy_density = capacity / (room_area * 0.092903)
+    dose_one_person = (
+            occupancy_density * breath_rate /
+            (ROOM_HEIGHT * HVAC_EFFICIENCY * room_ach) *
+            (ACTIVE_INFECTED_TIME * ACTIVE_INFECTED_EMISSION +
+             (1 - ACTIVE_INFECTED_TIME) * PASSIVE_INFECTION_EMISSION) * MAX_DURATION
+    )
+    infected_occupants = np.arange(max(int(capacity.max(initial=0)), 1))[None, :]
+    infection_prob = binom.pmf(infected_occupants, capacity, prob)
+    transmission_prob = 1 - np.exp(-infected_occupants * dose_one_person / d0)
+    # Only i < room_capacity contributes, as in the loop of calculate_indoor_infection_prob
+    terms = np.where(infected_occupants < capacity, infection_prob * transmission_prob, 0.0)
+    return terms.sum(axis=1).reshape(shape)
+
+
+def get_infected_students_vectorized(current_infected_students, allowed_students_per_course, community_risk,
+                                     total_students, infection_prob_fn=None, **constants):
+    """Array version of ``get_infected_students``.
+
+    Args:
+        current_infected_students: Integer array of infected students.
+        allowed_students_per_course: Integer array of the same shape with the allowed students.
+        community_risk: Scalar or array broadcastable to the inputs.
+        total_students: Scalar or array broadcastable to the inputs.
+        infection_prob_fn: Function ``(room_capacity, initial_infection_prob)`` replacing the
+            indoor model, e.g. a surrogate. Defaults to ``calculate_indoor_infection_prob_vectorized``.
+        constants: Model constants forwarded to ``calculate_indoor_infection_prob_vectorized``.
+
+    Returns:
+        An integer array with the infected students of every course.
+    """
+    current = np.asarray(current_infected_students, dtype=np.int64)
+    room_capacity = np.asarray(allowed_students_per_course, dtype=np.int64)
+    total_students = np.asarray(total_students, dtype=np.float64)
+    recovery_rate = 0.1
+    susceptible = np.maximum(0, total_students - current)
+    initial_infection_prob = (current / total_students) * susceptible / total_students
+
+    if infection_prob_fn is None:
+        infected_prob = calculate_indoor_infection_prob_vectorized(room_capacity, initial_infection_prob, **constants)
+    else:
+        infected_prob = infection_prob_fn(room_capacity, initial_infection_prob)
+    infected_prob = np.nan_to_num(infected_prob, nan=0.0)
+    total_indoor_infected_allowed = np.trunc(infected_prob * room_capacity)
+    total_infected_allowed_outdoor = np.trunc(community_risk * room_capacity)
+    total_infected_allowed = np.minimum(total_indoor_infected_allowed + total_infected_allowed_outdoor, room_capacity)
+    recovered = np.maximum(np.trunc(recovery_rate * current), 0)
+    return np.rint(np.minimum(current + total_infected_allowed - recovered, room_capacity)).astype(np.int64)
+
+
+
+def estimate_infected_students_vectorized(current_infected, allowed_per_course, community_risk,
+                                          const_1=0.005, const_2=0.01):
+    """Array version of ``estimate_infected_students`` for a batch of campuses.
+
+    Args:
+        current_infected: Array of shape (num_envs, num_courses).
+        allowed_per_course: Array of shape (num_envs, num_courses).
+        community_risk: Array of shape (num_envs,).
+        const_1, const_2: Model constants, scalars or arrays of shape (num_envs,).
+
+    Returns:
+        An integer array of shape (num_envs, num_courses) equal to what
+        ``estimate_infected_students`` returns for every row.
+    """
+    community_risk = np.asarray(community_risk, dtype=np.float64)[:, None]
+    const_1 = np.asarray(const_1, dtype=np.float64)
+    const_2 = np.asarray(const_2, dtype=np.float64)
+    if const_1.ndim:
+        const_1 = const_1[:, None]
+    if const_2.ndim:
+        const_2 = const_2[:, None]
+    allowed = np.asarray(allowed_per_course, dtype=np.float64)
+    infected = np.floor(((const_1 * current_infected) * allowed) + ((const_2 * community_risk) * allowed ** 2))
+    return np.minimum(infected, allowed).astype(np.int64)
@@ -0,0 +1,206 @@
+"""Fast surrogate of the indoor (Wells-Riley) infection model used by ``get_infected_students``.
+
+The expensive part of ``get_infected_students`` is ``calculate_indoor_infection_prob``, a
+binomial sum over the occupants of the room. The current and total students of a course
+only enter it through the occupant infection probability
+``p = (current / total) * (total - current) / total`` and the community risk enters
+``get_infected_students`` linearly, so the surrogate tabulates the transmission probability
+on a ``(room_capacity, p)`` grid and interpolates it multilinearly. The grid is refined
+until the error, measured on random ``(room_capacity, current_infected, total_students,
+community_risk)`` samples, is within the requested tolerance.
+
+Example:
+    python -m epidemic_models.indoor_surrogate --output cache/indoor_surrogate.npz --tolerance 0.001
+"""
+import argparse
+import math
+import numpy as np
+from epidemic_models.analyze_models import calculate_indoor_infection_prob_vectorized, \
+    get_infected_students_vectorized
+
+MAX_INFECTION_PROB = 0.25  # maximum of (c / n) * (n - c) / n
+CHUNK_SIZE = 20000
+
+
+class MultilinearInterpolator:
+    """Vectorized multilinear interpolation on a regular grid.
+
+    Args:
+        axes: List of increasing 1-D arrays, one per dimension.
+        values: Array of shape ``tuple(len(axis) for axis in axes)``.
+    """
+
+    def __init__(self, axes, values):
+        self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+        self.values = np.asarray(values, dtype=np.float64)
+        if self.values.shape != tuple(len(axis) for axis in self.axes):
+            raise ValueError("Grid values do not match the axes")
+
+    def __call__(self, *coordinates):
+        coordinates = np.broadcast_arrays(*[np.asarray(c, dtype=np.float64) for c in coordinates])
+        shape = coordinates[0].shape
+        lower = []
+        fractions = []
+        for axis, coordinate in zip(self.axes, coordinates):
+            coordinate = np.clip(coordinate.ravel(), axis[0], axis[-1])
+            index = np.clip(np.searchsorted(axis, coordinate, side='right') - 1, 0, len(axis) - 2)
+            lower.append(index)
+            fractions.append((coordinate - axis[index]) / (axis[index + 1] - axis[index]))
+
+        result = np.zeros(lower[0].shape)
+        for corner in range(2 ** len(self.axes)):
+            weight = np.ones_like(result)
+            index = []
+            for dim in range(len(self.axes)):
+                upper = (corner >> dim) & 1
+                weight *= fractions[dim] if upper else 1 - fractions[dim]
+                index.append(lower[dim] + upper)
+            result += weight * self.values[tuple(index)]
+        return result.reshape(shape)
+
+
+def tabulate_infection_prob(capacity_axis, prob_axis, **constants):
+    """Evaluates the indoor model on every grid node, in chunks to bound memory."""
+    capacity, prob = np.meshgrid(capacity_axis.astype(np.int64), prob_axis, indexing='ij')
+    values = np.empty(capacity.size)
+    capacity, prob = capacity.ravel(), prob.ravel()
+    for start in range(0, capacity.size, CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        values[start:stop] = calculate_indoor_infection_prob_vectorized(capacity[start:stop], prob[start:stop],
+                                                                        **constants)
+    return values.reshape(len(capacity_axis), len(prob_axis))
+
+
+class IndoorSurrogate:
+    """Interpolation table of ``calculate_indoor_infection_prob``.
+
+    Args:
+        capacity_axis: Room capacities of the grid.
+        prob_axis: Occupant infection probabilities of the grid.
+        values: Tabulated transmission probabilities.
+        error_report: Validation errors computed by ``build_indoor_surrogate``.
+    """
+
+    def __init__(self, capacity_axis, prob_axis, values, error_report=None):
+        self.interpolator = MultilinearInterpolator([capacity_axis, prob_axis], values)
+        self.error_report = error_report or {}
+
+    @property
+    def max_capacity(self):
+        return int(self.interpolator.axes[0][-1])
+
+    def infection_prob(self, room_capacity, initial_infection_prob):
+        return self.interpolator(room_capacity, initial_infection_prob)
+
+    def infected_students(self, current_infected, allowed, community_risk, total_students):
+        """Surrogate of ``get_infected_students_vectorized``."""
+        return get_infected_students_vectorized(current_infected, allowed, community_risk, total_students,
+                                                infection_prob_fn=self.infection_prob)
+
+    def save(self, path):
+        np.savez_compressed(path, capacity_axis=self.interpolator.axes[0], prob_axis=self.interpolator.axes[1],
+                            values=self.interpolator.values,
+                            error_keys=np.array(list(self.error_report)),
+                            error_values=np.array(list(self.error_report.values()), dtype=np.float64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            error_report = dict(zip(archive['error_keys'].tolist(), archive['error_values'].tolist()))
+            return cls(archive['capacity_axis'], archive['prob_axis'], archive['values'], error_report)
+
+
+def validate(surrogate, num_samples=20000, max_students=100, seed=100, **constants):
+    """Compares the surrogate with the exact model on random (capacity, infected, total, risk) samples."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.integers(0, surrogate.max_capacity + 1, num_samples)
+    total = rng.integers(1, max_students + 1, num_samples)
+    current = rng.integers(0, total + 1)
+    risk = rng.random(num_samples)
+    prob = (current / total) * np.maximum(0, total - current) / total
+
+    exact_prob = calculate_indoor_infection_prob_vectorized(capacity, prob, **constants)
+    prob_error = np.abs(surrogate.infection_prob(capacity, prob) - exact_prob)
+    exact = get_infected_students_vectorized(current, capacity, risk, total, **constants)
+    student_error = np.abs(surrogate.infected_students(current, capacity, risk, total) - exact)
+    return {
+        'max_prob_error': float(prob_error.max()),
+        'mean_prob_error': float(prob_error.mean()),
+        'max_student_error': float(student_error.max()),
+        'mean_student_error': float(student_error.mean()),
+        'exact_fraction': float((student_error == 0).mean()),
+    }
+
+
+def build_indoor_surrogate(max_capacity=100, max_students=100, tolerance=1e-3, initial_points=11,
+                           max_prob_points=4097, num_samples=20000, seed=100, **constants):
+    """Builds a surrogate whose transmission probability error is at most ``tolerance``.
+
+    The grid starts with ``initial_points`` nodes per axis and is refined by halving the
+    spacing until the maximum validation error is within ``tolerance``. The capacity axis
+    stops refining at unit spacing, where it is exact for integer capacities.
+
+    Returns:
+        An ``IndoorSurrogate`` whose ``error_report`` holds the final validation errors.
+    """
+    capacity_points = initial_points
+    prob_points = initial_points
+    while True:
+        capacity_axis = np.unique(np.rint(np.linspace(0, max_capacity, capacity_points)))
+        prob_axis = np.linspace(0.0, MAX_INFECTION_PROB, prob_points)
+        surrogate = IndoorSurrogate(capacity_axis, prob_axis, tabulate_infection_prob(capacity_axis, prob_axis,
+                                                                                      **constants))
+        report = validate(surrogate, num_samples, max_students, seed, **constants)
+        report['grid_points'] = float(len(capacity_axis) * len(prob_axis))
+        surrogate.error_report = report
+        print(f"grid {len(capacity_axis)}x{len(prob_axis)}: {report}")
+        if report['max_prob_error'] <= tolerance or prob_points >= max_prob_points:
+            return surrogate
+        capacity_points = min(2 * capacity_points - 1, max_capacity + 1)
+        prob_points = 2 * prob_points - 1
+
+
+class IndoorSurrogateDynamics:
+    """Dynamics backend for ``Simulation`` using the indoor model surrogate.
+
+    Drop-in replacement of ``get_infected_students`` in ``Simulation.apply_action``: the
+    allowed students are rounded as in ``apply_action`` and every course uses its own
+    number of students as ``total_students``.
+
+    Args:
+        surrogate: An ``IndoorSurrogate`` or the path of a saved one.
+        students_per_course: List with the number of students of each course.
+    """
+
+    def __init__(self, surrogate, students_per_course):
+        if isinstance(surrogate, str):
+            surrogate = IndoorSurrogate.load(surrogate)
+        self.surrogate = surrogate
+        self.students_per_course = np.asarray(students_per_course, dtype=np.int64)
+        self.total_students = int(self.students_per_course.sum())
+        if math.ceil(self.students_per_course.max() * 100 / self.total_students) > surrogate.max_capacity:
+            raise ValueError(f"Surrogate covers rooms of up to {surrogate.max_capacity} students")
+
+    def step(self, current_infected, action, community_risk):
+        allowed = [math.ceil(students * action[i] / self.total_students)
+                   for i, students in enumerate(self.students_per_course.tolist())]
+        infected = self.surrogate.infected_students(current_infected, allowed, community_risk,
+                                                    self.students_per_course)
+        return allowed, infected.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a surrogate of the indoor infection model.')
+    parser.add_argument('--output', required=True, help='Output .npz file.')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Maximum transmission probability error.')
+    parser.add_argument('--max_capacity', type=int, default=100)
+    parser.add_argument('--max_students', type=int, default=100)
+    args = parser.parse_args()
+
+    surrogate = build_indoor_surrogate(args.max_capacity, args.max_students, args.tolerance)
+    surrogate.save(args.output)
+    print(f"Surrogate saved to {args.output}: {surrogate.error_report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Closed-form R0 and critical class size of the classroom model.
+
+With a classroom transmission risk ``alpha_m`` and a community risk scaling ``beta``, a class
+of ``N`` students has ``R0 = N * (alpha_m + beta * community_risk)``. The disease-free
+equilibrium is stable while ``R0 < 1``, i.e. below the critical class size
+``N* = 1 / (alpha_m + beta * community_risk)``. Every function broadcasts over arrays of
+``alpha_m``, ``beta``, community risk and class sizes.
+
+Example:
+    critical_class_size(community_risk=np.linspace(0, 1, 11))
+    max_safe_levels(CampusModel().number_of_students_per_course(), community_risk=0.3)
+"""
+import numpy as np
+from campus_gym.envs.codec import OCCUPANCY_PERCENTAGE
+
+ALPHA_M = 0.02  # Transmission risk within the classroom
+BETA = 0.01  # Community risk scaling factor
+NUM_OCCUPANCY_LEVELS = 3
+
+
+def compute_r0(class_size, community_risk, alpha_m=ALPHA_M, beta=BETA):
+    """R0 of a class of ``class_size`` students."""
+    return np.asarray(class_size, dtype=np.float64) * (alpha_m + beta * np.asarray(community_risk, dtype=np.float64))
+
+
+def critical_class_size(community_risk, alpha_m=ALPHA_M, beta=BETA):
+    """Class size at which R0 reaches 1, ``inf`` when there is no transmission."""
+    rate = alpha_m + beta * np.asarray(community_risk, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        return np.where(rate > 0, 1 / rate, np.inf)
+
+
+def allowed_students(students_per_course, levels, percentage=OCCUPANCY_PERCENTAGE):
+    """Students in class for occupancy levels (0, 1, 2), rounded as in ``Simulation.apply_action``.
+
+    ``percentage`` is the percentage of a class allowed per level, ``ActionCodec.percentage``.
+    """
+    students = np.asarray(students_per_course, dtype=np.int64)
+    return np.ceil(students * np.asarray(levels) * percentage / students.sum()).astype(np.int64)
+
+
+def course_r0(students_per_course, community_risk, alpha_m=ALPHA_M, beta=BETA):
+    """R0 of every course at every occupancy level, shape ``community_risk.shape + (courses, 3)``."""
+    allowed = allowed_students(np.asarray(students_per_course)[:, None], np.arange(NUM_OCCUPANCY_LEVELS))
+    community_risk = np.asarray(community_risk, dtype=np.float64)[..., None, None]
+    return compute_r0(allowed, community_risk, np.asarray(alpha_m)[..., None, None], np.asarray(beta)[..., None, None])
+
+
+def max_safe_levels(students_per_course, community_risk, alpha_m=ALPHA_M, beta=BETA, r0_limit=1.0):
+    """Highest occupancy level of every course with ``R0 < r0_limit``, shape ``community_risk.shape + (courses,)``.
+
+    Level 0 (online) is always allowed.
+    """
+    safe = course_r0(students_per_course, community_risk, alpha_m, beta) < r0_limit
+    safe[..., 0] = True
+    # Levels are ordered by class size, so the safe levels of a course are a prefix
+    return safe.sum(axis=-1) - 1
+
+
+def course_thresholds(campus_model, community_risk, alpha_m=ALPHA_M, beta=BETA):
+    """Per-course critical attendance of a ``CampusModel``.
+
+    Returns:
+        A dict with ``critical_class_size`` (shape of ``community_risk``), the critical
+        attendance ``critical_percentage`` in [0, 100] and the ``max_safe_level`` of every
+        course (shape ``community_risk.shape + (courses,)``).
+    """
+    students = np.asarray(campus_model.number_of_students_per_course(), dtype=np.float64)
+    critical = critical_class_size(community_risk, alpha_m, beta)
+    # Inverse of allowed_students for a continuous percentage
+    percentage = np.clip(np.asarray(critical)[..., None] * students.sum() / students, 0, 100)
+    return {
+        'critical_class_size': critical,
+        'critical_percentage': percentage,
+        'max_safe_level': max_safe_levels(students, community_risk, alpha_m, beta),
+    }
@@ -4,6 +4,7 @@ import gymnasium as gym
 import numpy as np
 import wandb
 import argparse
+from datetime import datetime
 from pathlib import Path
 from campus_gym.envs.campus_gym_env import CampusGymEnv
 import optuna
@@ -15,7 +16,19 @@ def load_config(file_path):
 
 def initialize_environment(shared_config_path):
     shared_config = load_config(shared_config_path)
-    env = gym.make(shared_config['environment']['environment_id'])
+    env_kwargs = {}
+    if shared_config['environment'].get('community_risk_file'):
+        env_kwargs['community_risk_file'] = shared_config['environment']['community_risk_file']
+    if shared_config['environment'].get('tabulated_dynamics'):
+        env_kwargs['tabulated_dynamics'] = True
+        env_kwargs['dynamics_cache_dir'] = shared_config['directories'].get('cache_directory')
+    elif shared_config['environment'].get('indoor_surrogate_file'):
+        env_kwargs['indoor_surrogate_file'] = shared_config['environment']['indoor_surrogate_file']
+    # Campus model parameters, the environment defaults are used for missing or null entries
+    for name, value in (shared_config.get('campus') or {}).items():
+        if value is not None:
+            env_kwargs[name] = value
+    env = gym.make(shared_config['environment']['environment_id'], **env_kwargs)
     return env, shared_config
 
 def format_agent_class_name(agent_type):
@@ -35,7 +48,8 @@ def format_agent_class_name(agent_type):
     formatted_parts = [special_acronyms.get(part, part.capitalize()) for part in parts]
     return ''.join(formatted_parts) + 'Agent'
 
-def run_training(env, shared_config_path, alpha, agent_type, is_sweep=False):
+def run_training(env, shared_config_path, alpha, agent_type, is_sweep=False, track_memory=0, decomposed_alphas=None,
+                 warm_start=None):
     if not is_sweep:  # if not a sweep, initialize wandb here
         shared_config = load_config(shared_config_path)
         wandb.init(project=shared_config['wandb']['project'], entity=shared_config['wandb']['entity'])
@@ -44,11 +58,16 @@ def run_training(env, shared_config_path, alpha, agent_type, is_sweep=False):
         raise RuntimeError(
             "wandb run has not been initialized. Please make sure wandb.init() is called before run_training.")
 
-    tr_name = wandb.run.name + '_' + str(alpha)
+    # One decomposed run covers every alpha, its Q-tables are named <run>_<alpha>
+    tr_name = wandb.run.name if decomposed_alphas else wandb.run.name + '_' + str(alpha)
     agent_name = f"sweep_{tr_name}" if is_sweep else str(tr_name)
 
     agent_config_path = os.path.join('config', f'config_{agent_type}.yaml')
     agent_config = load_config(agent_config_path)
+    if track_memory:
+        agent_config['agent']['track_memory'] = track_memory
+    if warm_start:
+        agent_config['agent']['warm_start'] = warm_start
     wandb.config.update(agent_config)
     wandb.config.update({'alpha': alpha})
     effective_alpha = wandb.config.alpha if is_sweep else alpha
@@ -64,13 +83,20 @@ def run_training(env, shared_config_path, alpha, agent_type, is_sweep=False):
     else:
         agent = AgentClass(env, agent_name,
                            shared_config_path=shared_config_path,
-                           agent_config_path=agent_config_path)
+                           agent_config_path=agent_config_path,
+                           override_config=agent_config if track_memory or warm_start else None)
 
-    agent.train(effective_alpha)
+    if decomposed_alphas:
+        agent.train_decomposed(decomposed_alphas)
+        run_names = [f'{agent_name}_{alpha:g}' for alpha in decomposed_alphas]
+    else:
+        agent.train(effective_alpha)
+        run_names = [agent_name]
 
     # Save the run_name for later use
     with open('train_run_names.txt', 'a') as file:
-        file.write(agent_name + '\n')
+        for run_name in run_names:
+            file.write(run_name + '\n')
 
     print("Done Training with alpha: ", alpha, "agent_type: ", agent_type, "agent_name: ", agent_name)
     return agent_name
@@ -87,7 +113,54 @@ def run_sweep(env, shared_config_path, agent_type):
     print("Running Sweep...")
 
 
-def run_optuna(env, shared_config_path, agent_type):
+def run_batched_sweep(env, shared_config_path, agent_type, alpha, eval_episodes):
+    """Trains every configuration of the grid in config/sweep.yaml at once (q_learning/batched.py)."""
+    if agent_type != 'q_learning':
+        raise ValueError(f"Batched sweeps train tabular Q-learning agents, not {agent_type!r}")
+    import csv
+    from q_learning.batched import BatchedQLearning, sweep_grid
+    from q_learning.q_table import q_table_metadata, save_q_table
+    shared_config = load_config(shared_config_path)
+    agent_config = load_config(os.path.join('config', f'config_{agent_type}.yaml'))
+    sweep_config = load_config(os.path.join('config', 'sweep.yaml'))
+    wandb.init(project=shared_config['wandb']['project'], entity=shared_config['wandb']['entity'])
+
+    # Parameters the sweep does not vary come from the agent config and --alpha
+    defaults = dict(agent_config['agent'], alpha=alpha)
+    configs = sweep_grid(sweep_config, defaults)
+    print(f"Running Batched Sweep of {len(configs)} configurations...")
+    trainer = BatchedQLearning(configs, env.unwrapped.students_per_course, agent_config['agent']['max_episodes'],
+                               max_weeks=env.unwrapped.campus_state.model.get_max_weeks())
+    returns = trainer.train()
+    # Moving average over the last 100 episodes, the window of QLearningAgent
+    final_returns = returns[:, -100:].mean(axis=1)
+    eval_returns = trainer.evaluate(eval_episodes)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_dir = os.path.join(shared_config['directories']['results_directory'], 'batched_sweep', timestamp)
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'returns.npy'), returns)
+    with open(os.path.join(output_dir, 'batched_sweep.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['config', *configs[0], 'average_return', 'avg_episode_reward'])
+        for k, config in enumerate(configs):
+            writer.writerow([k, *config.values(), final_returns[k], eval_returns[k]])
+            wandb.log({'config': k, **config, 'average_return': final_returns[k],
+                       'avg_episode_reward': eval_returns[k]})
+
+    # The best configuration by greedy return is saved like a trained Q-table
+    best = int(np.argmax(eval_returns))
+    os.makedirs(shared_config['directories']['policy_directory'], exist_ok=True)
+    run_name = f"{wandb.run.name}_{configs[best]['alpha']}"
+    metadata = q_table_metadata(trainer.state_codec.nvec, trainer.action_codec.nvec, configs[best]['alpha'],
+                                {'shared': shared_config, 'agent': dict(agent_config['agent'], **configs[best])})
+    path = save_q_table(trainer.q_tables[best], os.path.join(shared_config['directories']['policy_directory'],
+                                                             f'q_table_{run_name}'), metadata=metadata)
+    print(f"Best configuration {best}: {configs[best]}, greedy average return {eval_returns[best]:.2f}")
+    print(f"Results saved to {output_dir}, Q-table of the best configuration to {path}")
+    return configs[best]
+
+def run_optuna(env, shared_config_path, agent_type, alpha):
     shared_config = load_config(shared_config_path)
     optuna_config_path = os.path.join('config', 'optuna_config.yaml')
     optuna_config = load_config(optuna_config_path)
@@ -95,7 +168,9 @@ def run_optuna(env, shared_config_path, agent_type):
     def objective(trial):
         wandb.init(project=shared_config['wandb']['project'], entity=shared_config['wandb']['entity'], reinit=True)
 
-        config = {'agent': {}}  # Ensure 'agent' key exists
+        # Parameters of the trial override those of the agent config
+        config = load_config(os.path.join('config', f'config_{agent_type}.yaml'))
+        config['agent'].setdefault('alpha', alpha)
         for param, param_config in optuna_config['parameters'].items():
             if param_config['type'] == 'float':
                 config['agent'][param] = trial.suggest_float(param, param_config['min'], param_config['max'])
@@ -115,14 +190,15 @@ def run_optuna(env, shared_config_path, agent_type):
         agent = AgentClass(env, agent_name,
                            shared_config_path=shared_config_path,
                            override_config=config)  # Pass the entire config dict
+        # The agent reports its moving average return to the trial, which the pruner can stop early
+        agent.trial = trial
 
-        agent.train(config['agent']['alpha'])
-
-        final_performance = agent.get_final_performance()
-
-        wandb.finish()
+        try:
+            agent.train(config['agent']['alpha'])
+        finally:
+            wandb.finish()
 
-        return final_performance
+        return agent.get_final_performance()
 
     study = optuna.create_study(direction=optuna_config.get('direction', 'maximize'))
     study.optimize(objective, n_trials=optuna_config.get('n_trials', 20))
@@ -146,7 +222,7 @@ def run_optuna(env, shared_config_path, agent_type):
     for key, value in trial.params.items():
         print("    {}: {}".format(key, value))
 
-def run_evaluation(env, shared_config_path, agent_type, alpha, run_name):
+def run_evaluation(env, shared_config_path, agent_type, alpha, run_name, decomposed=False):
     print("Running Evaluation...")
 
     # Load agent configuration
@@ -160,8 +236,22 @@ def run_evaluation(env, shared_config_path, agent_type, alpha, run_name):
                        agent_config_path=os.path.join('config', f'config_{agent_type}.yaml'))
 
     # Load the trained Q-table (assuming it's saved after training)
-    q_table_path = os.path.join('policy', f'q_table_{run_name}.npy')
-    agent.q_table = np.load(q_table_path)
+    from q_learning.q_table import check_q_table_metadata, load_q_table, load_q_table_metadata
+    if decomposed:
+        # Q-table of alpha combined from the allowed and infected action values of a decomposed run
+        from q_learning.decomposed import DecomposedQTable
+        q_table_path = os.path.join('policy', f'decomposed_{run_name}.npz')
+        check_q_table_metadata(load_q_table_metadata(q_table_path), env.unwrapped.state_codec.nvec,
+                               env.unwrapped.action_codec.nvec)
+        agent.q_table = DecomposedQTable.load(q_table_path).q_table(alpha)
+    else:
+        q_table_path = os.path.join('policy', f'q_table_{run_name}')
+        metadata = load_q_table_metadata(q_table_path)
+        check_q_table_metadata(metadata, env.unwrapped.state_codec.nvec, env.unwrapped.action_codec.nvec)
+        if metadata and metadata.get('alpha') not in (None, alpha):
+            print(f"Note: the Q-table was trained with alpha {metadata['alpha']}, evaluating with alpha {alpha}")
+        # Memory-mapped, the evaluation reads only the rows of the states it visits
+        agent.q_table = load_q_table(q_table_path, mmap_mode='r')
 
     # Run the test
     test_episodes = 5 # Define the number of test episodes
@@ -190,6 +280,26 @@ def run_evaluation_random(env, shared_config_path, agent_type, alpha, run_name):
     # Print or process the evaluation metrics as needed
     print("Evaluation Metrics for random agent:", evaluation_metrics)
 
+def run_evaluation_threshold(env, shared_config_path, agent_type, alpha, run_name):
+    from policy_evaluation.policies import ThresholdPolicy
+    print("Running Evaluation...")
+
+    AgentModule = __import__(f'{agent_type}.agent', fromlist=[f'{format_agent_class_name(agent_type)}'])
+    AgentClass = getattr(AgentModule, f'{format_agent_class_name(agent_type)}')
+    agent = AgentClass(env, run_name,
+                       shared_config_path=shared_config_path,
+                       agent_config_path=os.path.join('config', f'config_{agent_type}.yaml'))
+
+    # R0 threshold baseline, mapped to the action index of the agent
+    policy = ThresholdPolicy(env.unwrapped.students_per_course)
+    action_codec = env.unwrapped.action_codec
+    def baseline_policy(state):
+        return action_codec.encode(policy(np.array([state]))[0])
+
+    test_episodes = 5  # Define the number of test episodes
+    evaluation_metrics = agent.test(test_episodes, alpha, baseline_policy=baseline_policy)
+    print("Evaluation Metrics for threshold policy:", evaluation_metrics)
+
 def run_multiple_runs(env, shared_config_path, agent_type, alpha_t, beta_t, num_runs):
     shared_config = load_config(shared_config_path)
     wandb.init(project=shared_config['wandb']['project'], entity=shared_config['wandb']['entity'])
@@ -214,9 +324,53 @@ def run_multiple_runs(env, shared_config_path, agent_type, alpha_t, beta_t, num_
     print("Done Multiple Runs with alpha_t: ", alpha_t, "beta_t: ", beta_t, "agent_type: ", agent_type, "agent_name: ", agent_name)
     return agent_name
 
+def run_scenario_cube(policies, alphas, risk_profiles, class_sizes, episodes, output_path):
+    from policy_evaluation.scenario_cube import evaluate_scenario_cube
+    print("Running Scenario Cube Evaluation...")
+
+    class_sizes = [[int(students) for students in size.split(',')] for size in class_sizes]
+    cube = evaluate_scenario_cube(policies, alphas, risk_profiles, class_sizes, episodes=episodes)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    cube.save(output_path)
+
+    # Mean return of every policy and alpha, averaged over risk profiles, class sizes and episodes
+    mean_returns = cube.sel(metric='return').mean('episode').mean('class_size').mean('risk_profile')
+    for p, policy in enumerate(mean_returns.coords['policy']):
+        print(policy, dict(zip(mean_returns.coords['alpha'].tolist(), mean_returns.data[p].round(2).tolist())))
+    print(f"Scenario cube {cube} saved to {output_path}")
+    return cube
+
+def run_sensitivity(policy, model, num_samples, alphas, class_size, episodes, output_path):
+    from policy_evaluation.sensitivity import run_sensitivity_analysis
+    print("Running Sensitivity Analysis...")
+
+    students_per_course = [int(students) for students in class_size.split(',')]
+    result = run_sensitivity_analysis(policy=policy, model=model, num_samples=num_samples, alphas=alphas,
+                                      students_per_course=students_per_course, episodes=episodes)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    result.save(output_path)
+    print(result.summary())
+    print(f"{len(result.samples)} model evaluations saved to {output_path}")
+    return result
+
+def run_schedules(agent_type, decay_functions, output_dir):
+    """Saves and plots the exploration schedules of the agent config, to compare them before choosing one."""
+    from training.exploration import ExplorationRateDecay
+    agent_config = load_config(os.path.join('config', f'config_{agent_type}.yaml'))['agent']
+    # The tabular agent keeps its unsquared sine schedule (function 14)
+    decay = ExplorationRateDecay(agent_config['max_episodes'], agent_config['min_exploration_rate'],
+                                 agent_config['exploration_rate'], squared_sine=agent_type != 'q_learning')
+    os.makedirs(output_dir, exist_ok=True)
+    decay.save_schedules(os.path.join(output_dir, 'schedules.csv'), decay_functions)
+    decay.plot_schedules(os.path.join(output_dir, 'schedules.png'), decay_functions)
+    print(f"Exploration schedules of {agent_type} saved to {output_dir}")
+    return decay
+
 def main():
     parser = argparse.ArgumentParser(description='Run training, evaluation, multiple runs, or a sweep.')
-    parser.add_argument('mode', choices=['train', 'eval', 'random', 'sweep', 'multi', 'optuna'], help='Mode to run the script in.')
+    parser.add_argument('mode', choices=['train', 'eval', 'random', 'sweep', 'batched_sweep', 'multi', 'optuna', 'cube',
+                                         'sensitivity', 'threshold', 'schedules'],
+                        help='Mode to run the script in.')
     parser.add_argument('--alpha', type=float, default=0.5, help='Reward parameter alpha.')
     parser.add_argument('--alpha_t', type=float, default=0.05, help='Alpha value for tolerance interval.')
     parser.add_argument('--beta_t', type=float, default=0.9, help='Beta value for tolerance interval.')
@@ -225,6 +379,41 @@ def main():
                         , help='Number of runs for tolerance interval.')
     parser.add_argument('--agent_type', default='q_learning', help='Type of agent to use.')
     parser.add_argument('--run_name', default=None, help='Unique name for the training run or evaluation.')
+    parser.add_argument('--policies', nargs='+', default=None,
+                        help='Q-table files, "random", "threshold" or "constant_<level>" for cube mode (default: random). '
+                             'Sensitivity mode uses the first one (default: constant_2).')
+    parser.add_argument('--alphas', nargs='+', type=float, default=None,
+                        help='Alpha grid for cube mode (default: 0.5) and anchor alphas of decomposed training '
+                             '(default: 0.1 to 0.9).')
+    parser.add_argument('--decomposed', action='store_true',
+                        help='Train the allowed and infected action values of all --alphas in one run (train mode), '
+                             'or evaluate the policy of --alpha combined from them (eval mode).')
+    parser.add_argument('--risk_profiles', nargs='+', default=['high_low'],
+                        help='Risk process names or trajectory .npy files for cube mode.')
+    parser.add_argument('--class_sizes', nargs='+', default=['100'],
+                        help='Comma separated students_per_course configurations for cube mode, e.g. 10,100.')
+    parser.add_argument('--episodes', type=int, default=100,
+                        help='Scenarios per combination in cube mode, per parameter set in sensitivity mode and '
+                             'greedy evaluation episodes per configuration in batched_sweep mode.')
+    parser.add_argument('--sensitivity_model', choices=['estimate', 'indoor'], default='estimate',
+                        help='Epidemic model whose constants are varied in sensitivity mode.')
+    parser.add_argument('--samples', type=int, default=4096, help='Base Sobol samples of sensitivity mode.')
+    parser.add_argument('--output', default=None,
+                        help='Output file of cube and sensitivity modes, output directory of schedules mode.')
+    parser.add_argument('--decay_functions', nargs='+', type=int, default=None,
+                        help='e_decay_function numbers of schedules mode (default: all 20).')
+    parser.add_argument('--profile', choices=['cprofile', 'sampling'], default=None,
+                        help='Profile the run and save profile.prof and profile.collapsed (flamegraph stacks) '
+                             'to <results_directory>/profiles/<mode>-<timestamp>.')
+    parser.add_argument('--profile_top', type=int, default=25, help='Functions in the printed hotspot table.')
+    parser.add_argument('--profile_interval', type=float, default=0.005,
+                        help='Seconds between samples of the sampling profiler.')
+    parser.add_argument('--track_memory', '--track-memory', type=int, default=0, metavar='EPISODES',
+                        help='Sample RSS, tracemalloc allocation sites and subsystem sizes every EPISODES training '
+                             'episodes (train mode; overrides track_memory of the agent config).')
+    parser.add_argument('--warm_start', '--warm-start', default=None, metavar='SOURCE',
+                        help='Start training from a saved Q-table (file or run name) or policy CSV, or a DQN '
+                             'model.pt (train mode; overrides warm_start of the agent config).')
 
     global args
     args = parser.parse_args()
@@ -232,15 +421,34 @@ def main():
     shared_config_path = os.path.join('config', 'config_shared.yaml')
     env, shared_config = initialize_environment(shared_config_path)
 
+    if args.profile:
+        from profiling.profiler import profile_call
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        profile_dir = os.path.join(shared_config['directories']['results_directory'], 'profiles',
+                                   f'{args.mode}-{timestamp}')
+        profile_call(lambda: run_mode(args, env, shared_config, shared_config_path), args.profile, profile_dir,
+                     top=args.profile_top, interval=args.profile_interval)
+    else:
+        run_mode(args, env, shared_config, shared_config_path)
+
+def run_mode(args, env, shared_config, shared_config_path):
     if args.mode == 'train':
-        run_training(env, shared_config_path, args.alpha, args.agent_type)
+        decomposed_alphas = None
+        if args.decomposed:
+            from q_learning.decomposed import ANCHOR_ALPHAS
+            decomposed_alphas = args.alphas or list(ANCHOR_ALPHAS)
+        run_training(env, shared_config_path, args.alpha, args.agent_type, track_memory=args.track_memory,
+                     decomposed_alphas=decomposed_alphas, warm_start=args.warm_start)
 
     elif args.mode == 'eval':
-        run_evaluation(env, shared_config_path, args.agent_type, args.alpha, args.run_name)
+        run_evaluation(env, shared_config_path, args.agent_type, args.alpha, args.run_name, args.decomposed)
 
     elif args.mode == 'random':
         run_evaluation_random(env, shared_config_path, args.agent_type, args.alpha, args.run_name)
 
+    elif args.mode == 'threshold':
+        run_evaluation_threshold(env, shared_config_path, args.agent_type, args.alpha, args.run_name)
+
     elif args.mode == 'sweep':
         sweep_config_path = os.path.join('config', 'sweep.yaml')
         sweep_config = load_config(sweep_config_path)
@@ -248,11 +456,30 @@ def main():
                                entity=shared_config['wandb']['entity'])
         wandb.agent(sweep_id, function=lambda: run_sweep(env, shared_config_path, args.agent_type))
 
+    elif args.mode == 'batched_sweep':
+        run_batched_sweep(env, shared_config_path, args.agent_type, args.alpha, args.episodes)
+
     elif args.mode == 'multi':
         run_multiple_runs(env, shared_config_path, args.agent_type, args.alpha_t, args.beta_t, args.num_runs)
 
     elif args.mode == 'optuna':
-        run_optuna(env, shared_config_path, args.agent_type)
+        run_optuna(env, shared_config_path, args.agent_type, args.alpha)
+
+    elif args.mode == 'cube':
+        output = args.output or os.path.join('evaluation', 'scenario_cube.npz')
+        run_scenario_cube(args.policies or ['random'], args.alphas or [0.5], args.risk_profiles, args.class_sizes,
+                          args.episodes, output)
+
+    elif args.mode == 'sensitivity':
+        output = args.output or os.path.join('evaluation', 'sensitivity.npz')
+        policy = args.policies[0] if args.policies else 'constant_2'
+        run_sensitivity(policy, args.sensitivity_model, args.samples, args.alphas or [0.5], args.class_sizes[0],
+                        args.episodes, output)
+
+    elif args.mode == 'schedules':
+        output = args.output or os.path.join(shared_config['directories']['results_directory'], 'schedules',
+                                             args.agent_type)
+        run_schedules(args.agent_type, args.decay_functions, output)
 
     else:
         raise ValueError(f"Unsupported mode: {args.mode}")
@@ -0,0 +1,104 @@
+"""Batched policies for vectorized rollouts.
+
+A policy maps a batch of discrete observations of shape (num_envs, num_courses + 1)
+to action levels of shape (num_envs, num_courses).
+"""
+import os
+import numpy as np
+from campus_gym.envs.codec import ActionCodec, StateCodec
+from epidemic_models.threshold_analysis import ALPHA_M, BETA, max_safe_levels
+from q_learning.q_table import greedy_actions, load_q_table
+
+
+class QTablePolicy:
+    """Greedy policy of a saved Q-table.
+
+    Rows follow the ``itertools.product`` order of the observation levels used by
+    ``QLearningAgent``, i.e. the row-major index of the discrete observation. The greedy
+    action of a state is computed the first time it is observed, so a memory-mapped
+    Q-table is only read at the rows of visited states.
+    """
+
+    def __init__(self, q_table, num_courses, name=None):
+        self.num_courses = num_courses
+        self.state_codec = StateCodec((10,) * (num_courses + 1))
+        self.action_codec = ActionCodec((3,) * num_courses)
+        expected_shape = (self.state_codec.num_states, self.action_codec.num_actions)
+        if q_table.shape != expected_shape:
+            raise ValueError(f"Q-table of shape {q_table.shape} does not match {num_courses} course(s), "
+                             f"expected {expected_shape}")
+        self.name = name
+        self.q_table = q_table
+        # Greedy joint action of every state, -1 until the state is observed
+        self.greedy_actions = np.full(self.state_codec.num_states, -1, dtype=np.int64)
+
+    def __call__(self, observation):
+        states = self.state_codec.encode(observation)
+        new_states = np.unique(states[self.greedy_actions[states] < 0])
+        if new_states.size:
+            self.greedy_actions[new_states] = greedy_actions(self.q_table, new_states)
+        return self.action_codec.decode(self.greedy_actions[states])
+
+
+class RandomPolicy:
+    """Uniformly random action levels, the baseline of ``test_baseline_random``."""
+
+    def __init__(self, num_courses, seed=100, name='random'):
+        self.num_courses = num_courses
+        self.rng = np.random.default_rng(seed)
+        self.name = name
+
+    def __call__(self, observation):
+        return self.rng.integers(0, 3, size=(observation.shape[0], self.num_courses))
+
+
+class ConstantPolicy:
+    """The same action level for every course and week, e.g. level 2 keeps every class in person."""
+
+    def __init__(self, num_courses, level, name=None):
+        if level not in (0, 1, 2):
+            raise ValueError(f"Invalid action level: {level}")
+        self.num_courses = num_courses
+        self.level = level
+        self.name = name or f'constant_{level}'
+
+    def __call__(self, observation):
+        return np.full((observation.shape[0], self.num_courses), self.level)
+
+
+class ThresholdPolicy:
+    """Highest occupancy level of every course that keeps the classroom R0 below ``r0_limit``.
+
+    The community risk of an observation level is taken at the upper edge of its bin, and the
+    levels of the 10 risk bins are precomputed with ``max_safe_levels``.
+    """
+
+    def __init__(self, students_per_course, alpha_m=ALPHA_M, beta=BETA, r0_limit=1.0, name='threshold'):
+        self.num_courses = len(students_per_course)
+        risk_levels = (np.arange(10) + 1) / 10
+        self.levels = max_safe_levels(students_per_course, risk_levels, alpha_m, beta, r0_limit)
+        self.name = name
+
+    def __call__(self, observation):
+        return self.levels[observation[:, -1]]
+
+
+def policy_name(spec):
+    """Label of a policy spec: the run name for Q-table files, the spec itself otherwise."""
+    base = os.path.splitext(os.path.basename(spec))[0]
+    return base[len('q_table_'):] if base.startswith('q_table_') else base
+
+
+def load_policy(spec, num_courses, students_per_course=None):
+    """Builds a policy from a spec: ``'random'``, ``'constant_<level>'``, ``'threshold'`` or the path of a
+    saved ``.npy`` (dense) or ``.npz`` (sparse) Q-table. ``'threshold'`` needs ``students_per_course``.
+    """
+    if spec == 'random':
+        return RandomPolicy(num_courses)
+    if spec.startswith('constant_'):
+        return ConstantPolicy(num_courses, int(spec[len('constant_'):]))
+    if spec == 'threshold':
+        if students_per_course is None:
+            raise ValueError("The threshold policy needs students_per_course")
+        return ThresholdPolicy(students_per_course)
+    return QTablePolicy(load_q_table(spec, mmap_mode='r'), num_courses, name=policy_name(spec))
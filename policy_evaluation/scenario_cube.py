@@ -0,0 +1,197 @@
+"""Scenario-cube evaluation: every policy under every alpha, risk profile and class-size configuration.
+
+All combinations are rolled out with ``VectorizedSimulation`` and stored as a single labeled
+array with dimensions ``(policy, alpha, risk_profile, class_size, episode, metric)``. Every
+policy sees the same initial infections and risk trajectories for a given risk profile and
+class size, so results are directly comparable.
+
+Example:
+    cube = evaluate_scenario_cube(['policy/q_table_run_0.5.npy', 'random'], alphas=[0.2, 0.5, 0.8],
+                                  risk_profiles=['high_low', 'ar1'], class_sizes=[[100], [10, 100]])
+    cube.save('evaluation/scenario_cube.npz')
+    cube.sel(policy='run_0.5', metric='return').mean('episode')
+"""
+import os
+import numpy as np
+from joblib import Parallel, delayed
+from campus_digital_twin.community_risk import RiskTrajectories, make_risk_process
+from campus_digital_twin.vectorized import VectorizedSimulation, discretize_observation
+from .policies import load_policy, policy_name
+
+METRICS = ['return', 'infected', 'allowed']
+DIMS = ['policy', 'alpha', 'risk_profile', 'class_size', 'episode', 'metric']
+
+
+def class_size_label(students_per_course):
+    return '-'.join(str(students) for students in students_per_course)
+
+
+class ScenarioCube:
+    """A labeled N-dimensional array of evaluation results.
+
+    Args:
+        data: Array with one axis per entry of ``dims``.
+        dims: Names of the axes.
+        coords: Dict mapping each dimension to the labels of its axis.
+    """
+
+    def __init__(self, data, dims, coords):
+        self.data = data
+        self.dims = list(dims)
+        self.coords = {dim: np.asarray(coords[dim]) for dim in self.dims}
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def _index(self, dim, label):
+        labels = self.coords[dim]
+        if isinstance(label, (list, tuple, np.ndarray)):
+            return [self._index(dim, item) for item in label]
+        if labels.dtype.kind == 'f':
+            matches = np.flatnonzero(np.isclose(labels, float(label)))
+        else:
+            matches = np.flatnonzero(labels == label)
+        if len(matches) == 0:
+            raise KeyError(f"{label!r} is not a label of dimension {dim!r}: {labels.tolist()}")
+        return int(matches[0])
+
+    def sel(self, **selectors):
+        """Selects by label. A scalar label drops the dimension, a list keeps it.
+
+        Example: ``cube.sel(policy='run_0.5', alpha=[0.2, 0.8], metric='return')``
+        """
+        index = []
+        dims = []
+        coords = {}
+        for dim in self.dims:
+            if dim not in selectors:
+                index.append(slice(None))
+                dims.append(dim)
+                coords[dim] = self.coords[dim]
+                continue
+            position = self._index(dim, selectors[dim])
+            index.append(position)
+            if isinstance(position, list):
+                dims.append(dim)
+                coords[dim] = self.coords[dim][position]
+        unknown = set(selectors) - set(self.dims)
+        if unknown:
+            raise KeyError(f"Unknown dimensions: {sorted(unknown)}")
+        # Apply one axis at a time so list selectors on several axes do not broadcast together
+        data = self.data
+        axis = 0
+        for position in index:
+            if isinstance(position, int):
+                data = np.take(data, position, axis=axis)
+            else:
+                data = data[(slice(None),) * axis + (position,)]
+                axis += 1
+        return ScenarioCube(data, dims, coords) if dims else data
+
+    def reduce(self, dim, func=np.nanmean):
+        """Reduces one dimension with ``func`` (ignoring NaN combinations by default)."""
+        axis = self.dims.index(dim)
+        dims = [d for d in self.dims if d != dim]
+        return ScenarioCube(func(self.data, axis=axis), dims, {d: self.coords[d] for d in dims})
+
+    def mean(self, dim):
+        return self.reduce(dim, np.nanmean)
+
+    def save(self, path):
+        arrays = {f'coord_{dim}': self.coords[dim] for dim in self.dims}
+        np.savez_compressed(path, data=self.data, dims=np.array(self.dims), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            dims = archive['dims'].tolist()
+            return cls(archive['data'], dims, {dim: archive[f'coord_{dim}'] for dim in dims})
+
+    def __repr__(self):
+        axes = ', '.join(f'{dim}: {len(self.coords[dim])}' for dim in self.dims)
+        return f'ScenarioCube({axes})'
+
+
+def make_scenarios(risk_profile, students_per_course, episodes, max_weeks, seed):
+    """Initial infections and risk trajectories shared by every policy and alpha."""
+    rng = np.random.default_rng(seed)
+    initial_infected = rng.integers(1, 100, size=(episodes, len(students_per_course)))
+    if risk_profile.endswith('.npy'):
+        source = RiskTrajectories(risk_profile)
+        risk = np.stack([source.trajectory(episode)[:max_weeks + 1] for episode in range(episodes)])
+    else:
+        risk = make_risk_process(risk_profile).generate(episodes, max_weeks, rng)
+    return initial_infected, risk
+
+
+def rollout_policy(policy_spec, alphas, students_per_course, initial_infected, risk, max_weeks=16):
+    """Rolls out one policy for every alpha and scenario at once.
+
+    Returns:
+        An array of shape (len(alphas), episodes, len(METRICS)), NaN when the policy does not
+        fit the number of courses.
+    """
+    episodes = initial_infected.shape[0]
+    num_alphas = len(alphas)
+    results = np.full((num_alphas, episodes, len(METRICS)), np.nan)
+    try:
+        policy = load_policy(policy_spec, len(students_per_course), students_per_course)
+    except ValueError:
+        return results
+
+    simulation = VectorizedSimulation(students_per_course, num_alphas * episodes, max_weeks=max_weeks)
+    observation = simulation.reset(risk_trajectories=np.tile(risk, (num_alphas, 1)),
+                                   initial_infected=np.tile(initial_infected, (num_alphas, 1)))
+    env_alpha = np.repeat(np.asarray(alphas, dtype=np.float64), episodes)
+    totals = np.zeros((num_alphas * episodes, len(METRICS)))
+    done = False
+    while not done:
+        actions = policy(discretize_observation(observation))
+        observation, reward, done, info = simulation.step(actions, env_alpha)
+        totals[:, 0] += reward
+        totals[:, 1] += info['infected'].sum(axis=1)
+        totals[:, 2] += info['allowed'].sum(axis=1)
+    results[:] = totals.reshape(num_alphas, episodes, len(METRICS))
+    return results
+
+
+def evaluate_scenario_cube(policies, alphas, risk_profiles, class_sizes, episodes=100, max_weeks=16, seed=100,
+                           n_jobs=-1):
+    """Evaluates every combination of policy, alpha, risk profile and class-size configuration.
+
+    Args:
+        policies: Policy specs of ``load_policy``, e.g. ``'random'``, ``'threshold'`` or paths of saved Q-tables.
+        alphas: Reward weights.
+        risk_profiles: Names of built-in risk processes or ``.npy`` trajectory files.
+        class_sizes: List of ``students_per_course`` lists.
+        episodes: Number of scenarios per (risk profile, class size).
+        max_weeks: Number of weeks per episode.
+        seed: Base seed of the scenarios.
+        n_jobs: Number of joblib workers.
+    Returns:
+        A ``ScenarioCube``.
+    """
+    scenarios = {}
+    for r, risk_profile in enumerate(risk_profiles):
+        for c, students_per_course in enumerate(class_sizes):
+            scenarios[r, c] = make_scenarios(risk_profile, students_per_course, episodes, max_weeks, [seed, r, c])
+
+    tasks = [(p, r, c) for p in range(len(policies)) for r in range(len(risk_profiles)) for c in range(len(class_sizes))]
+    outputs = Parallel(n_jobs=n_jobs)(
+        delayed(rollout_policy)(policies[p], alphas, class_sizes[c], *scenarios[r, c], max_weeks=max_weeks)
+        for p, r, c in tasks)
+
+    data = np.full((len(policies), len(alphas), len(risk_profiles), len(class_sizes), episodes, len(METRICS)), np.nan)
+    for (p, r, c), output in zip(tasks, outputs):
+        data[p, :, r, c] = output
+
+    coords = {
+        'policy': [policy_name(spec) for spec in policies],
+        'alpha': np.asarray(alphas, dtype=np.float64),
+        'risk_profile': [os.path.splitext(os.path.basename(profile))[0] for profile in risk_profiles],
+        'class_size': [class_size_label(students) for students in class_sizes],
+        'episode': np.arange(episodes),
+        'metric': METRICS,
+    }
+    return ScenarioCube(data, DIMS, coords)
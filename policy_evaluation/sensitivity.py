@@ -0,0 +1,210 @@
+"""Global (Sobol) sensitivity analysis of semester outcomes to the epidemic model constants.
+
+Parameter sets are drawn with Saltelli's scheme from a scrambled Sobol sequence. Every set
+is evaluated by rolling out a fixed policy with ``VectorizedSimulation`` on the same
+scenarios (initial infections and community risk trajectories), and the outcomes are
+total infections, total allowed attendance and the return for every alpha. Chunks of
+parameter sets are simulated in parallel with joblib; first-order (S1) and total (ST)
+indices are estimated with the Saltelli (2010) and Jansen estimators and bootstrap
+confidence intervals.
+
+Example:
+    result = run_sensitivity_analysis(policy='constant_2', model='estimate', num_samples=16384, alphas=[0.2, 0.8])
+    print(result.summary())
+"""
+import functools
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import norm, qmc
+from campus_digital_twin.vectorized import VectorizedSimulation, discretize_observation
+from epidemic_models.analyze_models import BREATH_RATE, D0, ROOM_ACH, estimate_infected_students_vectorized, \
+    get_infected_students_vectorized
+from .policies import load_policy
+from .scenario_cube import make_scenarios
+
+# Model each constant belongs to and its default range
+PARAMETERS = {
+    'const_1': ('estimate', (0.001, 0.01)),
+    'const_2': ('estimate', (0.005, 0.02)),
+    'room_ach': ('indoor', (ROOM_ACH / 2, ROOM_ACH * 2)),
+    'd0': ('indoor', (D0 / 2, D0 * 2)),
+    'breath_rate': ('indoor', (BREATH_RATE / 2, BREATH_RATE * 2)),
+}
+MODELS = ['estimate', 'indoor']
+
+
+def indoor_infection_model(current_infected, allowed_per_course, community_risk, total_students, **constants):
+    """``get_infected_students_vectorized`` with per-campus constants, for ``VectorizedSimulation``."""
+    constants = {name: np.asarray(value, dtype=np.float64)[:, None] for name, value in constants.items()}
+    return get_infected_students_vectorized(current_infected, allowed_per_course,
+                                            np.asarray(community_risk)[:, None], total_students, **constants)
+
+
+def saltelli_sample(bounds, num_samples, seed=100):
+    """Saltelli samples: the rows of A, then B, then A with column i taken from B, for every i.
+
+    Args:
+        bounds: List of (low, high) per parameter.
+        num_samples: Number of base samples, rounded up to a power of two.
+    Returns:
+        An array of shape (N * (d + 2), d).
+    """
+    d = len(bounds)
+    sobol = qmc.Sobol(d=2 * d, scramble=True, seed=seed)
+    base = sobol.random_base2(int(np.ceil(np.log2(num_samples))))
+    low, high = np.asarray(bounds, dtype=np.float64).T
+    a = qmc.scale(base[:, :d], low, high)
+    b = qmc.scale(base[:, d:], low, high)
+    ab = np.repeat(a[None], d, axis=0)
+    for i in range(d):
+        ab[i, :, i] = b[:, i]
+    return np.concatenate([a, b, ab.reshape(-1, d)])
+
+
+def sobol_indices(outputs, num_parameters, num_resamples=100, confidence=0.95, seed=100):
+    """First-order and total Sobol indices of one output evaluated on ``saltelli_sample`` rows.
+
+    Returns:
+        A dict with ``S1``, ``ST`` and the half-widths ``S1_conf``, ``ST_conf``, arrays of
+        shape (num_parameters,).
+    """
+    d = num_parameters
+    n = len(outputs) // (d + 2)
+    # Centering does not change the indices but reduces the variance of the S1 estimator
+    outputs = outputs - outputs.mean()
+    f_a = outputs[:n]
+    f_b = outputs[n:2 * n]
+    f_ab = outputs[2 * n:].reshape(d, n)
+
+    def estimate(index):
+        a, b, ab = f_a[index], f_b[index], f_ab[:, index]
+        variance = np.var(np.concatenate([a, b], axis=-1), axis=-1)
+        variance = np.where(variance > 0, variance, np.nan)
+        first = np.mean(b * (ab - a), axis=-1) / variance
+        total = 0.5 * np.mean((a - ab) ** 2, axis=-1) / variance
+        return np.nan_to_num(first), np.nan_to_num(total)
+
+    s1, st = estimate(np.arange(n))
+    resamples = np.random.default_rng(seed).integers(0, n, size=(num_resamples, n))
+    s1_boot, st_boot = estimate(resamples)
+    z = norm.ppf(0.5 + confidence / 2)
+    return {'S1': s1, 'ST': st, 'S1_conf': z * s1_boot.std(axis=1), 'ST_conf': z * st_boot.std(axis=1)}
+
+
+def output_names(alphas):
+    return ['infected', 'allowed'] + [f'return_{alpha:g}' for alpha in alphas]
+
+
+def evaluate_samples(samples, parameters, model, policy_spec, students_per_course, alphas, initial_infected, risk,
+                     max_weeks=16):
+    """Semester outcomes of every parameter set, averaged over the shared scenarios.
+
+    Returns:
+        An array of shape (len(samples), len(output_names(alphas))).
+    """
+    num_sets = len(samples)
+    episodes = len(initial_infected)
+    constants = {name: np.repeat(samples[:, k], episodes) for k, name in enumerate(parameters)}
+    if model == 'indoor':
+        infection_model = functools.partial(indoor_infection_model, total_students=np.asarray(students_per_course))
+    else:
+        infection_model = estimate_infected_students_vectorized
+    simulation = VectorizedSimulation(students_per_course, num_sets * episodes, max_weeks=max_weeks,
+                                      infection_model=infection_model, model_constants=constants)
+    observation = simulation.reset(risk_trajectories=np.tile(risk, (num_sets, 1)),
+                                   initial_infected=np.tile(initial_infected, (num_sets, 1)))
+    policy = load_policy(policy_spec, len(students_per_course), students_per_course)
+
+    alphas = np.asarray(alphas, dtype=np.float64)[None, :, None]
+    totals = np.zeros((num_sets * episodes, 2 + alphas.shape[1]))
+    done = False
+    while not done:
+        actions = policy(discretize_observation(observation))
+        observation, _, done, info = simulation.step(actions, 0.0)
+        allowed, infected = info['allowed'][:, None, :], info['infected'][:, None, :]
+        totals[:, 0] += info['infected'].sum(axis=1)
+        totals[:, 1] += info['allowed'].sum(axis=1)
+        totals[:, 2:] += np.trunc(alphas * allowed - (1 - alphas) * infected).sum(axis=2)
+    return totals.reshape(num_sets, episodes, -1).mean(axis=1)
+
+
+class SensitivityResult:
+    """Samples, outcomes and Sobol indices of a sensitivity analysis.
+
+    ``S1``, ``ST``, ``S1_conf`` and ``ST_conf`` have shape (outputs, parameters).
+    """
+
+    def __init__(self, parameters, bounds, outputs, samples, evaluations, indices):
+        self.parameters = list(parameters)
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.outputs = list(outputs)
+        self.samples = samples
+        self.evaluations = evaluations
+        self.indices = indices
+
+    def summary(self):
+        lines = [f"{'output':<14}{'parameter':<14}{'S1':>18}{'ST':>18}"]
+        for o, output in enumerate(self.outputs):
+            for p, parameter in enumerate(self.parameters):
+                s1 = f"{self.indices['S1'][o, p]:.3f} ± {self.indices['S1_conf'][o, p]:.3f}"
+                st = f"{self.indices['ST'][o, p]:.3f} ± {self.indices['ST_conf'][o, p]:.3f}"
+                lines.append(f"{output:<14}{parameter:<14}{s1:>18}{st:>18}")
+        return '\n'.join(lines)
+
+    def save(self, path):
+        np.savez_compressed(path, parameters=np.array(self.parameters), bounds=self.bounds,
+                            outputs=np.array(self.outputs), samples=self.samples, evaluations=self.evaluations,
+                            **self.indices)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            indices = {key: archive[key] for key in ('S1', 'ST', 'S1_conf', 'ST_conf')}
+            return cls(archive['parameters'].tolist(), archive['bounds'], archive['outputs'].tolist(),
+                       archive['samples'], archive['evaluations'], indices)
+
+
+def run_sensitivity_analysis(policy='constant_2', model='estimate', parameters=None, bounds=None, num_samples=4096,
+                             alphas=(0.5,), students_per_course=(100,), episodes=10, risk_profile='high_low',
+                             max_weeks=16, seed=100, chunk_size=2048, n_jobs=-1):
+    """Sobol sensitivity of semester outcomes to the constants of one epidemic model.
+
+    Args:
+        policy: Policy spec of ``load_policy``, fixed for every parameter set.
+        model: ``'estimate'`` (``estimate_infected_students``) or ``'indoor'`` (``get_infected_students``).
+        parameters: Constants to vary, all constants of ``model`` by default.
+        bounds: List of (low, high) per parameter, ``PARAMETERS`` ranges by default.
+        num_samples: Base samples N. The model is evaluated N * (len(parameters) + 2) times.
+        alphas: Reward weights of the return outputs.
+        students_per_course: Course layout of the simulated campus.
+        episodes: Scenarios every parameter set is averaged over.
+        risk_profile: Risk process name or trajectory ``.npy`` file of the scenarios.
+        chunk_size: Parameter sets simulated together by one worker.
+        n_jobs: Number of joblib worker processes.
+    Returns:
+        A ``SensitivityResult``.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}")
+    if parameters is None:
+        parameters = [name for name, (owner, _) in PARAMETERS.items() if owner == model]
+    for name in parameters:
+        if name not in PARAMETERS or PARAMETERS[name][0] != model:
+            raise ValueError(f"{name!r} is not a constant of the {model!r} model")
+    if bounds is None:
+        bounds = [PARAMETERS[name][1] for name in parameters]
+
+    students_per_course = list(students_per_course)
+    initial_infected, risk = make_scenarios(risk_profile, students_per_course, episodes, max_weeks, seed)
+    samples = saltelli_sample(bounds, num_samples, seed)
+    chunks = [samples[start:start + chunk_size] for start in range(0, len(samples), chunk_size)]
+    evaluations = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_samples)(chunk, parameters, model, policy, students_per_course, alphas, initial_infected,
+                                  risk, max_weeks)
+        for chunk in chunks)
+    evaluations = np.concatenate(evaluations)
+
+    outputs = output_names(alphas)
+    per_output = [sobol_indices(evaluations[:, o], len(parameters), seed=seed) for o in range(len(outputs))]
+    indices = {key: np.stack([result[key] for result in per_output]) for key in per_output[0]}
+    return SensitivityResult(parameters, bounds, outputs, samples, evaluations, indices)
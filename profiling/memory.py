@@ -0,0 +1,207 @@
+"""Memory usage of the training loops over time.
+
+Every ``interval`` episodes a ``MemoryTracker`` records:
+
+- the resident set size (RSS) of the process,
+- the memory traced by ``tracemalloc`` (current and peak) and its top allocation sites,
+- the size of every registered subsystem, e.g. the Q-table, the replay memory or the
+  history lists of the loop, measured by walking the objects,
+- the open matplotlib figures and the memory allocated by matplotlib code.
+
+``save`` writes the samples as ``memory_<loop>.csv`` (one row per sample), the top
+allocation sites of every sample as ``memory_sites_<loop>.jsonl`` and the peak of every
+column as ``memory_summary_<loop>.json``. ``tracemalloc`` slows down every allocation
+while it traces, so tracking is meant for diagnosing growth, not for timed runs. A
+disabled tracker returns from every call immediately, so the calls can stay in the loops.
+
+Example:
+    memory = MemoryTracker(interval=100)
+    memory.track('q_table', lambda: agent.q_table)
+    memory.start()
+    for episode in range(episodes):
+        ...
+        memory.sample(episode)
+    memory.stop()
+    memory.save(results_subdirectory, 'train')
+"""
+import csv
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import deque
+import numpy as np
+
+MB = 1024 ** 2
+TRACEBACK_FRAMES = 1
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where ``/proc`` is not available."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def object_size(obj):
+    """Bytes of ``obj`` and everything it refers to through containers.
+
+    Arrays count their buffer, torch tensors their storage; shared objects are counted once.
+    """
+    seen = set()
+    size = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            # A view only owns its header, the buffer belongs to the base array
+            size += sys.getsizeof(item) if item.base is not None else item.nbytes + sys.getsizeof(item)
+        elif hasattr(item, 'element_size') and hasattr(item, 'nelement'):
+            size += item.element_size() * item.nelement()
+        elif isinstance(getattr(item, 'nbytes', None), int):
+            # Array containers such as SparseQTable
+            size += item.nbytes + sys.getsizeof(item)
+        else:
+            size += sys.getsizeof(item)
+            if isinstance(item, dict):
+                pending.extend(item.keys())
+                pending.extend(item.values())
+            elif isinstance(item, (list, tuple, set, frozenset, deque)):
+                pending.extend(item)
+    return size
+
+
+def matplotlib_figures():
+    """Number of open pyplot figures, without importing matplotlib when it is not loaded."""
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    return len(pyplot.get_fignums()) if pyplot else 0
+
+
+class MemoryTracker:
+    """Samples process, traced and per-subsystem memory every ``interval`` episodes.
+
+    Args:
+        interval: Episodes between samples, 0 disables tracking.
+        top: Allocation sites recorded per sample.
+    """
+
+    def __init__(self, interval=0, top=10):
+        self.interval = interval
+        self.enabled = interval > 0
+        self.top = top
+        self.subsystems = {}
+        self.samples = []
+        self.sites = []
+        self._start = None
+        self._started_tracing = False
+
+    def track(self, name, objects):
+        """Registers a subsystem, measured with ``object_size(objects())`` at every sample."""
+        if not self.enabled:
+            return
+        self.subsystems[name] = objects
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._start = time.perf_counter()
+        # Tracing started elsewhere, e.g. with PYTHONTRACEMALLOC, is left running
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._started_tracing = True
+
+    def stop(self):
+        if not self.enabled:
+            return
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def sample(self, episode, force=False):
+        """Records a sample when ``episode`` is a multiple of ``interval`` or ``force`` is set.
+
+        Returns:
+            The sample in MB, keyed for ``wandb.log``, or an empty dict when nothing was recorded.
+        """
+        if not self.enabled or not tracemalloc.is_tracing() or (episode % self.interval and not force):
+            return {}
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        matplotlib_traced = sum(stat.size for stat in snapshot.filter_traces(
+            [tracemalloc.Filter(True, '*matplotlib*')]).statistics('filename'))
+
+        sample = {
+            'episode': episode,
+            'seconds': time.perf_counter() - self._start,
+            'rss_mb': rss_bytes() / MB,
+            'traced_mb': traced / MB,
+            'traced_peak_mb': traced_peak / MB,
+        }
+        for name, objects in self.subsystems.items():
+            sample[f'{name}_mb'] = object_size(objects()) / MB
+        sample['matplotlib_mb'] = matplotlib_traced / MB
+        sample['matplotlib_figures'] = matplotlib_figures()
+        self.samples.append(sample)
+
+        self.sites.append({'episode': episode, 'sites': [
+            {'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", 'mb': stat.size / MB,
+             'blocks': stat.count}
+            for stat in snapshot.statistics('lineno')[:self.top]]})
+        return {f'memory/{key}': value for key, value in sample.items() if key != 'episode'}
+
+    def summary(self):
+        """Peak of every sampled column, the episode it occurred in and the peak RSS of the process."""
+        peaks = {}
+        for key in self.samples[0] if self.samples else []:
+            if key in ('episode', 'seconds'):
+                continue
+            peak = max(self.samples, key=lambda sample: sample[key])
+            peaks[key] = {'peak': peak[key], 'episode': peak['episode']}
+        return {'samples': len(self.samples), 'interval': self.interval, 'peak_rss_mb': peak_rss_bytes() / MB,
+                'peaks': peaks}
+
+    def summary_metrics(self, prefix='memory_summary/'):
+        """Peaks of ``summary`` flattened for ``wandb.log``."""
+        summary = self.summary()
+        metrics = {f'{prefix}{key}/peak': peak['peak'] for key, peak in summary['peaks'].items()}
+        metrics[f'{prefix}peak_rss_mb'] = summary['peak_rss_mb']
+        return metrics
+
+    def save(self, directory, loop_name):
+        """Writes ``memory_<loop_name>.csv``, ``memory_sites_<loop_name>.jsonl`` and ``memory_summary_<loop_name>.json``."""
+        if not self.enabled or not self.samples:
+            return
+        with open(os.path.join(directory, f'memory_{loop_name}.csv'), 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.samples[0]))
+            writer.writeheader()
+            writer.writerows(self.samples)
+        with open(os.path.join(directory, f'memory_sites_{loop_name}.jsonl'), 'w') as file:
+            for sites in self.sites:
+                file.write(json.dumps(sites) + '\n')
+        with open(os.path.join(directory, f'memory_summary_{loop_name}.json'), 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = [f"{'memory':<24}{'peak MB':>12}{'episode':>10}"]
+        for key, peak in summary['peaks'].items():
+            value = f"{peak['peak']:>12.0f}" if key == 'matplotlib_figures' else f"{peak['peak']:>12.2f}"
+            lines.append(f"{key.replace('_mb', ''):<24}{value}{peak['episode']:>10}")
+        lines.append(f"{'process peak rss':<24}{summary['peak_rss_mb']:>12.2f}")
+        return '\n'.join(lines)
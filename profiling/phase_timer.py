@@ -0,0 +1,110 @@
+"""Wall-clock time per phase of the training and evaluation loops.
+
+A loop marks the start of its first phase and calls ``lap(name)`` at the end of every
+phase, which adds the time since the previous mark to ``name``. ``end_episode`` closes the
+per-episode totals. Time is measured with ``time.perf_counter`` (monotonic). A disabled
+timer returns from every call immediately, so the calls can stay in the loops.
+
+Example:
+    timer = PhaseTimer(enabled=True)
+    for episode in range(episodes):
+        timer.mark()
+        state = env.reset()
+        timer.lap('reset')
+        ...
+        timer.end_episode()
+    timer.save_summary('results/phase_timings.json')
+"""
+import json
+import time
+from collections import defaultdict
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class PhaseTimer:
+    """Accumulates seconds per phase, per episode and over the whole run.
+
+    Args:
+        enabled: Measure time. A disabled timer records nothing.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.episodes = []
+        self._episode = defaultdict(float)
+        self._last = None
+
+    def mark(self):
+        """Starts timing the next phase."""
+        if not self.enabled:
+            return
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        """Adds the time since the previous mark or lap to ``name`` and starts the next phase."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._last is not None:
+            elapsed = now - self._last
+            self._episode[name] += elapsed
+            self.totals[name] += elapsed
+        self._last = now
+
+    def end_episode(self):
+        """Closes the per-episode totals.
+
+        Returns:
+            Seconds per phase of the episode, an empty dict when disabled.
+        """
+        if not self.enabled:
+            return {}
+        episode = dict(self._episode)
+        self.episodes.append(episode)
+        self._episode = defaultdict(float)
+        return episode
+
+    def episode_metrics(self, episode=None, prefix='timing/'):
+        """Seconds per phase of the last (or given) episode, keyed for ``wandb.log``."""
+        if not self.enabled or not self.episodes:
+            return {}
+        episode = self.episodes[-1] if episode is None else episode
+        return {f'{prefix}{name}': seconds for name, seconds in episode.items()}
+
+    def summary(self):
+        """Totals, share of the run and percentiles over episodes of every phase."""
+        run_total = sum(self.totals.values())
+        phases = {}
+        for name, total in sorted(self.totals.items(), key=lambda item: -item[1]):
+            per_episode = np.array([episode.get(name, 0.0) for episode in self.episodes])
+            phase = {'total': total, 'share': total / run_total if run_total else 0.0}
+            if per_episode.any():
+                phase['episode_mean'] = float(per_episode.mean())
+                phase.update({f'episode_p{q}': float(np.percentile(per_episode, q)) for q in PERCENTILES})
+                phase['episode_max'] = float(per_episode.max())
+            phases[name] = phase
+        return {'episodes': len(self.episodes), 'total': run_total, 'phases': phases}
+
+    def summary_metrics(self, prefix='timing_summary/'):
+        """``summary`` flattened for ``wandb.log``."""
+        metrics = {}
+        for name, phase in self.summary()['phases'].items():
+            metrics.update({f'{prefix}{name}/{key}': value for key, value in phase.items()})
+        return metrics
+
+    def save_summary(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = [f"{'phase':<20}{'total s':>10}{'share':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"]
+        for name, phase in summary['phases'].items():
+            # Phases outside of episodes, e.g. plotting after training, have no percentiles
+            percentiles = ''.join(f"{phase[f'episode_p{q}'] * 1e3:>10.3f}" if 'episode_mean' in phase else f"{'-':>10}"
+                                  for q in PERCENTILES)
+            lines.append(f"{name:<20}{phase['total']:>10.3f}{phase['share']:>8.1%}{percentiles}")
+        return '\n'.join(lines)
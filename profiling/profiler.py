@@ -0,0 +1,153 @@
+"""Whole-run CPU profiles of ``main.py`` modes.
+
+Two profilers are available:
+
+- ``cprofile``: deterministic ``cProfile`` of every call. Exact call counts, but every
+  Python call is slowed down.
+- ``sampling``: a background thread records the stack of the profiled thread every
+  ``interval`` seconds. Low overhead, statistical times, no call counts.
+
+Both write a ``profile.prof`` file readable with ``pstats``/snakeviz and a
+``profile.collapsed`` file with one ``frame;frame;...;frame count`` line per sampled stack,
+the input of flamegraph.pl, speedscope and inferno. cProfile only records caller/callee
+pairs, not whole stacks, so the stacks are sampled in both modes. Work done in worker
+processes (vector environments, joblib) is not profiled.
+
+Example:
+    result = profile_call(lambda: agent.train(0.5), 'sampling', 'results/profiles/train')
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILERS = ['cprofile', 'sampling']
+MAX_STACK_DEPTH = 128
+
+
+def frame_label(function):
+    """``func (file:line)`` label of a (filename, line, name) key, without the ``;`` stack separator."""
+    filename, lineno, name = function
+    return f"{name} ({filename}:{lineno})".replace(';', ',')
+
+
+class SamplingProfiler:
+    """Samples the Python stack of one thread from a background thread.
+
+    Args:
+        interval: Seconds between samples.
+        thread_id: Thread to sample, the calling thread by default.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_stack(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stack = self._sample_stack()
+            if stack:
+                self.samples[stack] += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def pstats_dict(self):
+        """Samples as a ``pstats`` stats dict, times in seconds, call counts in samples."""
+        own = Counter()
+        cumulative = Counter()
+        edges = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                cumulative[function] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges[caller, callee] += count
+        callers = {}
+        for (caller, callee), count in edges.items():
+            callers.setdefault(callee, {})[caller] = (count, count, 0.0, count * self.interval)
+        return {function: (count, count, own[function] * self.interval, count * self.interval,
+                           callers.get(function, {}))
+                for function, count in cumulative.items()}
+
+
+def write_collapsed(stacks, path):
+    with open(path, 'w') as file:
+        for stack, value in sorted(stacks.items()):
+            file.write(';'.join(frame_label(function) for function in stack) + f" {value}\n")
+
+
+def hotspot_table(stats, top=20, sort='tottime'):
+    """The ``top`` functions by own time (``tottime``) or cumulative time (``cumulative``)."""
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(sort).print_stats(top)
+    # Skip the pstats header up to the column names
+    lines = output.getvalue().splitlines()
+    start = next((i for i, line in enumerate(lines) if line.lstrip().startswith('ncalls')), 0)
+    return '\n'.join(line for line in lines[start:] if line.strip())
+
+
+def profile_call(function, profiler, output_dir, top=20, interval=0.005):
+    """Runs ``function`` under a profiler and writes ``profile.prof`` and ``profile.collapsed``.
+
+    Args:
+        function: Callable without arguments.
+        profiler: ``'cprofile'`` or ``'sampling'``.
+        output_dir: Directory of the profile files, created if needed.
+        top: Number of functions in the printed hotspot table.
+        interval: Seconds between samples of the sampling profiler.
+    Returns:
+        The return value of ``function``.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+    os.makedirs(output_dir, exist_ok=True)
+    prof_path = os.path.join(output_dir, 'profile.prof')
+    collapsed_path = os.path.join(output_dir, 'profile.collapsed')
+
+    start = time.perf_counter()
+    sampler = SamplingProfiler(interval)
+    profile = cProfile.Profile() if profiler == 'cprofile' else None
+    sampler.start()
+    try:
+        result = profile.runcall(function) if profile else function()
+    finally:
+        sampler.stop()
+        write_collapsed(sampler.samples, collapsed_path)
+        if profile:
+            profile.dump_stats(prof_path)
+            stats = pstats.Stats(prof_path)
+        else:
+            with open(prof_path, 'wb') as file:
+                marshal.dump(sampler.pstats_dict(), file)
+            # pstats cannot load a profile without entries
+            stats = pstats.Stats(prof_path) if sampler.samples else None
+    elapsed = time.perf_counter() - start
+
+    print(f"\nProfile ({profiler}, {elapsed:.1f}s) saved to {prof_path} and {collapsed_path}")
+    print(hotspot_table(stats, top) if stats else "No samples, the run was shorter than the sampling interval.")
+    return result
@@ -3,7 +3,19 @@ import matplotlib.pyplot as plt
 matplotlib.use('Agg')
 import numpy as np
 import itertools
+import gymnasium as gym
+from campus_gym.envs.codec import CourseSymmetry
+from campus_gym.envs.campus_gym_vector_env import check_same_campus
 from .utilities import load_config
+from training.exploration import ExplorationRateDecay
+from profiling.phase_timer import PhaseTimer
+from profiling.memory import MemoryTracker
+from training.early_stopping import EarlyStopping
+from .decomposed import ANCHOR_ALPHAS, DecomposedQTable
+from .planning import PrioritizedSweeping
+from .q_table import FactoredQTable, SparseQTable, SymmetricQTable, greedy_actions, make_q_table, max_values, \
+    q_table_metadata, save_q_table as save_q_table_file, check_q_table_metadata, load_q_table, load_q_table_metadata, \
+    transfer_q_values
 from .visualizer import visualize_all_states, visualize_q_table, visualize_variance_in_rewards_heatmap, \
     visualize_explained_variance, visualize_variance_in_rewards, visualize_infected_vs_community_risk_table, states_visited_viz
 import os
@@ -26,93 +38,6 @@ import pandas as pd
 SEED = 100
 random.seed(SEED)
 np.random.seed(SEED)
-class ExplorationRateDecay:
-    def __init__(self, max_episodes, min_exploration_rate, initial_exploration_rate):
-        self.max_episodes = max_episodes
-        self.min_exploration_rate = min_exploration_rate
-        self.initial_exploration_rate = initial_exploration_rate
-        self.current_decay_function = 1  # Variable to switch between different decay functions
-
-    def set_decay_function(self, decay_function_number):
-        self.current_decay_function = decay_function_number
-
-    def get_exploration_rate(self, episode):
-        if self.current_decay_function == 1:  # Exponential Decay
-            exploration_rate = self.initial_exploration_rate * np.exp(-episode / self.max_episodes)
-
-        elif self.current_decay_function == 2:  # Linear Decay
-            exploration_rate = self.initial_exploration_rate - (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (episode / self.max_episodes)
-
-        elif self.current_decay_function == 3:  # Polynomial Decay
-            exploration_rate = self.initial_exploration_rate * (1 - episode / self.max_episodes) ** 2
-
-        elif self.current_decay_function == 4:  # Inverse Time Decay
-            exploration_rate = self.initial_exploration_rate / (1 + episode)
-
-        elif self.current_decay_function == 5:  # Sine Wave Decay
-            exploration_rate = self.min_exploration_rate + 0.5 * (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (
-                                           1 + np.sin(np.pi * episode / self.max_episodes))
-
-        elif self.current_decay_function == 6:  # Logarithmic Decay
-            exploration_rate = self.initial_exploration_rate - (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.log(episode + 1) / np.log(
-                self.max_episodes + 1)
-
-        elif self.current_decay_function == 7:  # Hyperbolic Tangent Decay
-            exploration_rate = self.min_exploration_rate + 0.5 * (
-                        self.initial_exploration_rate - self.min_exploration_rate) * (
-                                           1 - np.tanh(episode / self.max_episodes))
-        elif self.current_decay_function == 8:  # Square Root Decay
-            exploration_rate = self.initial_exploration_rate * (1 - np.sqrt(episode / self.max_episodes))
-        elif self.current_decay_function == 9:  # Stepwise Decay
-            steps = 10
-            step_size = (self.initial_exploration_rate - self.min_exploration_rate) / steps
-            exploration_rate = self.initial_exploration_rate - (episode // (self.max_episodes // steps)) * step_size
-        elif self.current_decay_function == 10:  # Inverse Square Root Decay
-            exploration_rate = self.initial_exploration_rate / np.sqrt(episode + 1)
-        elif self.current_decay_function == 11:  # Sigmoid Decay
-            midpoint = self.max_episodes / 2
-            smoothness = self.max_episodes / 10  # Adjust this divisor to change smoothness
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) / (
-                                           1 + np.exp((episode - midpoint) / smoothness))
-        elif self.current_decay_function == 12:  # Quadratic Decay
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** 2)
-        elif self.current_decay_function == 13:  # Cubic Decay
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** 3)
-        elif self.current_decay_function == 14:  # Sine Squared Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.sin(
-                np.pi * episode / self.max_episodes)
-        elif self.current_decay_function == 15:  # Cosine Squared Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) * np.cos(
-                np.pi * episode / self.max_episodes) ** 2
-        elif self.current_decay_function == 16:  # Double Exponential Decay
-            exploration_rate = self.initial_exploration_rate * np.exp(-np.exp(episode / self.max_episodes))
-        elif self.current_decay_function == 17:  # Log-Logistic Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) / (1 + np.log(episode + 1))
-        elif self.current_decay_function == 18:  # Harmonic Series Decay
-            exploration_rate = self.min_exploration_rate + (
-                        self.initial_exploration_rate - self.min_exploration_rate) / (
-                                           1 + np.sum(1 / np.arange(1, episode + 2)))
-        elif self.current_decay_function == 19:  # Piecewise Linear Decay
-            if episode < self.max_episodes / 2:
-                exploration_rate = self.initial_exploration_rate - (
-                            self.initial_exploration_rate - self.min_exploration_rate) * (
-                                               2 * episode / self.max_episodes)
-            else:
-                exploration_rate = self.min_exploration_rate
-        elif self.current_decay_function == 20:  # Custom Polynomial Decay
-            p = 3  # Change the power for different polynomial behaviors
-            exploration_rate = self.initial_exploration_rate * (1 - (episode / self.max_episodes) ** p)
-        else:
-            raise ValueError("Invalid decay function number")
-
-        return exploration_rate
 
 
 # Function to log the visualizations to wandb
@@ -144,6 +69,10 @@ class QLearningAgent:
         log_file_path = os.path.join(self.results_subdirectory, 'agent_log.txt')
         logging.basicConfig(filename=log_file_path, level=logging.INFO)
         # Initialize agent-specific configurations and variables
+        if env.unwrapped.info_level != 'full':
+            # The training and test loops read the allowed and infected students of every course from info
+            raise ValueError(f"QLearningAgent needs an environment created with info_level='full', "
+                             f"not {env.unwrapped.info_level!r}")
         self.env = env
         self.run_name = run_name
         self.max_episodes = self.agent_config['agent']['max_episodes']
@@ -157,13 +86,28 @@ class QLearningAgent:
         self.learning_rate_decay = self.agent_config['agent']['learning_rate_decay']
         self.min_learning_rate = self.agent_config['agent']['min_learning_rate']
 
-        # Initialize q table
-        rows = np.prod(env.observation_space.nvec)
-        columns = np.prod(env.action_space.nvec)
-        self.q_table = np.zeros((rows, columns))
-
-        # Initialize the Q-table with values from the CSV file
-        # self.initialize_q_table_from_csv('policy_data.csv')
+        # Flat state indices, also valid for environments created with observation_mode='index'
+        self.state_codec = env.unwrapped.state_codec
+        # Joint action indices and their per-course percentages
+        self.action_codec = env.unwrapped.action_codec
+
+        # Initialize q table, a dense array or rows allocated for visited states only (q_learning/q_table.py)
+        rows = self.state_codec.num_states
+        columns = self.action_codec.num_actions
+        self.q_table_backend = self.agent_config['agent'].get('q_table', 'dense')
+        self.q_table_dtype = self.agent_config['agent'].get('q_table_dtype', 'float64')
+        # Type of the saved Q-table, e.g. float16 for archives; the training type by default
+        self.q_table_archive_dtype = self.agent_config['agent'].get('q_table_archive_dtype')
+        # joint: one value per joint action; factored: additive per-course values (FactoredQTable)
+        self.action_values = self.agent_config['agent'].get('action_values', 'joint')
+        # One row per canonical state when courses of the same size are exchangeable (SymmetricQTable)
+        self.course_symmetry = None
+        if self.agent_config['agent'].get('symmetry', False):
+            self.course_symmetry = CourseSymmetry(env.unwrapped.students_per_course, self.state_codec.nvec,
+                                                  self.action_codec.nvec)
+        # Q-table, run name or policy CSV the Q-table starts from instead of zeros
+        self.warm_start = self.agent_config['agent'].get('warm_start')
+        self.q_table = self.initial_q_table()
 
         # Visualize the Q-table after initialization
         # self.visualize_q_table()
@@ -173,11 +117,8 @@ class QLearningAgent:
         # Initialize other required variables and structures
         self.training_data = []
         self.possible_actions = [list(range(0, (k))) for k in self.env.action_space.nvec]
-        self.possible_states = [list(range(0, (k))) for k in self.env.observation_space.nvec]
+        self.possible_states = [list(range(0, (k))) for k in self.state_codec.nvec]
         self.all_actions = [str(i) for i in list(itertools.product(*self.possible_actions))]
-        self.all_states = [str(i) for i in list(itertools.product(*self.possible_states))]
-
-        self.states = list(itertools.product(*self.possible_states))
 
         # Initialize state visit counts for count-based exploration
         self.state_visits = np.zeros(rows)
@@ -186,14 +127,84 @@ class QLearningAgent:
         self.moving_average_window = 100  # Number of episodes to consider for moving average
         self.stopping_criterion = 0.01  # Threshold for stopping
         self.prev_moving_avg = -float('inf')  # Initialize to negative infinity to ensure any reward is considered an improvement in the first episode.
-        self.state_action_visits = np.zeros((rows, columns))
+        # Joint visit counts, sparse with factored action values to keep memory linear in the courses
+        visits_backend = 'sparse' if self.action_values == 'factored' else self.q_table_backend
+        self.state_action_visits = make_q_table(visits_backend, rows, columns)
 
-        self.decay_handler = ExplorationRateDecay(self.max_episodes, self.min_exploration_rate, self.exploration_rate)
+        self.decay_handler = ExplorationRateDecay(self.max_episodes, self.min_exploration_rate, self.exploration_rate,
+                                                  squared_sine=False)
         self.decay_function = self.agent_config['agent']['e_decay_function']
 
+        # Number of environment copies collecting experience in parallel
+        self.num_envs = self.agent_config['agent'].get('num_envs', 1)
+
+        # Time spent per phase of the training and evaluation loops
+        self.phase_timers = self.agent_config['agent'].get('phase_timers', False)
+        self.phase_timer = PhaseTimer(self.phase_timers)
+
+        # Memory usage sampled every track_memory training episodes, 0 disables it
+        self.track_memory = self.agent_config['agent'].get('track_memory', 0)
+        self.memory_tracker = MemoryTracker(self.track_memory)
+
+        # Convergence-based early stopping, and the Optuna trial of the run (set by main.py optuna)
+        self.early_stopping_config = self.agent_config['agent'].get('early_stopping')
+        self.trial = None
+        self.early_stopping = EarlyStopping.from_config(self.early_stopping_config)
+
+        # Model of the observed transitions and planning backups per real step (Dyna-Q)
+        self.planning_config = self.agent_config['agent'].get('planning')
+        self.planner = self.new_planner()
+
+    def new_q_table(self):
+        """An all-zero Q-table of the configured action values, backend, type and symmetry."""
+        symmetry = self.course_symmetry
+        rows = symmetry.num_canonical_states if symmetry else self.state_codec.num_states
+        if self.action_values == 'factored':
+            q_table = FactoredQTable(rows, self.action_codec.nvec, self.q_table_dtype)
+        else:
+            q_table = make_q_table(self.q_table_backend, rows, self.action_codec.num_actions, self.q_table_dtype)
+        return SymmetricQTable(q_table, symmetry) if symmetry else q_table
+
+    @property
+    def states(self):
+        """Observation levels of every flat state, built on use: 10^6 tuples with five courses."""
+        return list(itertools.product(*self.possible_states))
+
+    @property
+    def all_states(self):
+        """``states`` as strings."""
+        return [str(state) for state in itertools.product(*self.possible_states)]
+
+    def initial_q_table(self):
+        """A new Q-table, warm-started from ``agent.warm_start`` when the config names a source."""
+        q_table = self.new_q_table()
+        return self.warm_start_q_table(q_table) if self.warm_start else q_table
+
+    def warm_start_q_table(self, q_table):
+        """Fills a new Q-table with the values of the ``warm_start`` source.
+
+        The source is a Q-table saved by ``save_q_table`` (with or without extension), the run
+        name of one in the policy directory, or a CSV for ``initialize_q_table_from_csv``. It may
+        have another backend, action values or symmetry setting, but must have been trained on the
+        same courses; the values are converted by ``transfer_q_values``.
+        """
+        path = str(self.warm_start)
+        if path.endswith('.csv'):
+            return self.initialize_q_table_from_csv(path, q_table)
+        if not any(os.path.exists(path + extension) for extension in ('', '.npy', '.npz')):
+            # A run name, with or without the q_table_ prefix of the saved file
+            name = path if path.startswith('q_table_') else f'q_table_{path}'
+            path = os.path.join(self.shared_config['directories']['policy_directory'], name)
+        metadata = load_q_table_metadata(path)
+        check_q_table_metadata(metadata, self.state_codec.nvec, self.action_codec.nvec)
+        transfer_q_values(load_q_table(path, mmap_mode='r'), q_table)
+        source_alpha = (metadata or {}).get('alpha')
+        print(f"Q-table warm-started from {path}" + (f" (alpha {source_alpha})" if source_alpha is not None else ""))
+        return q_table
+
     def log_all_states_visualizations(self, q_table, all_states, states, run_name, max_episodes, alpha, results_subdirectory):
         file_paths = visualize_all_states(q_table, all_states, states, run_name, max_episodes, alpha,
-                                          results_subdirectory, self.env.students_per_course)
+                                          results_subdirectory, self.env.students_per_course, self.action_codec)
 
         # Log all generated visualizations
         # wandb_images = [wandb.Image(path) for path in file_paths]
@@ -204,6 +215,57 @@ class QLearningAgent:
         #     infected_dim = path.split('infected_dim_')[-1].split('.')[0]
         #     wandb.log({f"All States Visualization (Infected Dim {infected_dim})": wandb.Image(path)})
 
+    def report_phase_timings(self, loop_name):
+        """Logs the phase timings of a finished loop and saves them to ``phase_timings_<loop_name>.json``."""
+        if not self.phase_timer.enabled:
+            return
+        self.phase_timer.save_summary(os.path.join(self.results_subdirectory, f'phase_timings_{loop_name}.json'))
+        wandb.log(self.phase_timer.summary_metrics(prefix=f'timing_summary/{loop_name}/'))
+        print(self.phase_timer.format_summary())
+
+    def report_memory(self, loop_name):
+        """Saves the memory samples of a finished loop next to the training log and logs their peaks."""
+        memory = self.memory_tracker
+        if not memory.enabled or not memory.samples:
+            return
+        memory.save(self.results_subdirectory, loop_name)
+        wandb.log(memory.summary_metrics(prefix=f'memory_summary/{loop_name}/'))
+        print(memory.format_summary())
+
+    def new_early_stopping(self):
+        """A fresh early stopper of the agent config for the next training loop."""
+        self.early_stopping = EarlyStopping.from_config(self.early_stopping_config, self.trial)
+        return self.early_stopping
+
+    def new_planner(self):
+        """An empty transition model for the next training loop."""
+        self.planner = PrioritizedSweeping.from_config(self.planning_config, self.action_codec.num_actions)
+        return self.planner
+
+    def plan(self, state_idx, action_idx, reward, next_state_idx):
+        """Adds a real transition to the model and runs the planning backups of the step."""
+        self.planner.observe(self.q_table, state_idx, action_idx, reward, next_state_idx, self.discount_factor)
+        self.planner.plan(self.q_table, self.learning_rate, self.discount_factor)
+
+    def greedy_policy(self):
+        """Greedy action of every visited state and -1 for the others, for the policy stability criterion."""
+        visited = np.flatnonzero(self.state_visits)
+        policy = np.full(self.state_codec.num_states, -1)
+        policy[visited] = greedy_actions(self.q_table, visited)
+        return policy
+
+    def report_early_stopping(self, loop_name):
+        """Saves the checks of early stopping next to the training log and logs the stopping episode."""
+        stopper = self.early_stopping
+        stopper.save(self.results_subdirectory, loop_name)
+        if stopper.stop_episode is not None:
+            print(f"Early stopping after episode {stopper.stop_episode} of {self.max_episodes}")
+            wandb.log({'Stopping Episode': stopper.stop_episode})
+
+    def get_final_performance(self):
+        """Moving average of the average weekly rewards at the end of training, the objective of main.py optuna."""
+        return self.early_stopping.moving_average()
+
     def log_states_visited(self, states, visit_counts, alpha, results_subdirectory):
         file_paths = states_visited_viz(states, visit_counts, alpha, results_subdirectory)
 
@@ -228,24 +290,39 @@ class QLearningAgent:
         plt.ylabel("States")
         plt.savefig(os.path.join(self.results_subdirectory, 'q_table_heatmap.png'))
         plt.close()
-    def initialize_q_table_from_csv(self, csv_file):
-        # Read the CSV file
-        df = pd.read_csv(csv_file)
-
-        # Loop through the CSV and populate the Q-table
-        for index, row in df.iterrows():
-            self.q_table[index, 0] = row['Reward 0']
-            self.q_table[index, 1] = row['Reward 50']
-            self.q_table[index, 2] = row['Reward 100']
+    def initialize_q_table_from_csv(self, csv_file, q_table=None):
+        """Fills a new Q-table (the agent's by default) from a CSV of one row per flat state.
 
+        The columns are the action values of the joint actions in order, or ``Reward <percentage>``
+        columns of the allowed percentages of a single course. Rows past the end of the file stay zero.
+        """
+        q_table = self.q_table if q_table is None else q_table
+        df = pd.read_csv(csv_file)
+        df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
+        if len(self.action_codec.nvec) == 1:
+            reward_columns = [f'Reward {percentage}' for percentage in self.action_codec.percentages[:, 0]]
+            if set(reward_columns) <= set(df.columns):
+                df = df[reward_columns]
+        values = df.to_numpy(dtype=np.float64)
+        if values.shape[1] != q_table.shape[1] or len(values) > q_table.shape[0]:
+            raise ValueError(f"{csv_file} has {values.shape} values, the Q-table has shape {q_table.shape}")
+
+        # Only the rows of the file, a dense source of five courses would not fit in memory
+        source = SparseQTable(*q_table.shape)
+        source[np.arange(len(values))] = values
+        transfer_q_values(source, q_table)
         print("Q-table initialized from CSV.")
-    def save_q_table(self):
+        return q_table
+    def save_q_table(self, alpha=None):
         policy_dir = self.shared_config['directories']['policy_directory']
         if not os.path.exists(policy_dir):
             os.makedirs(policy_dir)
 
-        file_path = os.path.join(policy_dir, f'q_table_{self.run_name}.npy')
-        np.save(file_path, self.q_table)
+        # .npy for a dense and .npz for a sparse Q-table
+        metadata = q_table_metadata(self.state_codec.nvec, self.action_codec.nvec, alpha,
+                                    {'shared': self.shared_config, 'agent': self.agent_config})
+        file_path = save_q_table_file(self.q_table, os.path.join(policy_dir, f'q_table_{self.run_name}'),
+                                      self.q_table_archive_dtype, metadata)
         print(f"Q-table saved to {file_path}")
 
     # def _policy(self, mode, state):
@@ -268,23 +345,23 @@ class QLearningAgent:
     #     return action
 
     def _policy(self, mode, state):
-        state_idx = self.all_states.index(str(tuple(state)))
+        state_idx = self.state_codec.index(state)
         if mode == 'train':
             if random.uniform(0, 1) > self.exploration_rate:
-                q_values = self.q_table[state_idx]
-                action = np.argmax(q_values)
+                action = greedy_actions(self.q_table, state_idx)
             else:
                 action = random.randint(0, self.q_table.shape[1] - 1)
         elif mode == 'test':
-            action = np.argmax(self.q_table[state_idx])
+            action = greedy_actions(self.q_table, state_idx)
 
-        # Convert single action index to list of actions for each course
-        num_courses = len(self.env.action_space.nvec)
-        course_actions = [action % 3 for _ in range(num_courses)]  # Assuming 3 actions per course
-        return course_actions
+        # Joint action index, decoded to per-course percentages with self.action_codec
+        return int(action)
 
     def train(self, alpha):
         """Train the agent."""
+        if self.num_envs > 1:
+            return self.train_parallel(alpha)
+
         actual_rewards = []
         predicted_rewards = []
         rewards_per_episode = []
@@ -301,11 +378,22 @@ class QLearningAgent:
         csv_file = open(csv_file_path, mode='w', newline='')
         writer = csv.writer(csv_file)
         # Write headers
-        writer.writerow(['Episode', 'Step', 'State', 'Action', 'Reward', 'Next_State', 'Terminated'])
+        writer.writerow(['Episode', 'Step', 'State_Index', 'Action', 'Reward', 'Next_State_Index', 'Terminated'])
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
+        memory = self.memory_tracker = MemoryTracker(self.track_memory)
+        memory.track('q_table', lambda: (self.q_table, self.state_action_visits, self.state_visits))
+        memory.track('history', lambda: (actual_rewards, predicted_rewards, rewards_per_episode, visited_state_counts,
+                                         q_value_history, reward_history, td_errors, training_log, cumulative_rewards))
+        memory.track('planner', lambda: self.planner)
+        memory.start()
+        stopper = self.new_early_stopping()
+        self.new_planner()
 
         for episode in tqdm(range(self.max_episodes)):
+            timer.mark()
             self.decay_handler.set_decay_function(self.decay_function)
             state = self.env.reset()
+            timer.lap('reset')
             c_state = state[0]
             terminated = False
             e_return = []
@@ -325,20 +413,17 @@ class QLearningAgent:
             episode_count = 0
 
             while not terminated:
+                timer.mark()
                 action = self._policy('train', c_state)
-                converted_state = str(tuple(c_state))
-                state_idx = self.all_states.index(converted_state)  # Define state_idx here
-
-                # list_action = list(eval(self.all_actions[action]))
-                # c_list_action = [i * 50 for i in list_action] # for 0, 1, 2,
+                state_idx = self.state_codec.index(c_state)
 
-                # Convert action to course-specific actions dynamically
-                c_list_action = [i * 50 for i in action]  # scale 0, 1, 2 to 0, 50, 100
-
-                action_alpha_list = [*c_list_action, alpha]
+                # Convert the action index to the percentage of every course (0, 50, 100)
+                action_alpha_list = [*self.action_codec.to_percentages(action), alpha]
+                timer.lap('action_selection')
 
                 # Execute the action and observe the next state and reward
                 next_state, reward, terminated, _, info = self.env.step(action_alpha_list)
+                timer.lap('env_step')
 
                 # Update the Q-table using the observed reward and the maximum future value
                 # old_value = self.q_table[self.all_states.index(converted_state), action]
@@ -347,9 +432,10 @@ class QLearningAgent:
                 # new_value = (1 - self.learning_rate) * old_value + self.learning_rate * (
                 #             reward + self.discount_factor * next_max)
                 # self.q_table[self.all_states.index(converted_state), action] = new_value
-                action_idx = sum([a * (3 ** i) for i, a in enumerate(action)])  # Convert action list to single index
+                action_idx = action
                 old_value = self.q_table[state_idx, action_idx]
-                next_max = np.max(self.q_table[self.all_states.index(str(tuple(next_state)))])
+                next_state_idx = self.state_codec.index(next_state)
+                next_max = max_values(self.q_table, next_state_idx)
                 new_value = (1 - self.learning_rate) * old_value + self.learning_rate * (
                             reward + self.discount_factor * next_max)
                 self.q_table[state_idx, action_idx] = new_value
@@ -370,9 +456,13 @@ class QLearningAgent:
                 # Increment the state-action visit count
                 self.state_action_visits[state_idx, action] += 1
                 self.state_visits[state_idx] += 1
+                timer.lap('update')
+                self.plan(state_idx, action_idx, reward, next_state_idx)
+                timer.lap('planning')
 
                 # Log the experience to CSV
-                writer.writerow([episode, step, converted_state, action, reward, str(tuple(next_state)), terminated])
+                writer.writerow([episode, step, state_idx, action, reward, next_state_idx, terminated])
+                timer.lap('csv_write')
                 step += 1
                 c_state = next_state
                 # Update other accumulators...
@@ -384,10 +474,8 @@ class QLearningAgent:
                 e_allowed.append(info['allowed'])
                 e_infected_students.append(info['infected'])
                 e_community_risk.append(info['community_risk'])
-                if converted_state not in visited_state_counts:
-                    visited_state_counts[converted_state] = 1
-                else:
-                    visited_state_counts[converted_state] += 1
+                visited_state_counts[state_idx] = visited_state_counts.get(state_idx, 0) + 1
+                timer.lap('bookkeeping')
 
             avg_episode_return = sum(e_return) / len(e_return)
             cumulative_rewards.append(total_reward)  # Update cumulative rewards
@@ -396,6 +484,7 @@ class QLearningAgent:
 
             avg_td_error = np.mean(episode_td_errors)  # Average TD error for this episode
             td_errors.append(avg_td_error)
+            stop = stopper.update(episode, avg_episode_return, avg_td_error, self.greedy_policy)
 
             # If enough episodes have been run, check for convergence
             if episode >= self.moving_average_window - 1:
@@ -417,7 +506,9 @@ class QLearningAgent:
                     'Learning Rate': self.learning_rate,
                     'Q-value Mean': np.mean(q_value_history[-100:]),
                     'reward_mean': np.mean(reward_history[-100:]),
-                    'TD Error Mean': np.mean(td_errors[-100:])
+                    'TD Error Mean': np.mean(td_errors[-100:]),
+                    **stopper.metrics(),
+                    **self.planner.metrics(),
                 })
 
             predicted_rewards.append(e_predicted_rewards)
@@ -426,18 +517,30 @@ class QLearningAgent:
 
             # Log data for each episode
             training_log.append([episode, step, total_reward, avg_td_error, policy_changes, self.exploration_rate])
+            timer.lap('logging')
+            if timer.enabled:
+                timer.end_episode()
+                wandb.log(timer.episode_metrics())
+            memory_metrics = memory.sample(episode)
+            if memory_metrics:
+                wandb.log(memory_metrics)
+            if stop:
+                break
 
         print("Training complete.")
+        self.report_early_stopping('train')
+        timer.mark()
         # Save Q-table after training
-        self.save_q_table()
+        self.save_q_table(alpha)
 
         # Save training log to CSV
         self.save_training_log_to_csv(training_log)
+        csv_file.close()
+        timer.lap('save')
 
         visualize_q_table(self.q_table, self.results_subdirectory, self.max_episodes)
 
-        csv_file.close()
-        states = list(visited_state_counts.keys())
+        states = [str(tuple(self.state_codec.decode(state_idx).tolist())) for state_idx in visited_state_counts]
         visit_counts = list(visited_state_counts.values())
         self.log_states_visited(states, visit_counts, alpha, self.results_subdirectory)
         # Pass actual and predicted rewards to visualizer
@@ -446,9 +549,219 @@ class QLearningAgent:
 
         self.log_all_states_visualizations(self.q_table, self.all_states, self.states, self.run_name, self.max_episodes, alpha,
                                       self.results_subdirectory)
+        timer.lap('plotting')
+        self.report_phase_timings('train')
+        # Last sample after saving and plotting, which open the figures
+        memory.sample(self.max_episodes, force=True)
+        memory.stop()
+        self.report_memory('train')
+
+        return actual_rewards
+
+    def make_vector_env(self, alpha):
+        """``num_envs`` copies of the training environment, stepped in worker processes."""
+        env_kwargs = dict(self.env.spec.kwargs) if self.env.spec else {}
+        # The campus of the training environment, not class sizes drawn by every copy
+        env_kwargs.update(self.env.unwrapped.campus_parameters())
+        envs = gym.make('CampusGymVectorEnv-v0', num_envs=self.num_envs, alpha=alpha, **env_kwargs)
+        check_same_campus(envs, self.env)
+        return envs
+
+    def train_parallel(self, alpha):
+        """Train the agent on ``num_envs`` environment copies.
+
+        Every step collects one transition per copy and applies their Q-learning updates in
+        turn. Copies reset automatically at the end of their episode, and every finished
+        episode counts towards ``max_episodes``. The copies finish their episodes together, so
+        a phase timer episode covers one episode of every copy.
+        """
+        envs = self.make_vector_env(alpha)
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
+        num_actions = self.q_table.shape[1]
+        actual_rewards = []
+        training_log = []
+        cumulative_rewards = []
+        rewards_per_episode = []
+        e_returns = [[] for _ in range(self.num_envs)]
+        e_td_errors = [[] for _ in range(self.num_envs)]
+        policy_changes = np.zeros(self.num_envs, dtype=int)
+        last_actions = np.full(self.num_envs, -1)
+        completed = 0
+        stopper = self.new_early_stopping()
+        self.new_planner()
+        stop = False
+
+        self.decay_handler.set_decay_function(self.decay_function)
+        timer.mark()
+        states, _ = envs.reset(seed=SEED)
+        timer.lap('reset')
+        pbar = tqdm(total=self.max_episodes)
+        while completed < self.max_episodes and not stop:
+            timer.mark()
+            state_idx = self.state_codec.indices(states)
+            explore = np.random.random(self.num_envs) <= self.exploration_rate
+            action_idx = np.where(explore, np.random.randint(0, num_actions, self.num_envs),
+                                  greedy_actions(self.q_table, state_idx))
+            levels = self.action_codec.decode(action_idx)
+            timer.lap('action_selection')
+            next_states, rewards, terminated, _, infos = envs.step(levels)
+            timer.lap('env_step')
+
+            # After an automatic reset the TD target uses the last observation of the episode
+            final_states = next_states.copy()
+            for i in np.flatnonzero(terminated):
+                final_states[i] = infos['final_observation'][i]
+            next_idx = self.state_codec.indices(final_states)
+
+            for i in range(self.num_envs):
+                old_value = self.q_table[state_idx[i], action_idx[i]]
+                next_max = max_values(self.q_table, next_idx[i])
+                self.q_table[state_idx[i], action_idx[i]] = (1 - self.learning_rate) * old_value + \
+                    self.learning_rate * (rewards[i] + self.discount_factor * next_max)
+                e_td_errors[i].append(abs(rewards[i] + self.discount_factor * next_max - old_value))
+                e_returns[i].append(int(rewards[i]))
+                self.state_action_visits[state_idx[i], action_idx[i]] += 1
+                self.state_visits[state_idx[i]] += 1
+                timer.lap('update')
+                self.plan(state_idx[i], action_idx[i], rewards[i], next_idx[i])
+                timer.lap('planning')
+            policy_changes += (last_actions >= 0) & (last_actions != action_idx)
+            last_actions = action_idx
+            timer.lap('bookkeeping')
+
+            for i in np.flatnonzero(terminated):
+                total_reward = sum(e_returns[i])
+                # Average weekly reward, the unit of the moving average of train
+                avg_episode_return = total_reward / len(e_returns[i])
+                actual_rewards.append(e_returns[i])
+                cumulative_rewards.append(total_reward)
+                rewards_per_episode.append(avg_episode_return)
+                training_log.append([completed, len(e_returns[i]), total_reward, np.mean(e_td_errors[i]),
+                                     policy_changes[i], self.exploration_rate])
+                if completed >= self.moving_average_window - 1:
+                    window_returns = rewards_per_episode[-self.moving_average_window:]
+                    wandb.log({
+                        'Moving Average': np.mean(window_returns),
+                        'Standard Deviation': np.std(window_returns),
+                        'Cumulative Reward': total_reward,
+                        'average_return': avg_episode_return,
+                        'Exploration Rate': self.exploration_rate,
+                        'Learning Rate': self.learning_rate,
+                        **stopper.metrics(),
+                        **self.planner.metrics(),
+                    })
+                stop = stopper.update(completed, avg_episode_return, np.mean(e_td_errors[i]), self.greedy_policy)
+                self.exploration_rate = self.decay_handler.get_exploration_rate(completed)
+                e_returns[i], e_td_errors[i] = [], []
+                policy_changes[i], last_actions[i] = 0, -1
+                completed += 1
+                pbar.update(1)
+                if stop:
+                    break
+            states = next_states
+            timer.lap('logging')
+            if timer.enabled and terminated.any():
+                timer.end_episode()
+                wandb.log(timer.episode_metrics())
+        pbar.close()
+        envs.close()
+
+        print("Training complete.")
+        self.report_early_stopping('train')
+        timer.mark()
+        self.save_q_table(alpha)
+        self.save_training_log_to_csv(training_log)
+        timer.lap('save')
+        visualize_q_table(self.q_table, self.results_subdirectory, self.max_episodes)
+        self.log_all_states_visualizations(self.q_table, self.all_states, self.states, self.run_name, self.max_episodes,
+                                           alpha, self.results_subdirectory)
+        timer.lap('plotting')
+        self.report_phase_timings('train')
+        return actual_rewards[:self.max_episodes]
+
+    def train_decomposed(self, alphas=ANCHOR_ALPHAS):
+        """Trains the allowed and infected action values of every alpha in ``alphas`` in one run.
+
+        Episodes follow the epsilon-greedy policy of the anchor alphas in turn; every transition
+        updates all anchors (``DecomposedQTable``). Saves the components to
+        ``decomposed_<run_name>.npz`` and the Q-table of every anchor to ``q_table_<run_name>_<alpha>``.
+        """
+        self.decomposed_q_table = table = DecomposedQTable(self.state_codec.num_states, self.action_codec.num_actions,
+                                                           alphas, self.q_table_dtype)
+        training_log = []
+        returns = []
+        actual_rewards = []
+        self.decay_handler.set_decay_function(self.decay_function)
+
+        for episode in tqdm(range(self.max_episodes)):
+            anchor = episode % len(table.alphas)
+            alpha = float(table.alphas[anchor])
+            state, _ = self.env.reset()
+            state_idx = self.state_codec.index(state)
+            terminated = False
+            e_return = []
+            episode_td_errors = []
+            last_action = None
+            policy_changes = 0
+            while not terminated:
+                if random.uniform(0, 1) > self.exploration_rate:
+                    action = table.anchor_action(anchor, state_idx)
+                else:
+                    action = random.randint(0, table.shape[1] - 1)
+                next_state, reward, terminated, _, info = self.env.step(
+                    [*self.action_codec.to_percentages(action), alpha])
+                next_state_idx = self.state_codec.index(next_state)
+                td_errors = table.update(state_idx, action, np.sum(info['allowed']), np.sum(info['infected']),
+                                         next_state_idx, self.learning_rate, self.discount_factor)
+                episode_td_errors.append(np.abs(td_errors).mean())
+                if last_action is not None and last_action != action:
+                    policy_changes += 1
+                last_action = action
+                e_return.append(int(reward))
+                state_idx = next_state_idx
 
+            total_reward = sum(e_return)
+            returns.append(total_reward / len(e_return))
+            actual_rewards.append(e_return)
+            avg_td_error = np.mean(episode_td_errors)
+            if episode >= self.moving_average_window - 1:
+                window_returns = returns[-self.moving_average_window:]
+                wandb.log({
+                    'Moving Average': np.mean(window_returns),
+                    'Standard Deviation': np.std(window_returns),
+                    'Cumulative Reward': total_reward,
+                    'average_return': total_reward / len(e_return),
+                    'Behaviour Alpha': alpha,
+                    'Exploration Rate': self.exploration_rate,
+                    'Learning Rate': self.learning_rate,
+                    'TD Error Mean': avg_td_error,
+                })
+            self.exploration_rate = self.decay_handler.get_exploration_rate(episode)
+            training_log.append([episode, len(e_return), total_reward, avg_td_error, policy_changes,
+                                 self.exploration_rate])
+
+        print("Training complete.")
+        self.save_decomposed_q_table()
+        self.save_training_log_to_csv(training_log, init_method='decomposed')
         return actual_rewards
 
+    def save_decomposed_q_table(self):
+        """Saves the components of ``train_decomposed`` and the Q-table of every anchor alpha."""
+        policy_dir = self.shared_config['directories']['policy_directory']
+        os.makedirs(policy_dir, exist_ok=True)
+        table = self.decomposed_q_table
+        config = {'shared': self.shared_config, 'agent': self.agent_config}
+        metadata = q_table_metadata(self.state_codec.nvec, self.action_codec.nvec, None, config)
+        path = os.path.join(policy_dir, f'decomposed_{self.run_name}.npz')
+        table.save(path, self.q_table_archive_dtype, metadata)
+        print(f"Decomposed action values saved to {path}")
+        for alpha in table.alphas:
+            metadata = q_table_metadata(self.state_codec.nvec, self.action_codec.nvec, float(alpha), config)
+            file_path = save_q_table_file(table.q_table(alpha),
+                                          os.path.join(policy_dir, f'q_table_{self.run_name}_{alpha:g}'),
+                                          self.q_table_archive_dtype, metadata)
+            print(f"Q-table of alpha {alpha:g} saved to {file_path}")
+
     def save_training_log_to_csv(self, training_log, init_method='default-1'):
         # Define the CSV file path
         csv_file_path = os.path.join(self.results_subdirectory, f'training_log_{init_method}.csv')
@@ -663,63 +976,89 @@ class QLearningAgent:
         plt.savefig(output_path)
         plt.close()
 
-    def train_single_run(self, alpha):
-        """Train the agent."""
+    def train_single_run(self, alpha, loop_name='train_single_run'):
+        """Train the agent; the phase timings are saved to ``phase_timings_<loop_name>.json``."""
         rewards_per_episode = []
         reward_history = []
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
+        stopper = self.new_early_stopping()
+        self.new_planner()
 
         for episode in tqdm(range(self.max_episodes)):
+            timer.mark()
             self.decay_handler.set_decay_function(self.decay_function)
             state = self.env.reset()
+            timer.lap('reset')
             c_state = state[0]
             terminated = False
             e_return = []
+            episode_td_errors = []
             step = 0
 
             while not terminated:
+                timer.mark()
                 action = self._policy('train', c_state)
-                converted_state = str(tuple(c_state))
-                state_idx = self.all_states.index(converted_state)  # Define state_idx here
-
-                list_action = list(eval(self.all_actions[action]))
-                c_list_action = [i * 50 for i in list_action]  # for 0, 1, 2,
+                state_idx = self.state_codec.index(c_state)
 
-                action_alpha_list = [*c_list_action, alpha]
+                action_alpha_list = [*self.action_codec.to_percentages(action), alpha]
+                timer.lap('action_selection')
 
                 # Execute the action and observe the next state and reward
                 next_state, reward, terminated, _, info = self.env.step(action_alpha_list)
+                timer.lap('env_step')
 
                 # Update the Q-table using the observed reward and the maximum future value
-                old_value = self.q_table[self.all_states.index(converted_state), action]
-                next_max = np.max(self.q_table[self.all_states.index(str(tuple(next_state)))])
+                old_value = self.q_table[state_idx, action]
+                next_state_idx = self.state_codec.index(next_state)
+                next_max = max_values(self.q_table, next_state_idx)
                 new_value = (1 - self.learning_rate) * old_value + self.learning_rate * (
                         reward + self.discount_factor * next_max)
-                self.q_table[self.all_states.index(converted_state), action] = new_value
+                self.q_table[state_idx, action] = new_value
+                episode_td_errors.append(abs(reward + self.discount_factor * next_max - old_value))
+                self.state_visits[state_idx] += 1
+                timer.lap('update')
+                self.plan(state_idx, action, reward, next_state_idx)
+                timer.lap('planning')
 
                 step += 1
                 c_state = next_state
                 week_reward = int(reward)
                 e_return.append(week_reward)
                 reward_history.append(reward)
+                timer.lap('bookkeeping')
 
             avg_episode_return = sum(e_return) / len(e_return)
             rewards_per_episode.append(e_return)  # Append the list of rewards per episode
 
             self.exploration_rate = self.decay_handler.get_exploration_rate(episode)
+            timer.end_episode()
+            if stopper.update(episode, avg_episode_return, np.mean(episode_td_errors), self.greedy_policy):
+                break
 
         print("Training complete.")
+        self.report_phase_timings(loop_name)
         return rewards_per_episode
 
     def multiple_runs(self, num_runs, alpha_t, beta_t):
         returns_per_episode = []
+        stop_episodes = []
 
         for run in range(num_runs):
-            self.q_table = np.zeros_like(self.q_table)  # Reset Q-table for each run
-            returns = self.train_single_run(alpha_t)
+            self.q_table = self.initial_q_table()  # Reset Q-table for each run
+            self.state_visits[:] = 0
+            # One timings file per run
+            returns = self.train_single_run(alpha_t, loop_name=f'train_single_run_{run}')
             returns_per_episode.append(returns)
+            stop_episodes.append(self.early_stopping.stop_episode)
+            self.early_stopping.save(self.results_subdirectory, f'run_{run}')
 
-        # Ensure returns_per_episode is correctly structured
-        returns_per_episode = np.array(returns_per_episode)  # Shape: (num_runs, max_episodes, episode_length)
+        # Runs stopped early are compared over the episodes all runs trained
+        episodes = min(len(returns) for returns in returns_per_episode)
+        if any(stop is not None for stop in stop_episodes):
+            print(f"Stopping episodes of the runs: {stop_episodes}, comparing the first {episodes} episodes")
+            wandb.log({'Stopping Episodes': stop_episodes, 'Compared Episodes': episodes})
+        # Shape: (num_runs, episodes, episode_length)
+        returns_per_episode = np.array([returns[:episodes] for returns in returns_per_episode])
 
         output_path_mean = os.path.join(self.results_subdirectory, 'tolerance_interval_mean.png')
         output_path_median = os.path.join(self.results_subdirectory, 'tolerance_interval_median.png')
@@ -770,8 +1109,11 @@ class QLearningAgent:
                 # Write the header to the CSV file
                 writer.writerow(['Alpha', 'Episode', 'Step', 'Infections', 'Allowed', 'Reward', 'CommunityRisk'])
 
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
         for episode in tqdm(range(episodes)):
+            timer.mark()
             state = self.env.reset()
+            timer.lap('reset')
             c_state = state[0]
             terminated = False
             episode_reward = 0
@@ -782,24 +1124,24 @@ class QLearningAgent:
             eps_rewards = []
 
             while not terminated:
-                converted_state = str(tuple(c_state))
-                state_idx = self.all_states.index(converted_state)
+                timer.mark()
+                state_idx = self.state_codec.index(c_state)
 
                 # Select an action based on the Q-table or baseline policy
                 if baseline_policy:
                     action = baseline_policy(c_state)
                 else:
-                    action = np.argmax(self.q_table[state_idx])
+                    action = greedy_actions(self.q_table, state_idx)
 
                 print("action", action)
-                list_action = list(eval(self.all_actions[action]))
-                print("list action", list_action)
-                c_list_action = [i * 50 for i in list_action]  # for 0, 1, 2,
-                # c_list_action = [i * 25 if i < 3 else 100 for i in list_action]
+                c_list_action = self.action_codec.to_percentages(int(action))
+                print("list action", self.action_codec.decode(action).tolist())
 
                 action_alpha_list = [*c_list_action, alpha]
+                timer.lap('action_selection')
                 # Execute the action and observe the next state and reward
                 next_state, reward, terminated, _, info = self.env.step(action_alpha_list)
+                timer.lap('env_step')
                 print(info)
                 eps_rewards.append(reward)
                 infected.append(info['infected'])
@@ -817,15 +1159,18 @@ class QLearningAgent:
 
                 # Update the state to the next state
                 c_state = next_state
+                timer.lap('bookkeeping')
 
             infected_dict[episode] = infected
             allowed_dict[episode] = allowed
             rewards_dict[episode] = eps_rewards
             community_risk_dict[episode] = community_risk
+            timer.end_episode()
 
 
 
 
+        timer.mark()
         print("infected: ", infected_dict, "allowed: ", allowed_dict, "rewards: ", rewards_dict, "community_risk: ", community_risk_dict)
         for episode in infected_dict:
             plt.figure(figsize=(15, 5))
@@ -866,6 +1211,7 @@ class QLearningAgent:
             print(f"Figure saved to {fig_path}")
 
             plt.close()  # Close the figure to free up memory
+        timer.lap('plotting')
 
 
         with open(eval_file_path, mode='a', newline='') as file:
@@ -886,6 +1232,8 @@ class QLearningAgent:
                     ])
 
         print(f"Data for alpha {alpha} appended to {eval_file_path}")
+        timer.lap('csv_write')
+        self.report_phase_timings('test')
 
         return infected_dict, allowed_dict, rewards_dict, community_risk_dict
 
@@ -913,8 +1261,11 @@ class QLearningAgent:
                 # Write the header to the CSV file
                 writer.writerow(['Alpha', 'Episode', 'Step', 'Infections', 'Allowed', 'Reward', 'CommunityRisk'])
 
+        timer = self.phase_timer = PhaseTimer(self.phase_timers)
         for episode in tqdm(range(episodes)):
+            timer.mark()
             state = self.env.reset()
+            timer.lap('reset')
             c_state = state[0]
             terminated = False
             episode_reward = 0
@@ -925,22 +1276,18 @@ class QLearningAgent:
             community_risk = []
 
             while not terminated:
-                converted_state = str(tuple(c_state))
-                state_idx = self.all_states.index(converted_state)
+                timer.mark()
+                state_idx = self.state_codec.index(c_state)
 
                 # Select a random action
-                sampled_actions = str(tuple(self.env.action_space.sample().tolist()))
-                # print("sampled action", sampled_actions, self.exploration_rate)
-
-                action = self.all_actions.index(sampled_actions)
-                list_action = list(eval(self.all_actions[action]))
-                c_list_action = [i * 50 for i in list_action]  # for 0, 1, 2,
-
-                # c_list_action = [i * 25 if i < 3 else 100 for i in list_action]
+                action = self.action_codec.encode(self.env.action_space.sample())
+                c_list_action = self.action_codec.to_percentages(action)
 
                 action_alpha_list = [*c_list_action, alpha]
+                timer.lap('action_selection')
                 # Execute the action and observe the next state and reward
                 next_state, reward, terminated, _, info = self.env.step(action_alpha_list)
+                timer.lap('env_step')
                 print(info)
                 eps_rewards.append(reward)
                 infected.append(info['infected'])
@@ -958,12 +1305,15 @@ class QLearningAgent:
 
                 # Update the state to the next state
                 c_state = next_state
+                timer.lap('bookkeeping')
 
             infected_dict[episode] = infected
             allowed_dict[episode] = allowed
             rewards_dict[episode] = eps_rewards
             community_risk_dict[episode] = community_risk
+            timer.end_episode()
 
+        timer.mark()
         print("infected: ", infected_dict, "allowed: ", allowed_dict, "rewards: ", rewards_dict, "community_risk: ", community_risk_dict)
         for episode in infected_dict:
             plt.figure(figsize=(15, 5))
@@ -1003,6 +1353,7 @@ class QLearningAgent:
             print(f"Figure saved to {fig_path}")
 
             plt.close()  # Close the figure to free up memory
+        timer.lap('plotting')
 
         with open(eval_file_path, mode='a', newline='') as file:
             writer = csv.writer(file)
@@ -1021,3 +1372,5 @@ class QLearningAgent:
                     ])
 
         print(f"Data for alpha {0.0} appended to {eval_file_path}")
+        timer.lap('csv_write')
+        self.report_phase_timings('test_baseline_random')
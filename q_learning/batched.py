@@ -0,0 +1,163 @@
+"""Tabular Q-learning of many hyperparameter configurations at once.
+
+A wandb sweep trains one Q-table per run. ``BatchedQLearning`` trains the Q-tables of K
+configurations together: they are stacked into one (K, num_states, num_actions) array and
+K campuses are stepped by ``VectorizedSimulation``, one per configuration with its own
+learning rate, discount factor, alpha and exploration schedule. Every step selects the
+actions of all configurations and applies all K TD updates with one fancy-indexed NumPy
+operation, so the per-step Python overhead is paid once instead of K times.
+
+All configurations see the same initial infections and community risk trajectory in an
+episode (common random numbers), which makes their returns directly comparable. The campuses
+use the ``estimate_infected_students`` dynamics and the high/low risk process of
+``VectorizedSimulation``, not a tabulated, surrogate or trajectory-file setup of the environment.
+
+Example:
+    configs = sweep_grid(load_config('config/sweep.yaml'), defaults)
+    trainer = BatchedQLearning(configs, students_per_course=[100], max_episodes=5000)
+    returns = trainer.train()          # (K, max_episodes) average weekly reward
+    scores = trainer.evaluate(100)     # (K,) greedy average weekly reward
+"""
+import itertools
+import numpy as np
+from tqdm import tqdm
+from campus_digital_twin.vectorized import VectorizedSimulation, discretize_observation
+from campus_gym.envs.codec import ActionCodec, StateCodec
+from training.exploration import ExplorationRateDecay
+
+GRID_PARAMETERS = ('alpha', 'learning_rate', 'discount_factor', 'exploration_rate', 'min_exploration_rate',
+                   'e_decay_function')
+NUM_INFECTION_LEVELS = 10
+NUM_OCCUPANCY_LEVELS = 3
+
+
+def sweep_grid(sweep_config, defaults):
+    """Every combination of the ``values`` lists of a wandb grid sweep config.
+
+    Args:
+        sweep_config: Contents of ``config/sweep.yaml``.
+        defaults: Values of the parameters the sweep does not vary, e.g. the agent config.
+    Returns:
+        One dict of ``GRID_PARAMETERS`` per configuration.
+    """
+    parameters = sweep_config.get('parameters') or {}
+    for name, spec in parameters.items():
+        if name not in GRID_PARAMETERS:
+            raise ValueError(f"Batched training cannot vary {name!r}, expected one of {GRID_PARAMETERS}")
+        if 'values' not in spec:
+            raise ValueError(f"Batched training needs a list of values for {name!r}, not a distribution")
+    names = list(parameters)
+    configs = []
+    for values in itertools.product(*(parameters[name]['values'] for name in names)):
+        config = dict(defaults, **dict(zip(names, values)))
+        configs.append({name: config[name] for name in GRID_PARAMETERS})
+    return configs
+
+
+def exploration_schedules(configs, max_episodes):
+    """Exploration rate of every configuration in every episode, shape (K, max_episodes).
+
+    Follows ``QLearningAgent.train``: the first episode uses ``exploration_rate`` and episode
+    e > 0 the decay function evaluated at e - 1.
+    """
+    schedules = np.empty((len(configs), max_episodes))
+    for row, config in zip(schedules, configs):
+        decay = ExplorationRateDecay(max_episodes, config['min_exploration_rate'], config['exploration_rate'],
+                                     squared_sine=False)
+        decay.set_decay_function(config['e_decay_function'])
+        row[0] = config['exploration_rate']
+        row[1:] = decay.schedule(config['e_decay_function'])[:max_episodes - 1]
+    return schedules
+
+
+class BatchedQLearning:
+    """Trains one Q-table per configuration, all configurations in lockstep.
+
+    Args:
+        configs: Dicts with the ``GRID_PARAMETERS`` of every configuration (``sweep_grid``).
+        students_per_course: Class size of every course.
+        max_episodes: Training episodes of every configuration.
+        max_weeks: Weeks per episode.
+        seed: Seed of the scenarios and of the exploration.
+        dtype: Type of the Q-values.
+    """
+
+    def __init__(self, configs, students_per_course, max_episodes, max_weeks=16, seed=100, dtype=np.float32):
+        self.configs = list(configs)
+        self.num_configs = len(self.configs)
+        self.max_episodes = max_episodes
+        self.max_weeks = max_weeks
+        num_courses = len(students_per_course)
+        self.state_codec = StateCodec([NUM_INFECTION_LEVELS] * (num_courses + 1))
+        self.action_codec = ActionCodec([NUM_OCCUPANCY_LEVELS] * num_courses)
+
+        def parameter(name):
+            return np.array([config[name] for config in self.configs], dtype=np.float64)
+
+        self.alphas = parameter('alpha')
+        self.learning_rates = parameter('learning_rate')
+        self.discount_factors = parameter('discount_factor')
+        self.exploration_rates = exploration_schedules(self.configs, max_episodes)
+
+        self.q_tables = np.zeros((self.num_configs, self.state_codec.num_states, self.action_codec.num_actions),
+                                 dtype=dtype)
+        # First index of the stacked tables, row k belongs to configuration k
+        self._configs = np.arange(self.num_configs)
+        self.simulation = VectorizedSimulation(students_per_course, self.num_configs, max_weeks=max_weeks, seed=seed)
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def nbytes(self):
+        return self.q_tables.nbytes
+
+    def _reset(self):
+        """Starts an episode of the same scenario on every campus."""
+        simulation = self.simulation
+        risk = simulation.risk_process.generate(1, self.max_weeks, self.rng)
+        infected = self.rng.integers(1, 100, size=(1, simulation.num_courses))
+        observation = simulation.reset(risk_trajectories=np.repeat(risk, self.num_configs, axis=0),
+                                       initial_infected=np.repeat(infected, self.num_configs, axis=0))
+        return self.state_codec.encode(discretize_observation(observation))
+
+    def _step(self, actions):
+        observation, rewards, done, _ = self.simulation.step(self.action_codec.decode(actions), self.alphas)
+        return self.state_codec.encode(discretize_observation(observation)), rewards, done
+
+    def train(self, progress=True):
+        """Trains all Q-tables for ``max_episodes`` episodes.
+
+        Returns:
+            Average weekly reward of every configuration in every episode, shape (K, max_episodes).
+        """
+        configs = self._configs
+        num_actions = self.action_codec.num_actions
+        returns = np.zeros((self.num_configs, self.max_episodes))
+        for episode in tqdm(range(self.max_episodes), disable=not progress):
+            exploration_rates = self.exploration_rates[:, episode]
+            states = self._reset()
+            done = False
+            while not done:
+                actions = self.q_tables[configs, states].argmax(axis=1)
+                explore = self.rng.random(self.num_configs) < exploration_rates
+                actions[explore] = self.rng.integers(num_actions, size=int(explore.sum()))
+                next_states, rewards, done = self._step(actions)
+
+                # One TD update of every configuration
+                next_max = self.q_tables[configs, next_states].max(axis=1)
+                old_values = self.q_tables[configs, states, actions]
+                self.q_tables[configs, states, actions] = old_values + self.learning_rates * (
+                    rewards + self.discount_factors * next_max - old_values)
+                returns[:, episode] += rewards
+                states = next_states
+        return returns / self.max_weeks
+
+    def evaluate(self, episodes):
+        """Average weekly reward of the greedy policy of every configuration over ``episodes`` episodes."""
+        totals = np.zeros(self.num_configs)
+        for _ in range(episodes):
+            states = self._reset()
+            done = False
+            while not done:
+                states, rewards, done = self._step(self.q_tables[self._configs, states].argmax(axis=1))
+                totals += rewards
+        return totals / (episodes * self.max_weeks)
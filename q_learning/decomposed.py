@@ -0,0 +1,98 @@
+"""Action values of the allowed and infected students, combined into the policy of any alpha.
+
+The reward ``alpha * allowed - (1 - alpha) * infected`` is linear in alpha, so the action
+value of a fixed policy splits the same way:
+
+    Q_alpha(s, a) = alpha * Q_allowed(s, a) - (1 - alpha) * Q_infected(s, a)
+
+``DecomposedQTable`` learns both components for the greedy policies of a grid of anchor
+alphas, all from the same transitions: every update bootstraps each anchor from the greedy
+action of its own combined values (off-policy, like Q-learning), so the behaviour policy of
+the rollouts does not matter. The policy of a query alpha takes, in every state, the action
+with the best combined value over the anchors (generalized policy improvement). It is the
+learned greedy policy at an anchor and at least as good as every anchor policy in between.
+The environment truncates the reward of every course to an integer, which the components
+do not model.
+
+Example:
+    table = DecomposedQTable(num_states, num_actions, alphas=[0.1, 0.5, 0.9])
+    table.update(state, action, allowed, infected, next_state, learning_rate, discount_factor)
+    q_table = table.q_table(0.35)  # dense (num_states, num_actions) Q-table of alpha 0.35
+"""
+import json
+import numpy as np
+
+COMPONENTS = ('allowed', 'infected')
+ANCHOR_ALPHAS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+class DecomposedQTable:
+    """Allowed and infected action values of the greedy policy of every anchor alpha.
+
+    Args:
+        num_states: Number of flat states.
+        num_actions: Number of joint actions.
+        alphas: Anchor alphas, the alpha grid of ``run.sh`` by default.
+        dtype: Type of the values.
+    """
+
+    def __init__(self, num_states, num_actions, alphas=ANCHOR_ALPHAS, dtype=np.float32):
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.shape = (int(num_states), int(num_actions))
+        # values[0]: allowed students, values[1]: infected students, shape (2, anchors, states, actions)
+        self.values = np.zeros((len(COMPONENTS), len(self.alphas), *self.shape), dtype=dtype)
+        self.dtype = self.values.dtype
+        # Weight of every component in the reward of every anchor, shape (2, anchors)
+        self._weights = np.stack([self.alphas, -(1 - self.alphas)])
+        self._anchors = np.arange(len(self.alphas))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def weights(self, alpha):
+        return np.array([alpha, -(1 - alpha)])
+
+    def anchor_action(self, anchor, state):
+        """Greedy action of the policy of anchor number ``anchor`` in ``state``."""
+        return int((self._weights[:, anchor] @ self.values[:, anchor, state]).argmax())
+
+    def update(self, state, action, allowed, infected, next_state, learning_rate, discount_factor):
+        """One Q-learning step of both components of every anchor from a single transition.
+
+        Returns:
+            TD errors, shape (2, anchors).
+        """
+        # Greedy next action of every anchor, each in its own alpha
+        next_actions = np.einsum('ck,cka->ka', self._weights, self.values[:, :, next_state]).argmax(axis=1)
+        rewards = np.array([allowed, infected], dtype=np.float64)[:, None]
+        targets = rewards + discount_factor * self.values[:, self._anchors, next_state, next_actions]
+        td_errors = targets - self.values[:, self._anchors, state, action]
+        self.values[:, self._anchors, state, action] += learning_rate * td_errors
+        return td_errors
+
+    def q_values(self, alpha, states=slice(None)):
+        """Action values of the policy of ``alpha``: the best combined value over the anchors."""
+        values = np.einsum('c,ck...->k...', self.weights(alpha), self.values[:, :, states])
+        return values.max(axis=0)
+
+    def greedy(self, alpha, states):
+        """Greedy action of ``alpha`` in a state, or an array of them for an array of states."""
+        actions = self.q_values(alpha, states).argmax(axis=-1)
+        return int(actions) if np.ndim(actions) == 0 else actions
+
+    def q_table(self, alpha, dtype=None):
+        """Dense Q-table of ``alpha``, usable wherever a trained Q-table is (evaluation, policies)."""
+        return self.q_values(alpha).astype(dtype or self.dtype, copy=False)
+
+    def save(self, path, dtype=None, metadata=None):
+        np.savez(path, decomposed_values=self.values.astype(dtype or self.dtype, copy=False), alphas=self.alphas,
+                 metadata=np.array(json.dumps(metadata or {})))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            values = archive['decomposed_values']
+            table = cls(values.shape[2], values.shape[3], archive['alphas'], dtype=values.dtype)
+            table.values[:] = values
+        return table
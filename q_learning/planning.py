@@ -0,0 +1,178 @@
+"""Dyna-Q planning with prioritized sweeping for ``QLearningAgent``.
+
+Every real step of the campus environment is expensive, while a Q-learning backup is cheap.
+``PrioritizedSweeping`` keeps a tabular model of the observed transitions in flat arrays, one
+row per visited (state, action) pair: the visit count, the mean reward and the last
+``samples`` successor states. After every real step it backs up the ``planning_steps``
+modelled pairs with the largest priority (absolute TD error under the model) with one
+vectorized update, using the mean of max_a Q(s', a) over the stored successors, which
+approximates the expectation over the stochastic community risk. The priorities of the
+pairs leading to the updated states are then recomputed, so changes of the values spread
+backwards through the model instead of waiting for the next visits.
+
+The backups do not mask terminal transitions, like the real updates of the agent. The cost
+of a step does not grow with the model: the rows that stored a successor state are kept in
+a predecessor index, and the pairs above ``threshold`` in a heap. A changed priority pushes
+a new heap entry and leaves the old one behind; entries whose priority is no longer the one
+in ``priorities`` are skipped when popped, and the heap is rebuilt once the stale entries
+outnumber the rows.
+
+Example:
+    planner = PrioritizedSweeping.from_config(agent_config['agent'].get('planning'), num_actions)
+    q_table[state, action] = old_value + learning_rate * td_error
+    planner.observe(q_table, state, action, reward, next_state, discount_factor)
+    planner.plan(q_table, learning_rate, discount_factor)
+"""
+import heapq
+import numpy as np
+from .q_table import max_values
+
+DEFAULTS = {
+    'planning_steps': 0,
+    'samples': 8,
+    'threshold': 1e-4,
+}
+
+
+class PrioritizedSweeping:
+    """Tabular model of the observed transitions and the priority of every modelled (state, action) pair.
+
+    Args:
+        num_actions: Number of joint actions.
+        planning_steps: Backups of modelled pairs per real step, 0 disables planning.
+        samples: Successor states kept per pair, the most recent ones.
+        threshold: Pairs with a priority of at most ``threshold`` are not backed up.
+        capacity: Initial number of model rows, doubled when full.
+    """
+
+    def __init__(self, num_actions, planning_steps=0, samples=8, threshold=1e-4, capacity=1024):
+        self.num_actions = int(num_actions)
+        self.planning_steps = int(planning_steps)
+        self.samples = int(samples)
+        self.threshold = threshold
+        self.num_rows = 0
+        self.backups = 0
+        # Model row of every pair, keyed by state * num_actions + action
+        self._rows = {}
+        self.states = np.empty(capacity, dtype=np.int32)
+        self.actions = np.empty(capacity, dtype=np.int32)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity)
+        self.next_states = np.zeros((capacity, self.samples), dtype=np.int32)
+        self.priorities = np.zeros(capacity)
+        # Rows that stored each successor state, and (-priority, row) entries of the pairs above threshold
+        self._predecessors = {}
+        self._queue = []
+
+    @classmethod
+    def from_config(cls, config, num_actions):
+        """Planner of a ``planning`` section of an agent config, disabled when it is missing."""
+        return cls(num_actions, **dict(DEFAULTS, **(config or {})))
+
+    @property
+    def enabled(self):
+        return self.planning_steps > 0
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.states, self.actions, self.counts, self.rewards, self.next_states,
+                                              self.priorities))
+
+    def _row(self, state, action):
+        """Model row of a pair, allocated on its first visit."""
+        key = state * self.num_actions + action
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if self.num_rows == len(self.states):
+            for name in ('states', 'actions', 'counts', 'rewards', 'next_states', 'priorities'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        row = self._rows[key] = self.num_rows
+        self.states[row], self.actions[row] = state, action
+        self.num_rows += 1
+        return row
+
+    def _td_errors(self, q_table, rows, discount_factor):
+        """TD errors of model rows under the model: mean reward plus the mean value of the stored successors."""
+        next_states = self.next_states[rows]
+        stored = np.minimum(self.counts[rows], self.samples)
+        valid = np.arange(self.samples) < stored[:, None]
+        next_max = max_values(q_table, next_states.reshape(-1)).reshape(next_states.shape)
+        expected_max = np.where(valid, next_max, 0).sum(axis=1) / stored
+        return self.rewards[rows] + discount_factor * expected_max - q_table[self.states[rows], self.actions[rows]]
+
+    def _set_priorities(self, rows, priorities):
+        """Stores the priorities of rows and queues the rows above ``threshold``."""
+        self.priorities[rows] = priorities
+        for row, priority in zip(rows.tolist(), priorities.tolist()):
+            if priority > self.threshold:
+                heapq.heappush(self._queue, (-priority, row))
+        if len(self._queue) > 2 * self.num_rows + 1024:
+            self._rebuild_queue()
+
+    def _rebuild_queue(self):
+        """Drops the stale entries of the queue."""
+        rows = np.flatnonzero(self.priorities[:self.num_rows] > self.threshold)
+        self._queue = list(zip((-self.priorities[rows]).tolist(), rows.tolist()))
+        heapq.heapify(self._queue)
+
+    def _pop(self, count):
+        """Removes up to ``count`` rows of the highest priority above ``threshold`` from the queue."""
+        rows = []
+        while self._queue and len(rows) < count:
+            priority, row = heapq.heappop(self._queue)
+            # Entries left behind by a later priority of the row are stale
+            if -priority == self.priorities[row]:
+                self.priorities[row] = 0
+                rows.append(row)
+        return np.array(rows, dtype=np.int64)
+
+    def _update_predecessors(self, q_table, states, discount_factor):
+        """Recomputes the priorities of the pairs that stored a successor in ``states``."""
+        rows = set()
+        for state in states:
+            rows.update(self._predecessors.get(state, ()))
+        if rows:
+            rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            self._set_priorities(rows, np.abs(self._td_errors(q_table, rows, discount_factor)))
+
+    def observe(self, q_table, state, action, reward, next_state, discount_factor):
+        """Adds a real transition to the model, after the real backup of ``q_table[state, action]``."""
+        if not self.enabled:
+            return
+        state, next_state = int(state), int(next_state)
+        row = self._row(state, int(action))
+        self.next_states[row, self.counts[row] % self.samples] = next_state
+        self.counts[row] += 1
+        self.rewards[row] += (reward - self.rewards[row]) / self.counts[row]
+        # Rows whose overwritten successors are gone stay in the index, which only costs a recomputation
+        self._predecessors.setdefault(next_state, set()).add(row)
+        # The real backup changed the value of state, and with it the targets of its predecessors
+        self._update_predecessors(q_table, [state], discount_factor)
+        rows = np.array([row])
+        self._set_priorities(rows, np.abs(self._td_errors(q_table, rows, discount_factor)))
+
+    def plan(self, q_table, learning_rate, discount_factor):
+        """Backs up the ``planning_steps`` pairs of the highest priority with one vectorized update.
+
+        Returns:
+            Number of backups.
+        """
+        if not self.enabled:
+            return 0
+        rows = self._pop(self.planning_steps)
+        if not rows.size:
+            return 0
+        states, actions = self.states[rows], self.actions[rows]
+        q_table[states, actions] = q_table[states, actions] + learning_rate * \
+            self._td_errors(q_table, rows, discount_factor)
+        self._update_predecessors(q_table, np.unique(states).tolist(), discount_factor)
+        self.backups += rows.size
+        return rows.size
+
+    def metrics(self, prefix='planning/'):
+        """Backups so far and size of the model, keyed for ``wandb.log``."""
+        if not self.enabled:
+            return {}
+        return {f'{prefix}backups': self.backups, f'{prefix}model_pairs': self.num_rows}
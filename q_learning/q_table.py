@@ -0,0 +1,698 @@
+"""Q-table backends of ``QLearningAgent``.
+
+``dense`` is a ``numpy`` array of shape (num_states, num_actions), allocated up front.
+With four courses that is 10^5 x 81 values, with five 10^6 x 243, while training visits a
+small fraction of the states. ``sparse`` allocates a row of action values the first time a
+state is written to and reads unvisited states as ``initial_value``.
+
+``SparseQTable`` indexes like the dense array for the operations of the agents and
+visualizers (``q_table[state]``, ``q_table[state, action]``, ``q_table[states]`` for an
+array of states, ``np.argmax(q_table, axis=1)``, ``np.max``, ``np.mean``), so both backends
+are used through the same code. ``np.asarray`` builds the dense table.
+
+Example:
+    q_table = make_q_table('sparse', env.unwrapped.state_codec.num_states, env.unwrapped.action_codec.num_actions)
+    q_table[state_idx, action] += learning_rate * td_error
+    path = save_q_table(q_table, 'policy/q_table_run')  # policy/q_table_run.npz
+
+``FactoredQTable`` keeps additive per-course action values (``agent.action_values:
+factored``) and is used through the same indexing; ``greedy_actions`` and ``max_values``
+use its per-course shortcuts. ``SymmetricQTable`` stores one row per canonical state of
+equal-size courses (``agent.symmetry``) behind the same interface.
+
+Dense tables can be saved as ``float32`` or ``float16`` and opened memory-mapped with
+``load_q_table(path, mmap_mode='r')``, which reads only the rows an evaluation visits.
+
+``transfer_q_values`` warm-starts a new Q-table of any type from a saved one of any type
+over the same spaces, e.g. the policy of a neighbouring alpha.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+import numpy as np
+from campus_gym.envs.codec import ActionCodec, CourseSymmetry
+
+Q_TABLE_BACKENDS = ['dense', 'sparse']
+Q_TABLE_DTYPES = ['float64', 'float32', 'float16']
+FORMAT_VERSION = 1
+# States read from the source of a transfer at a time
+TRANSFER_CHUNK_STATES = 65536
+
+EMPTY = -1
+# Fibonacci hashing: the top bits of state * 2^64 / golden ratio spread consecutive states
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+class SparseQTable:
+    """Action values of visited states in a row pool, found through an open-addressing hash.
+
+    The index is a power-of-two array of pool rows (``EMPTY`` for a free slot) probed
+    linearly from the hash of the flat state index. The index doubles when it is half full
+    and the pool doubles when it is full, so rows move only on growth.
+
+    Args:
+        num_states: Number of flat state indices.
+        num_actions: Number of joint actions.
+        initial_value: Action value of states without a row.
+        capacity: Initial number of rows of the pool.
+        dtype: Type of the action values.
+    """
+
+    ndim = 2
+
+    def __init__(self, num_states, num_actions, initial_value=0.0, capacity=1024, dtype=np.float64):
+        capacity = max(int(capacity), 1)
+        self.shape = (int(num_states), int(num_actions))
+        self.dtype = np.dtype(dtype)
+        self.initial_value = initial_value
+        self._default_row = np.full(num_actions, initial_value, dtype=self.dtype)
+        # Reads of unvisited states share this row, writing to it must go through __setitem__
+        self._default_row.flags.writeable = False
+        self._rows = np.empty((capacity, num_actions), dtype=self.dtype)
+        self._states = np.empty(capacity, dtype=np.int64)
+        self.num_rows = 0
+        self._resize_index(2 * capacity)
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        """Bytes of the row pool, the states of the rows and the index."""
+        return self._rows.nbytes + self._states.nbytes + self._index.nbytes
+
+    @property
+    def states(self):
+        """Flat indices of the states that have a row, in allocation order."""
+        return self._states[:self.num_rows]
+
+    @property
+    def rows(self):
+        """Action values of ``states``, shape (num_rows, num_actions)."""
+        return self._rows[:self.num_rows]
+
+    def __len__(self):
+        return self.shape[0]
+
+    # Hash index
+
+    def _resize_index(self, slots):
+        bits = max(int(slots - 1).bit_length(), 1)
+        self._mask = (1 << bits) - 1
+        self._shift = 64 - bits
+        self._index = np.full(1 << bits, EMPTY, dtype=np.int64)
+        self._insert(self.states, np.arange(self.num_rows))
+
+    def _hash(self, states):
+        """Home slots of an array of states."""
+        with np.errstate(over='ignore'):
+            product = states.astype(np.uint64) * np.uint64(_HASH_MULTIPLIER)
+        return (product >> np.uint64(self._shift)).astype(np.int64)
+
+    def _insert(self, states, rows):
+        """Adds states that are not in the index yet, all colliding states of a round probe on together."""
+        slots = self._hash(states)
+        pending = np.arange(len(states))
+        while pending.size:
+            free = self._index[slots[pending]] == EMPTY
+            # Of several pending states probing the same free slot, the first one takes it
+            _, first = np.unique(slots[pending[free]], return_index=True)
+            placed = pending[free][first]
+            self._index[slots[placed]] = rows[placed]
+            pending = np.setdiff1d(pending, placed, assume_unique=True)
+            slots[pending] = (slots[pending] + 1) & self._mask
+
+    def _find(self, state):
+        """Index slot of one state and its pool row, ``EMPTY`` when the state has no row."""
+        slot = ((state * _HASH_MULTIPLIER) & _MASK_64) >> self._shift
+        while True:
+            row = int(self._index[slot])
+            if row == EMPTY or self._states[row] == state:
+                return slot, row
+            slot = (slot + 1) & self._mask
+
+    def _lookup(self, states):
+        """Pool rows of an array of states, ``EMPTY`` for states without a row."""
+        states = np.asarray(states, dtype=np.int64)
+        slots = self._hash(states)
+        rows = np.full(states.shape, EMPTY, dtype=np.int64)
+        pending = np.arange(states.size)
+        flat_states, flat_slots, flat_rows = states.reshape(-1), slots.reshape(-1), rows.reshape(-1)
+        while pending.size:
+            candidates = self._index[flat_slots[pending]]
+            occupied = candidates != EMPTY
+            found = occupied & (self._states[np.where(occupied, candidates, 0)] == flat_states[pending])
+            flat_rows[pending[found]] = candidates[found]
+            pending = pending[occupied & ~found]
+            flat_slots[pending] = (flat_slots[pending] + 1) & self._mask
+        return rows
+
+    def _row(self, state):
+        """Pool row of a state, allocated with ``initial_value`` on first use."""
+        state = int(state)
+        if not 0 <= state < self.shape[0]:
+            raise IndexError(f"State {state} is out of bounds for {self.shape[0]} states")
+        slot, row = self._find(state)
+        if row != EMPTY:
+            return row
+        if self.num_rows == len(self._rows):
+            self._rows = np.concatenate([self._rows, np.empty_like(self._rows)])
+            self._states = np.concatenate([self._states, np.empty_like(self._states)])
+        row = self.num_rows
+        self._rows[row] = self.initial_value
+        self._states[row] = state
+        self._index[slot] = row
+        self.num_rows += 1
+        if 2 * self.num_rows > len(self._index):
+            self._resize_index(2 * len(self._index))
+        return row
+
+    # numpy-style access
+
+    def _state_indices(self, key):
+        if isinstance(key, slice):
+            return np.arange(*key.indices(self.shape[0]))
+        return np.asarray(key, dtype=np.int64)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            states, actions = key
+            if isinstance(states, (int, np.integer)):
+                return self[states][actions]
+            rows = self._lookup(self._state_indices(states))
+            values = self._rows[np.where(rows == EMPTY, 0, rows), actions]
+            return np.where(rows == EMPTY, self.initial_value, values)
+        if isinstance(key, (int, np.integer)):
+            _, row = self._find(int(key))
+            return self._default_row if row == EMPTY else self._rows[row]
+        rows = self._lookup(self._state_indices(key))
+        values = self._rows[np.where(rows == EMPTY, 0, rows)]
+        values[rows == EMPTY] = self.initial_value
+        return values
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            states, actions = key
+        else:
+            states, actions = key, slice(None)
+        if isinstance(states, (int, np.integer)):
+            # Allocating may replace the pool, so the row is found before self._rows is read
+            row = self._row(states)
+            self._rows[row, actions] = value
+            return
+        states = self._state_indices(states)
+        rows = np.array([self._row(state) for state in states.reshape(-1)], dtype=np.int64).reshape(states.shape)
+        self._rows[rows, actions] = value
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_dense().astype(dtype or self.dtype, copy=False)
+
+    def to_dense(self):
+        dense = np.full(self.shape, self.initial_value, dtype=self.dtype)
+        dense[self.states] = self.rows
+        return dense
+
+    def copy(self):
+        table = SparseQTable(*self.shape, initial_value=self.initial_value, capacity=max(self.num_rows, 1),
+                             dtype=self.dtype)
+        table._insert_rows(self.states, self.rows)
+        return table
+
+    def _insert_rows(self, states, rows):
+        """Adds rows of states that have no row yet."""
+        for state, values in zip(states, rows):
+            row = self._row(state)
+            self._rows[row] = values
+
+    # Reductions used by the agents, np.argmax/np.max/np.mean dispatch to them
+
+    def _check_axis(self, axis, name):
+        if axis not in (1, -1, None):
+            raise ValueError(f"SparseQTable.{name} supports axis=1 (over actions) and axis=None only")
+
+    def argmax(self, axis=None, out=None):
+        """Greedy action of every state for ``axis=1``; unvisited states choose action 0 like a constant row."""
+        self._check_axis(axis, 'argmax')
+        if axis is None:
+            return int(np.argmax(self.to_dense()))
+        greedy = np.zeros(self.shape[0], dtype=np.int64) if out is None else out
+        if out is not None:
+            greedy[:] = 0
+        greedy[self.states] = self.rows.argmax(axis=1)
+        return greedy
+
+    def max(self, axis=None, out=None, **kwargs):
+        self._check_axis(axis, 'max')
+        if axis is None:
+            values = self.rows.max() if self.num_rows else self.initial_value
+            return max(values, self.initial_value) if self.num_rows < self.shape[0] else values
+        result = np.full(self.shape[0], self.initial_value, dtype=self.dtype) if out is None else out
+        if out is not None:
+            result[:] = self.initial_value
+        result[self.states] = self.rows.max(axis=1)
+        return result
+
+    def mean(self, axis=None, dtype=None, out=None, **kwargs):
+        """Mean over all states and actions, unvisited states counting as ``initial_value``."""
+        if axis is not None:
+            raise ValueError("SparseQTable.mean supports axis=None only")
+        unvisited = (self.shape[0] - self.num_rows) * self.shape[1]
+        return (self.rows.sum(dtype=dtype) + unvisited * self.initial_value) / self.size
+
+    # Files
+
+    def save(self, path, dtype=None, metadata=None):
+        """Saves the visited rows to an ``.npz`` archive, cast to ``dtype`` and with a JSON ``metadata`` entry."""
+        np.savez(path, states=self.states, rows=self.rows.astype(dtype or self.dtype, copy=False),
+                 shape=np.array(self.shape), initial_value=np.array(self.initial_value),
+                 metadata=np.array(json.dumps(metadata or {})))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            table = cls(*archive['shape'], initial_value=archive['initial_value'].item(),
+                        capacity=max(len(archive['states']), 1), dtype=archive['rows'].dtype)
+            table._insert_rows(archive['states'], archive['rows'])
+        return table
+
+
+class FactoredQTable:
+    """Per-course action values whose sum is the value of a joint action.
+
+    ``values[s, c, l]`` is the contribution of occupancy level ``l`` of course ``c`` in state
+    ``s`` and Q(s, a) is the sum over courses of the values of the levels of ``a``. The greedy
+    action maximizes every course separately and max_a Q(s, a) is the sum of the per-course
+    maxima, so both cost O(courses x levels) instead of O(levels^courses), and the table has
+    num_states x courses x levels entries instead of num_states x levels^courses.
+
+    Indexing returns joint action values like the dense table. Writing ``q_table[s, a]``
+    spreads the change evenly over the values of the courses of ``a``, so the tabular update
+    ``q_table[s, a] = old + learning_rate * td_error`` moves Q(s, a) by the same step as in a
+    joint table.
+
+    Args:
+        num_states: Number of flat state indices.
+        action_nvec: Number of occupancy levels of every course, all equal.
+        dtype: Type of the action values.
+    """
+
+    ndim = 2
+
+    def __init__(self, num_states, action_nvec, dtype=np.float64):
+        action_nvec = tuple(int(n) for n in action_nvec)
+        if len(set(action_nvec)) != 1:
+            raise ValueError(f"Factored action values need the same number of levels for every course: {action_nvec}")
+        self.action_codec = ActionCodec(action_nvec)
+        self.num_courses = len(action_nvec)
+        self.num_levels = action_nvec[0]
+        self.shape = (int(num_states), self.action_codec.num_actions)
+        self.values = np.zeros((num_states, self.num_courses, self.num_levels), dtype=dtype)
+        self.dtype = self.values.dtype
+        # With the levels of every joint action, values[..., _courses, levels] selects its course values
+        self._courses = np.arange(self.num_courses)
+        # The same positions in a row of values flattened to num_courses * num_levels, for single lookups
+        self._flat_values = self.values.reshape(len(self.values), -1)
+        self._flat_offsets = self._courses * self.num_levels + self.action_codec.levels
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _states(self, key):
+        if isinstance(key, slice):
+            return np.arange(*key.indices(self.shape[0]))
+        return key if isinstance(key, (int, np.integer)) else np.asarray(key, dtype=np.int64)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            states, actions = self._states(key[0]), key[1]
+            if isinstance(states, (int, np.integer)) and isinstance(actions, (int, np.integer)):
+                return self._flat_values[states][self._flat_offsets[actions]].sum()
+            states, actions = np.broadcast_arrays(states, np.asarray(actions))
+            return self.values[states[..., None], self._courses, self.action_codec.levels[actions]].sum(-1)
+        states = self._states(key)
+        # Joint values of all actions, shape (..., num_actions)
+        return self.values[states][..., self._courses, self.action_codec.levels].sum(-1)
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            raise TypeError("FactoredQTable values are set for (state, action) pairs")
+        states, actions = key
+        if isinstance(states, (int, np.integer)) and isinstance(actions, (int, np.integer)):
+            row, offsets = self._flat_values[states], self._flat_offsets[actions]
+            row[offsets] += (value - row[offsets].sum()) / self.num_courses
+            return
+        delta = (np.asarray(value) - self[states, actions]) / self.num_courses
+        states, actions, delta = np.broadcast_arrays(np.asarray(states), np.asarray(actions), delta)
+        # Changes of repeated (state, action) pairs accumulate
+        np.add.at(self.values, (states[..., None], self._courses, self.action_codec.levels[actions]),
+                  delta[..., None])
+
+    def greedy(self, states):
+        """Greedy joint action of a state, or an array of them for an array of states."""
+        return self.action_codec.encode(self.values[states].argmax(axis=-1))
+
+    def max_value(self, states):
+        """max_a Q(s, a) of a state, or an array of them for an array of states."""
+        return self.values[states].max(axis=-1).sum(axis=-1)
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype or self.dtype, copy=False)
+
+    def argmax(self, axis=None, out=None):
+        if axis not in (1, -1):
+            raise ValueError("FactoredQTable.argmax supports axis=1 (over actions) only")
+        greedy = self.greedy(np.arange(self.shape[0]))
+        if out is not None:
+            out[:] = greedy
+            return out
+        return greedy
+
+    def max(self, axis=None, out=None, **kwargs):
+        per_state = self.values.max(axis=2).sum(axis=1)
+        if axis is None:
+            return per_state.max()
+        if axis not in (1, -1):
+            raise ValueError("FactoredQTable.max supports axis=1 (over actions) and axis=None only")
+        return per_state
+
+    def mean(self, axis=None, dtype=None, out=None, **kwargs):
+        """Mean joint action value: every level of a course appears in the same number of joint actions."""
+        if axis is not None:
+            raise ValueError("FactoredQTable.mean supports axis=None only")
+        return self.values.mean(axis=2, dtype=dtype).sum(axis=1).mean()
+
+    def save(self, path, dtype=None, metadata=None):
+        np.savez(path, factored_values=self.values.astype(dtype or self.dtype, copy=False),
+                 action_nvec=np.array(self.action_codec.nvec), metadata=np.array(json.dumps(metadata or {})))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            values = archive['factored_values']
+            table = cls(len(values), archive['action_nvec'], dtype=values.dtype)
+            table.values[:] = values
+        return table
+
+
+class SymmetricQTable:
+    """Q-table of canonical states and actions seen through the states and actions of the environment.
+
+    ``q_table`` has one row per canonical state of ``symmetry`` (a ``CourseSymmetry``) and
+    columns of canonical actions; it can be a dense array, a ``SparseQTable`` or a
+    ``FactoredQTable``. Reads and writes of (state, action) go to the canonical pair, so all
+    permutations of equal-size courses share their values, and greedy actions are mapped back
+    to the course order of the state.
+    """
+
+    ndim = 2
+
+    def __init__(self, q_table, symmetry):
+        self.q_table = q_table
+        self.symmetry = symmetry
+        self.shape = (symmetry.state_codec.num_states, symmetry.action_codec.num_actions)
+
+    @property
+    def dtype(self):
+        return self.q_table.dtype
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        """Bytes of the canonical Q-table and of the canonical index tables."""
+        tables = (self.symmetry.state_rows, self.symmetry.permutation_ids, self.symmetry.to_canonical,
+                  self.symmetry.from_canonical)
+        return self.q_table.nbytes + sum(table.nbytes for table in tables)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _states(self, key):
+        if isinstance(key, slice):
+            return np.arange(*key.indices(self.shape[0]))
+        return key if isinstance(key, (int, np.integer)) else np.asarray(key, dtype=np.int64)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, actions = self.symmetry.canonical(self._states(key[0]), key[1])
+            return self.q_table[rows, actions]
+        states = self._states(key)
+        rows = self.symmetry.canonical(states)
+        # Value of every action of the state: the value of its canonical action in the canonical row
+        return np.take_along_axis(np.asarray(self.q_table[np.atleast_1d(rows)]),
+                                  self.symmetry.to_canonical[np.atleast_1d(self.symmetry.permutation_ids[states])],
+                                  axis=1).reshape(np.shape(states) + (self.shape[1],))
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            raise TypeError("SymmetricQTable values are set for (state, action) pairs")
+        rows, actions = self.symmetry.canonical(self._states(key[0]), key[1])
+        self.q_table[rows, actions] = value
+
+    def greedy(self, states):
+        """Greedy action of a state, or of an array of states, in the course order of the state."""
+        actions = self.symmetry.action_of(states, greedy_actions(self.q_table, self.symmetry.canonical(states)))
+        return int(actions) if isinstance(states, (int, np.integer)) else actions
+
+    def max_value(self, states):
+        return max_values(self.q_table, self.symmetry.canonical(states))
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype or self.dtype, copy=False)
+
+    def argmax(self, axis=None, out=None):
+        if axis not in (1, -1):
+            raise ValueError("SymmetricQTable.argmax supports axis=1 (over actions) only")
+        greedy = self.greedy(np.arange(self.shape[0]))
+        if out is not None:
+            out[:] = greedy
+            return out
+        return greedy
+
+    def max(self, axis=None, out=None, **kwargs):
+        per_state = self.max_value(np.arange(self.shape[0]))
+        if axis is None:
+            return per_state.max()
+        if axis not in (1, -1):
+            raise ValueError("SymmetricQTable.max supports axis=1 (over actions) and axis=None only")
+        return per_state
+
+    def mean(self, axis=None, dtype=None, out=None, **kwargs):
+        """Mean over the canonical state-action values."""
+        if axis is not None:
+            raise ValueError("SymmetricQTable.mean supports axis=None only")
+        return np.mean(self.q_table, dtype=dtype)
+
+
+def greedy_actions(q_table, states):
+    """Greedy joint action of one state (an int) or of an array of states, for every Q-table type."""
+    if isinstance(q_table, (FactoredQTable, SymmetricQTable)):
+        return q_table.greedy(states)
+    if isinstance(states, (int, np.integer)):
+        return int(np.argmax(q_table[states]))
+    return np.argmax(q_table[states], axis=1)
+
+
+def max_values(q_table, states):
+    """max_a Q(s, a) of one state or of an array of states, for every Q-table type."""
+    if isinstance(q_table, (FactoredQTable, SymmetricQTable)):
+        return q_table.max_value(states)
+    if isinstance(states, (int, np.integer)):
+        return np.max(q_table[states])
+    return np.max(q_table[states], axis=1)
+
+
+def _additive_values(values, action_codec):
+    """Per-course values whose sums fit joint action values best (least squares), shape (states, courses, levels).
+
+    The joint actions form a full factorial design, so the fit is the mean value of every
+    course level minus the grand mean, with the grand mean split evenly over the courses.
+    """
+    num_levels = int(action_codec.nvec[0])
+    num_courses = len(action_codec.nvec)
+    one_hot = action_codec.levels[:, :, None] == np.arange(num_levels)
+    level_means = np.einsum('sa,acl->scl', values, one_hot) * num_levels / action_codec.num_actions
+    grand_means = values.mean(axis=1)[:, None, None]
+    return level_means - grand_means + grand_means / num_courses
+
+
+def _canonical_values(source, symmetry, chunk_size):
+    """Mean value of every canonical state and action over the course permutations mapping to it."""
+    sums = np.zeros((symmetry.num_canonical_states, symmetry.action_codec.num_actions))
+    num_states = symmetry.state_codec.num_states
+    for start in range(0, num_states, chunk_size):
+        states = np.arange(start, min(start + chunk_size, num_states))
+        # Column c of the row of a state holds the value of the action of the state that maps to canonical action c
+        values = np.take_along_axis(np.asarray(source[states], dtype=np.float64),
+                                    symmetry.from_canonical[symmetry.permutation_ids[states]], axis=1)
+        np.add.at(sums, symmetry.state_rows[states], values)
+    return sums / np.bincount(symmetry.state_rows, minlength=len(sums))[:, None]
+
+
+def transfer_q_values(source, target, chunk_size=TRANSFER_CHUNK_STATES):
+    """Fills a new, all-zero Q-table with the action values of another Q-table over the same spaces.
+
+    The tables can be of different types: a dense, sparse, factored or symmetric source (also
+    memory-mapped) is read ``chunk_size`` states at a time. A factored target gets the
+    per-course values that fit the joint values best and a symmetric target the mean over the
+    course permutations of every canonical state; both are exact for a source of their kind.
+    A sparse source only transfers its rows and a sparse target only allocates rows that are
+    not all zero.
+
+    Returns:
+        ``target``.
+    """
+    if tuple(source.shape) != tuple(target.shape):
+        raise ValueError(f"Cannot transfer the values of a Q-table of shape {tuple(source.shape)} "
+                         f"to one of shape {tuple(target.shape)}")
+    if isinstance(target, SymmetricQTable):
+        transfer_q_values(_canonical_values(source, target.symmetry, chunk_size), target.q_table, chunk_size)
+        return target
+    if isinstance(source, SparseQTable) and source.initial_value == 0:
+        states = source.states.copy()
+    else:
+        states = np.arange(source.shape[0])
+    for start in range(0, len(states), chunk_size):
+        chunk = states[start:start + chunk_size]
+        values = np.asarray(source[chunk], dtype=np.float64)
+        if isinstance(target, FactoredQTable):
+            target.values[chunk] = _additive_values(values, target.action_codec)
+        elif isinstance(target, SparseQTable):
+            nonzero = values.any(axis=1)
+            target[chunk[nonzero]] = values[nonzero]
+        else:
+            target[chunk] = values
+    return target
+
+
+def make_q_table(backend, num_states, num_actions, dtype=np.float64):
+    """An all-zero Q-table of the ``dense`` or ``sparse`` backend."""
+    if backend == 'dense':
+        return np.zeros((num_states, num_actions), dtype=dtype)
+    if backend == 'sparse':
+        return SparseQTable(num_states, num_actions, dtype=dtype)
+    raise ValueError(f"Unknown Q-table backend {backend!r}, expected one of {Q_TABLE_BACKENDS}")
+
+
+def config_hash(config):
+    """Short hash of a configuration dict, independent of key order."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def q_table_metadata(obs_nvec, action_nvec, alpha=None, config=None):
+    """Metadata saved with a Q-table: the spaces it was trained on, the reward weight and a config hash."""
+    return {
+        'format_version': FORMAT_VERSION,
+        'obs_nvec': [int(n) for n in obs_nvec],
+        'action_nvec': [int(n) for n in action_nvec],
+        'alpha': alpha,
+        'config_hash': config_hash(config) if config is not None else None,
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def _strip_extension(path):
+    """``path`` without a ``.npy``/``.npz`` extension; run names such as ``run_0.5`` contain dots."""
+    base, extension = os.path.splitext(path)
+    return (base, extension) if extension in ('.npy', '.npz') else (path, '')
+
+
+def _resolve(path):
+    """Path of an existing Q-table file. Without an extension ``.npy`` is tried before ``.npz``."""
+    base, extension = _strip_extension(path)
+    if not extension:
+        extension = '.npy' if os.path.exists(base + '.npy') or not os.path.exists(base + '.npz') else '.npz'
+    return base + extension
+
+
+def save_q_table(q_table, path, dtype=None, metadata=None):
+    """Saves a Q-table as ``<path>.npy`` (dense) or ``<path>.npz`` (sparse or factored).
+
+    The metadata of a dense table is written to ``<path>.json`` next to it, which keeps the
+    ``.npy`` file loadable with ``np.load(..., mmap_mode='r')``; an ``.npz`` archive stores it
+    as its ``metadata`` entry.
+
+    Args:
+        q_table: Dense array, ``SparseQTable``, ``FactoredQTable`` or ``SymmetricQTable``.
+        path: File path, with or without extension.
+        dtype: Type of the saved values, e.g. ``float16`` for archives. The table's own by default.
+        metadata: Dict from ``q_table_metadata``.
+    Returns:
+        The path of the written file.
+    """
+    path, _ = _strip_extension(path)
+    if isinstance(q_table, SymmetricQTable):
+        # Only the canonical rows are saved; the course sizes rebuild the symmetry when loading
+        symmetry = q_table.symmetry
+        metadata = dict(metadata or {'obs_nvec': list(symmetry.state_codec.nvec),
+                                     'action_nvec': list(symmetry.action_codec.nvec)})
+        metadata['course_symmetry'] = symmetry.students_per_course
+        q_table = q_table.q_table
+    if isinstance(q_table, (SparseQTable, FactoredQTable)):
+        q_table.save(path + '.npz', dtype, metadata)
+        return path + '.npz'
+    np.save(path + '.npy', np.asarray(q_table, dtype=dtype))
+    if metadata is not None:
+        with open(path + '.json', 'w') as file:
+            json.dump(metadata, file, indent=2)
+    return path + '.npy'
+
+
+def load_q_table(path, mmap_mode=None):
+    """Loads a Q-table saved with ``save_q_table``.
+
+    Args:
+        path: File path, with or without extension.
+        mmap_mode: ``'r'`` maps a dense table instead of reading it, so only the rows that are
+            accessed are read from disk. Sparse archives are always read.
+    """
+    path = _resolve(path)
+    if path.endswith('.npz'):
+        with np.load(path) as archive:
+            factored = 'factored_values' in archive.files
+        q_table = FactoredQTable.load(path) if factored else SparseQTable.load(path)
+    else:
+        q_table = np.load(path, mmap_mode=mmap_mode)
+    metadata = load_q_table_metadata(path)
+    if metadata and metadata.get('course_symmetry'):
+        symmetry = CourseSymmetry(metadata['course_symmetry'], metadata['obs_nvec'], metadata['action_nvec'])
+        q_table = SymmetricQTable(q_table, symmetry)
+    return q_table
+
+
+def load_q_table_metadata(path):
+    """Metadata saved with a Q-table, ``None`` for files saved without it."""
+    path = _resolve(path)
+    if path.endswith('.npz'):
+        with np.load(path) as archive:
+            if 'metadata' not in archive.files:
+                return None
+            return json.loads(archive['metadata'].item()) or None
+    metadata_path = _strip_extension(path)[0] + '.json'
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as file:
+        return json.load(file)
+
+
+def check_q_table_metadata(metadata, obs_nvec, action_nvec):
+    """Raises ``ValueError`` when a Q-table was trained on other observation or action spaces."""
+    if metadata is None:
+        return
+    expected = {'obs_nvec': [int(n) for n in obs_nvec], 'action_nvec': [int(n) for n in action_nvec]}
+    for key, value in expected.items():
+        if metadata.get(key) != value:
+            raise ValueError(f"Q-table was saved with {key} {metadata.get(key)}, the environment has {value}")
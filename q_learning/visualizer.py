@@ -12,10 +12,11 @@ import seaborn as sns
 from collections import defaultdict
 from itertools import combinations
 import matplotlib.patches as mpatches
+from .q_table import SparseQTable
 
 
 def visualize_all_states(q_table, all_states, states, run_name, max_episodes, alpha, results_subdirectory,
-                         students_per_course):
+                         students_per_course, action_codec):
     method_name = "viz all states"
     # print("students_per_course:", students_per_course)
     # print("states:", states)
@@ -31,14 +32,14 @@ def visualize_all_states(q_table, all_states, states, run_name, max_episodes, al
     fig, axes = plt.subplots(1, num_courses, figsize=(5 * num_courses, 5), squeeze=False)
     fig.suptitle(f'{run_name})', fontsize=16)
 
+    # ``states`` are in ``all_states`` order, so the position of a state is its Q-table row
+    greedy_levels = action_codec.decode(np.argmax(q_table, axis=1)[:len(states)])
+
     for course in range(num_courses):
         actions = {}
-        for state in states:
-            state_idx = all_states.index(str(state))
-            action = np.argmax(q_table[state_idx])
-
-            # Extract course-specific action
-            course_action = action % 3
+        for state_idx, state in enumerate(states):
+            # Occupancy level of this course in the greedy joint action
+            course_action = int(greedy_levels[state_idx, course])
 
             # Key: (infected for this course, community risk)
             infected = state[course]
@@ -68,7 +69,7 @@ def visualize_all_states(q_table, all_states, states, run_name, max_episodes, al
         ax.set_xlim(-0.05, 1.05)
 
     # Create a custom legend
-    legend_elements = [mpatches.Patch(facecolor=colors[i], label=f'Allow {i * 50}%') for i in range(3)]
+    legend_elements = [mpatches.Patch(facecolor=colors[i], label=f'Allow {i * action_codec.percentage}%') for i in range(3)]
     fig.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.05),
                ncol=3, fontsize='large')
 
@@ -177,12 +178,20 @@ def visualize_all_states(q_table, all_states, states, run_name, max_episodes, al
 #     return file_paths
 
 def visualize_q_table(q_table, results_subdirectory, episode):
+    """Heatmap of a dense Q-table, or of the visited rows of a sparse one. Other types are not plotted."""
+    # np.asarray of a sparse, factored or symmetric table builds the dense table, 10^6 x 243 with five courses
+    if isinstance(q_table, SparseQTable):
+        values, states_label = q_table.rows, 'Visited states'
+    elif isinstance(q_table, np.ndarray):
+        values, states_label = q_table, 'States'
+    else:
+        return
     method_name = "viz q table"
     plt.figure(figsize=(10, 10))
-    sns.heatmap(q_table, cmap="YlGnBu", annot=False, fmt=".2f")
+    sns.heatmap(values, cmap="YlGnBu", annot=False, fmt=".2f")
     plt.title(f'Q-Table at Episode {episode} - {method_name}')
     plt.xlabel('Actions')
-    plt.ylabel('States')
+    plt.ylabel(states_label)
     file_path = f"{results_subdirectory}/qtable-{method_name}-{episode}.png"
     plt.savefig(file_path)
     plt.close()
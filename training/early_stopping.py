@@ -0,0 +1,176 @@
+"""Convergence-based early stopping of the training loops.
+
+After every episode a loop passes its return, its mean TD error (or loss) and,
+every ``check_interval`` episodes, the greedy action of a fixed set of states to
+``EarlyStopping.update``. At every check the enabled criteria are evaluated:
+
+- ``return``: the moving average of the returns over ``window`` episodes changed by less
+  than ``return_tolerance`` (relative) since the previous check,
+- ``td_error``: the moving average of the TD errors changed by less than
+  ``td_error_tolerance`` (relative), i.e. it reached a plateau,
+- ``policy``: less than ``policy_tolerance`` of the states changed their greedy action
+  since the previous check (states marked -1 are skipped).
+
+Training stops when all of them held at every check for ``patience`` episodes and at least
+``min_episodes`` episodes ran; ``stop_episode`` records the last episode. Given an Optuna
+trial, the moving average is reported at every check and ``optuna.TrialPruned`` is raised
+when the pruner stops the trial, whether or not early stopping is enabled.
+
+Returns are the average weekly reward of an episode in both agents, so moving averages,
+``get_final_performance`` and the values reported to Optuna do not depend on the episode length
+or the agent.
+
+Example:
+    stopper = EarlyStopping.from_config(agent_config['agent'].get('early_stopping'), trial)
+    for episode in range(max_episodes):
+        ...
+        if stopper.update(episode, episode_return, td_error, lambda: greedy_actions(q_table, states)):
+            break
+    stopper.save(results_subdirectory, 'train')
+"""
+import json
+import os
+import numpy as np
+
+CRITERIA = ('return', 'td_error', 'policy')
+DEFAULTS = {
+    'enabled': False,
+    'criteria': list(CRITERIA),
+    'window': 100,
+    'check_interval': 10,
+    'patience': 200,
+    'min_episodes': 500,
+    'return_tolerance': 0.01,
+    'td_error_tolerance': 0.01,
+    'policy_tolerance': 0.01,
+}
+
+
+def relative_change(previous, current):
+    return abs(current - previous) / max(abs(previous), 1e-8)
+
+
+class EarlyStopping:
+    """Stops training when the returns, TD errors and greedy policy stopped changing.
+
+    Args:
+        enabled: Stop training. A disabled stopper only reports to ``trial``.
+        criteria: Names of the ``CRITERIA`` that must hold.
+        window: Episodes of the moving averages.
+        check_interval: Episodes between checks; the greedy policy is computed only at checks.
+        patience: Episodes the criteria must hold before training stops.
+        min_episodes: Episodes trained before stopping is considered.
+        return_tolerance, td_error_tolerance, policy_tolerance: Thresholds of the criteria.
+        trial: Optuna trial of the run, reported to and pruned at every check.
+    """
+
+    def __init__(self, enabled=False, criteria=CRITERIA, window=100, check_interval=10, patience=200,
+                 min_episodes=500, return_tolerance=0.01, td_error_tolerance=0.01, policy_tolerance=0.01, trial=None):
+        unknown = set(criteria) - set(CRITERIA)
+        if unknown:
+            raise ValueError(f"Unknown early stopping criteria {sorted(unknown)}, expected some of {CRITERIA}")
+        self.enabled = enabled
+        self.criteria = list(criteria)
+        self.window = window
+        self.check_interval = check_interval
+        self.patience = patience
+        self.min_episodes = min_episodes
+        self.tolerances = {'return': return_tolerance, 'td_error': td_error_tolerance, 'policy': policy_tolerance}
+        self.trial = trial
+
+        self.returns = []
+        self.td_errors = []
+        self.checks = []
+        self.stop_episode = None
+        self._previous = {}
+        self._previous_policy = None
+        self._held_since = None
+
+    @classmethod
+    def from_config(cls, config=None, trial=None):
+        """Stopper of an ``early_stopping`` section of an agent config, disabled when it is missing."""
+        return cls(**dict(DEFAULTS, **(config or {})), trial=trial)
+
+    @property
+    def active(self):
+        return self.enabled or self.trial is not None
+
+    def moving_average(self):
+        """Mean return of the last ``window`` episodes."""
+        return float(np.mean(self.returns[-self.window:])) if self.returns else float('nan')
+
+    def update(self, episode, episode_return, td_error=None, greedy_policy=None):
+        """Records an episode and evaluates the criteria every ``check_interval`` episodes.
+
+        Args:
+            episode: Index of the finished episode.
+            episode_return: Its return as the average weekly reward, the total reward divided by
+                the weeks of the episode.
+            td_error: Its mean absolute TD error or loss, ``None`` when unknown.
+            greedy_policy: Callable returning the greedy action of every tracked state, -1 for
+                states to skip. Called at checks only.
+        Returns:
+            True when training should stop after this episode.
+        """
+        # Returns are kept when inactive too, for the final performance of the run
+        self.returns.append(episode_return)
+        if not self.active:
+            return False
+        if td_error is not None:
+            self.td_errors.append(td_error)
+        if len(self.returns) < self.window or (episode + 1) % self.check_interval:
+            return False
+
+        moving_average = self.moving_average()
+        if self.trial is not None:
+            import optuna
+            self.trial.report(moving_average, episode)
+            if self.trial.should_prune():
+                raise optuna.TrialPruned(f"Pruned at episode {episode} with moving average {moving_average:.3f}")
+        if not self.enabled:
+            return False
+
+        values = {'return': moving_average}
+        if self.td_errors:
+            values['td_error'] = float(np.mean(self.td_errors[-self.window:]))
+        changes = {name: relative_change(self._previous[name], value)
+                   for name, value in values.items() if name in self._previous}
+        self._previous = values
+        if 'policy' in self.criteria and greedy_policy is not None:
+            policy = np.asarray(greedy_policy())
+            if self._previous_policy is not None:
+                tracked = (policy >= 0) & (self._previous_policy >= 0)
+                changes['policy'] = float(np.mean(policy[tracked] != self._previous_policy[tracked])) \
+                    if tracked.any() else 1.0
+            self._previous_policy = policy
+
+        held = all(name in changes and changes[name] <= self.tolerances[name] for name in self.criteria)
+        if not held:
+            self._held_since = None
+        elif self._held_since is None:
+            self._held_since = episode
+        self.checks.append({'episode': episode, 'held': held, **values,
+                            **{f'{name}_change': change for name, change in changes.items()}})
+
+        if held and episode - self._held_since + self.check_interval >= self.patience \
+                and episode + 1 >= self.min_episodes:
+            self.stop_episode = episode
+            return True
+        return False
+
+    def metrics(self, prefix='early_stopping/'):
+        """Values and changes of the last check, keyed for ``wandb.log``."""
+        if not self.checks:
+            return {}
+        return {f'{prefix}{key}': value for key, value in self.checks[-1].items() if key != 'episode'}
+
+    def summary(self):
+        return {'enabled': self.enabled, 'criteria': self.criteria, 'stop_episode': self.stop_episode,
+                'episodes': len(self.returns), 'moving_average': self.moving_average(), 'checks': self.checks}
+
+    def save(self, directory, loop_name):
+        """Writes ``early_stopping_<loop_name>.json`` when early stopping is enabled."""
+        if not self.enabled:
+            return
+        with open(os.path.join(directory, f'early_stopping_{loop_name}.json'), 'w') as file:
+            json.dump(self.summary(), file, indent=2)
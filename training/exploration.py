@@ -0,0 +1,146 @@
+"""Exploration rate schedules of the training loops.
+
+``ExplorationRateDecay`` implements the 20 decay functions selected by ``e_decay_function``
+in the agent configs. The schedule of a function is computed for all episodes when it is
+first used, so looking up the rate of an episode is an array index.
+
+Function 14 (sine squared) of the tabular agent has always left the sine unsquared;
+``squared_sine=False`` keeps that schedule so trained Q-tables stay reproducible.
+
+Example:
+    decay = ExplorationRateDecay(max_episodes, min_exploration_rate, exploration_rate, squared_sine=False)
+    decay.set_decay_function(agent_config['agent']['e_decay_function'])
+    exploration_rate = decay.get_exploration_rate(episode)
+
+``python main.py schedules`` saves and plots the schedules of an agent config.
+"""
+import numpy as np
+
+
+class ExplorationRateDecay:
+    """Exploration rate of every episode under the decay functions of ``e_decay_function``.
+
+    The schedule of a decay function is computed for all episodes when the function is first
+    selected, as one NumPy expression over ``np.arange(max_episodes + 1)`` (the harmonic
+    numbers of function 18 with a cumulative sum), so ``get_exploration_rate`` is an array
+    lookup. Episodes past the schedule are computed on demand.
+
+    Args:
+        max_episodes: Episodes of the schedules.
+        min_exploration_rate: Final rate of the schedules that approach a minimum.
+        initial_exploration_rate: Rate of episode 0.
+        squared_sine: Square the sine of function 14 (sine squared), False for the legacy
+            unsquared schedule of the tabular agent.
+    """
+
+    DECAY_FUNCTIONS = {
+        1: 'Exponential', 2: 'Linear', 3: 'Polynomial', 4: 'Inverse Time', 5: 'Sine Wave', 6: 'Logarithmic',
+        7: 'Hyperbolic Tangent', 8: 'Square Root', 9: 'Stepwise', 10: 'Inverse Square Root', 11: 'Sigmoid',
+        12: 'Quadratic', 13: 'Cubic', 14: 'Sine Squared', 15: 'Cosine Squared', 16: 'Double Exponential',
+        17: 'Log-Logistic', 18: 'Harmonic Series', 19: 'Piecewise Linear', 20: 'Custom Polynomial',
+    }
+
+    def __init__(self, max_episodes, min_exploration_rate, initial_exploration_rate, squared_sine=True):
+        self.max_episodes = max_episodes
+        self.min_exploration_rate = min_exploration_rate
+        self.initial_exploration_rate = initial_exploration_rate
+        self.squared_sine = squared_sine
+        self.current_decay_function = 1  # Variable to switch between different decay functions
+        self.schedules = {}  # Exploration rate of every episode per decay function
+
+    def set_decay_function(self, decay_function_number):
+        self.current_decay_function = decay_function_number
+
+    def rates(self, decay_function_number, episodes):
+        """Exploration rates of decay function ``decay_function_number`` for an array of episodes."""
+        episodes = np.asarray(episodes)
+        initial, minimum, max_episodes = self.initial_exploration_rate, self.min_exploration_rate, self.max_episodes
+        progress = episodes / max_episodes
+        if decay_function_number == 1:  # Exponential Decay
+            return initial * np.exp(-progress)
+        elif decay_function_number == 2:  # Linear Decay
+            return initial - (initial - minimum) * progress
+        elif decay_function_number == 3:  # Polynomial Decay
+            return initial * (1 - progress) ** 2
+        elif decay_function_number == 4:  # Inverse Time Decay
+            return initial / (1 + episodes)
+        elif decay_function_number == 5:  # Sine Wave Decay
+            return minimum + 0.5 * (initial - minimum) * (1 + np.sin(np.pi * progress))
+        elif decay_function_number == 6:  # Logarithmic Decay
+            return initial - (initial - minimum) * np.log(episodes + 1) / np.log(max_episodes + 1)
+        elif decay_function_number == 7:  # Hyperbolic Tangent Decay
+            return minimum + 0.5 * (initial - minimum) * (1 - np.tanh(progress))
+        elif decay_function_number == 8:  # Square Root Decay
+            return initial * (1 - np.sqrt(progress))
+        elif decay_function_number == 9:  # Stepwise Decay
+            steps = 10
+            step_size = (initial - minimum) / steps
+            return initial - (episodes // (max_episodes // steps)) * step_size
+        elif decay_function_number == 10:  # Inverse Square Root Decay
+            return initial / np.sqrt(episodes + 1)
+        elif decay_function_number == 11:  # Sigmoid Decay
+            midpoint = max_episodes / 2
+            smoothness = max_episodes / 10  # Adjust this divisor to change smoothness
+            return minimum + (initial - minimum) / (1 + np.exp((episodes - midpoint) / smoothness))
+        elif decay_function_number == 12:  # Quadratic Decay
+            return initial * (1 - progress ** 2)
+        elif decay_function_number == 13:  # Cubic Decay
+            return initial * (1 - progress ** 3)
+        elif decay_function_number == 14:  # Sine Squared Decay
+            sine = np.sin(np.pi * progress)
+            return minimum + (initial - minimum) * (sine ** 2 if self.squared_sine else sine)
+        elif decay_function_number == 15:  # Cosine Squared Decay
+            return minimum + (initial - minimum) * np.cos(np.pi * progress) ** 2
+        elif decay_function_number == 16:  # Double Exponential Decay
+            return initial * np.exp(-np.exp(progress))
+        elif decay_function_number == 17:  # Log-Logistic Decay
+            return minimum + (initial - minimum) / (1 + np.log(episodes + 1))
+        elif decay_function_number == 18:  # Harmonic Series Decay
+            # Harmonic number H(episode + 1) of every episode from one cumulative sum
+            harmonic = np.cumsum(1 / np.arange(1, episodes.max(initial=0) + 2))
+            return minimum + (initial - minimum) / (1 + harmonic[episodes])
+        elif decay_function_number == 19:  # Piecewise Linear Decay
+            return np.where(episodes < max_episodes / 2, initial - (initial - minimum) * (2 * progress), minimum)
+        elif decay_function_number == 20:  # Custom Polynomial Decay
+            p = 3  # Change the power for different polynomial behaviors
+            return initial * (1 - progress ** p)
+        else:
+            raise ValueError("Invalid decay function number")
+
+    def schedule(self, decay_function_number=None):
+        """Exploration rate of episodes 0 .. max_episodes of a decay function, the current one by default."""
+        number = self.current_decay_function if decay_function_number is None else decay_function_number
+        if number not in self.schedules:
+            self.schedules[number] = self.rates(number, np.arange(self.max_episodes + 1))
+        return self.schedules[number]
+
+    def get_exploration_rate(self, episode):
+        schedule = self.schedule()
+        if episode < len(schedule):
+            return schedule[episode]
+        return self.rates(self.current_decay_function, np.array([episode]))[0]
+
+    def save_schedules(self, path, decay_functions=None):
+        """Writes the schedules of ``decay_functions`` (all by default) to a CSV file, one column per function."""
+        decay_functions = decay_functions or list(self.DECAY_FUNCTIONS)
+        columns = np.column_stack([np.arange(self.max_episodes + 1)] + [self.schedule(number)
+                                                                         for number in decay_functions])
+        header = ','.join(['episode'] + [f'{number} {self.DECAY_FUNCTIONS[number]}' for number in decay_functions])
+        np.savetxt(path, columns, delimiter=',', header=header, comments='',
+                   fmt=['%d'] + ['%.10g'] * len(decay_functions))
+
+    def plot_schedules(self, path, decay_functions=None):
+        """Plots the schedules of ``decay_functions`` (all by default) on one figure saved to ``path``."""
+        import matplotlib.pyplot as plt
+        decay_functions = decay_functions or list(self.DECAY_FUNCTIONS)
+        fig, ax = plt.subplots(figsize=(10, 6))
+        for number in decay_functions:
+            ax.plot(self.schedule(number), label=f'{number} {self.DECAY_FUNCTIONS[number]}', linewidth=1)
+        ax.set_xlabel('Episode')
+        ax.set_ylabel('Exploration Rate')
+        ax.set_title('Exploration Rate Schedules')
+        ax.legend(fontsize='small', ncol=2)
+        fig.tight_layout()
+        fig.savefig(path)
+        plt.close(fig)
+        return path